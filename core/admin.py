@@ -4,7 +4,7 @@ from django.contrib.contenttypes.admin import GenericTabularInline
 from store.admin import ProductAdmin, ProductImageInline
 from store.models import Product
 from tags.models import TaggedItem
-from .models import User
+from .models import Task, User
 
 
 class TagInline(GenericTabularInline):
@@ -28,6 +28,13 @@ class UserAdmin(BaseUserAdmin):
     )
     pass
 
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'locked_by']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at']
+    ordering = ['-id']
+
 admin.site.unregister(Product)  #removing old model from admin site
 admin.site.register(Product, CustomProductAdmin)
 admin.site.register(User, UserAdmin)
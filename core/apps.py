@@ -6,4 +6,5 @@ class CoreConfig(AppConfig):
     name = 'core'
     
     def ready(self) -> None:
+        import core.db  # connects the SQLite PRAGMA hook
         import core.signals.handelers
@@ -0,0 +1,203 @@
+'''
+Customer id and staff flag as custom JWT claims.
+
+Access tokens issued by the djoser JWT endpoints carry `customer_id` and
+`is_staff`, so request handlers can read them with `get_customer_id` and
+`is_staff` without a query (for staff, the user is still loaded to check
+that they are active staff). Requests authenticated some other way (or
+with a token issued before the claims existed) fall back to a cached
+lookup.
+
+`StatelessJWTAuthentication` goes one step further and doesn't load the
+user at all until a view needs more than the claims.
+'''
+import copy
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from store.models import Customer
+
+CUSTOMER_ID_CLAIM = 'customer_id'
+IS_STAFF_CLAIM = 'is_staff'
+
+# a user's customer row never changes, only disappears with the user
+CUSTOMER_ID_TIMEOUT = 24 * 60 * 60
+
+
+def _customer_id_key(user_id):
+    return f'core:customer_id:{user_id}'
+
+
+def customer_id_for_user(user_id):
+    key = _customer_id_key(user_id)
+    customer_id = cache.get(key)
+    if customer_id is None:
+        # by pk: first() would otherwise sort by Customer's ordering, a join with the user table
+        customer_id = Customer.objects.filter(user_id=user_id).order_by('pk').values_list('id', flat=True).first()
+        if customer_id is not None:
+            cache.set(key, customer_id, CUSTOMER_ID_TIMEOUT)
+    return customer_id
+
+
+def forget_customer_id(user_id):
+    cache.delete(_customer_id_key(user_id))
+
+
+def get_claim(request, claim):
+    token = getattr(request, 'auth', None)
+    if token is None or not hasattr(token, 'payload'):
+        return None
+    return token.payload.get(claim)
+
+
+def get_customer_id(request):
+    '''
+    The customer id of the authenticated user, None for anonymous users.
+    '''
+    customer_id = get_claim(request, CUSTOMER_ID_CLAIM)
+    if customer_id is not None:
+        return customer_id
+    if not hasattr(request, '_customer_id'):
+        user_id = request.user.id
+        request._customer_id = customer_id_for_user(user_id) if user_id else None
+    return request._customer_id
+
+
+def is_staff(request):
+    # only a negative claim is trusted without the user, see TokenBackedUser.is_staff
+    if get_claim(request, IS_STAFF_CLAIM) is False:
+        return False
+    return request.user.is_staff
+
+
+class ClaimsRefreshToken(RefreshToken):
+    '''
+    Adds the claims to every access token made from it. They are put on
+    the access token only, so a refreshed access token gets current values
+    instead of copies of what the refresh token was issued with.
+    '''
+    _user = None
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token._user = user
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        user = self._user or get_user_model().objects.get(
+            **{api_settings.USER_ID_FIELD: self[api_settings.USER_ID_CLAIM]}
+        )
+        access[CUSTOMER_ID_CLAIM] = customer_id_for_user(user.pk)
+        access[IS_STAFF_CLAIM] = user.is_staff
+        return access
+
+
+# ------------------------------ stateless authentication
+
+class _UserCache:
+    '''
+    Users loaded by this process, kept for a few seconds. Per process on
+    purpose: the point is to skip a round trip to any shared store.
+    '''
+    max_size = 1024
+
+    def __init__(self):
+        self._users = {}
+        self._lock = threading.Lock()
+
+    # keyed by str(id): tokens carry the id as a string, signals give ints
+    def get(self, user_id):
+        entry = self._users.get(str(user_id))
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        # a copy, so a view changing its request.user can't change anyone else's
+        return copy.copy(entry[1])
+
+    def set(self, user_id, user, timeout):
+        with self._lock:
+            if len(self._users) >= self.max_size:
+                self._users.clear()
+            self._users[str(user_id)] = (time.monotonic() + timeout, copy.copy(user))
+
+    def delete(self, user_id):
+        with self._lock:
+            self._users.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = _UserCache()
+
+
+def load_user(user_id):
+    user = user_cache.get(user_id)
+    if user is None:
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        user_cache.set(user_id, user, getattr(settings, 'JWT_USER_CACHE_TIMEOUT', 30))
+
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    return user
+
+
+class TokenBackedUser(SimpleLazyObject):
+    '''
+    Stands in for the user of a validated token. `id`, `pk`, a false
+    `is_staff` and the authentication flags come from the token; anything
+    else loads the real user (see `load_user`) and is answered by it,
+    writes included.
+    '''
+    is_authenticated = True
+    is_anonymous = False
+
+    # `request.user and ...` in permission classes would load the user otherwise
+    def __bool__(self):
+        return True
+
+    def __init__(self, token):
+        self.__dict__['token'] = token
+        super().__init__(lambda: load_user(token[api_settings.USER_ID_CLAIM]))
+
+    @property
+    def id(self):
+        # the claim is a string, request.user.id is compared with integer ids
+        return get_user_model()._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    pk = id
+
+    @property
+    def is_staff(self):
+        # "not staff" grants nothing and is taken from the token. "Staff" is checked against
+        # the loaded user, so a demoted or deactivated admin loses access right away
+        if self._wrapped is empty and self.token.get(IS_STAFF_CLAIM) is False:
+            return False
+        return self.__getattr__('is_staff')
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    '''
+    Like JWTAuthentication without the per request user query. A user
+    deactivated or deleted after the token was issued is only rejected
+    once the view loads the user.
+    '''
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        return TokenBackedUser(validated_token)
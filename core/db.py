@@ -0,0 +1,153 @@
+'''
+Database connection setup and read/write routing.
+
+Every new SQLite connection gets the `SQLITE_PRAGMAS` from the settings
+(WAL, so checkout writes no longer block catalog reads, plus a busy
+timeout and mmap). Replicas only get the ones that don't write to the
+database file, and are made read only. `PrimaryReplicaRouter` sends
+reads of catalog models to the `DATABASE_REPLICAS` aliases and
+everything else to the primary (`default`). Once a request wrote
+something, or when it is not a GET, all of its reads go to the primary
+as well, so it always sees its own writes (`PrimaryPinMiddleware`).
+'''
+import random
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# read mostly and fine to serve slightly stale, everything else (carts, orders, users) stays on the primary
+CATALOG_MODELS = {
+    'store.collection',
+    'store.product',
+    'store.productimage',
+    'store.review',
+    'tags.tag',
+    'tags.taggeditem',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# change the database file (or its header) rather than the connection, not for replicas
+WRITE_PRAGMAS = {'journal_mode', 'synchronous', 'auto_vacuum', 'page_size'}
+
+# INSERT ... , UPDATE ... , WITH ... INSERT ... and so on
+WRITE_STATEMENT = re.compile(r'^\s*(?:WITH\b.*?)?\b(?:INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE | re.DOTALL)
+
+_use_primary = ContextVar('use_primary', default=False)
+
+
+# ------------------------------ connection setup
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if connection.alias in getattr(settings, 'DATABASE_REPLICAS', []):
+        # a replica belongs to whatever keeps it in sync, this process only reads it
+        pragmas = {name: value for name, value in pragmas.items() if name not in WRITE_PRAGMAS}
+        pragmas['query_only'] = 'ON'
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+# ------------------------------ routing
+
+def get_replicas():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if alias in connections]
+
+
+def pin_to_primary():
+    '''
+    Sends the remaining reads of the current request (or thread, outside
+    of requests) to the primary.
+    '''
+    _use_primary.set(True)
+
+
+@contextmanager
+def use_primary():
+    # pins for the block only
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def unpin():
+    # for long running processes, between units of work
+    _use_primary.set(False)
+
+
+def is_pinned():
+    return _use_primary.get()
+
+
+def _pin_on_write(execute, sql, params, many, context):
+    # a connection.execute_wrapper
+    if not is_pinned() and WRITE_STATEMENT.match(sql):
+        pin_to_primary()
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def pin_after_writes(using=DEFAULT_DB_ALIAS):
+    '''
+    Pins the current request (or thread) to the primary as soon as it
+    runs a write on `using`.
+    '''
+    with connections[using].execute_wrapper(_pin_on_write):
+        yield
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in CATALOG_MODELS or is_pinned():
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects come from where the instance came from
+            return instance._state.db
+        # a transaction on the primary has to see its own reads and writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas are copies of the primary, so objects from any of them may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the schema by replicating the primary
+        if db in getattr(settings, 'DATABASE_REPLICAS', []):
+            return False
+        return None
+
+
+class PrimaryPinMiddleware:
+    '''
+    Starts every request unpinned, except for requests that are going to
+    write anyway (POST, PATCH, checkout ...): those read from the primary
+    from the start. The others are pinned by their first write.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _use_primary.set(request.method not in SAFE_METHODS)
+        try:
+            with pin_after_writes():
+                return self.get_response(request)
+        finally:
+            _use_primary.reset(token)
@@ -0,0 +1,171 @@
+'''
+Per-request query counts and timings.
+
+`RequestMetricsMiddleware` counts the queries of every request and times
+them (on every database connection, through `execute_wrapper`), along
+with the serializers (`TimedSerializerMixin`), the view and the whole
+request. The numbers are kept on `request.metrics`. With
+`REQUEST_TIMING_HEADERS` on they are also sent back as `Server-Timing` and
+`X-Query-Count` headers. Requests over their budget are logged.
+
+Budgets come from `REQUEST_BUDGETS` in the settings. A view can set its
+own query budgets per action:
+
+    class ProductViewSet(ModelViewSet):
+        query_budgets = {'list': 6, 'retrieve': 4}
+
+The tests hold the views to those budgets too, and check that their query
+counts don't grow with the data (store/tests/test_instrumentation.py).
+'''
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+# the Server-Timing metrics, in order
+TIMINGS = ['db', 'serializer', 'view', 'total']
+
+_metrics = ContextVar('request_metrics', default=None)
+
+
+def get_budgets():
+    return settings.REQUEST_BUDGETS
+
+
+def get_query_budget(view_class, action):
+    '''
+    The most queries a request to `action` of `view_class` should run:
+    its `query_budgets` entry, or the QUERIES budget of the settings.
+    '''
+    budgets = getattr(view_class, 'query_budgets', {})
+    return budgets.get(action, get_budgets()['QUERIES'])
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = dict.fromkeys(TIMINGS, 0.0)
+        self.view_name = None
+        self.query_budget = get_budgets()['QUERIES']
+        self._running = set()
+        self._view_start = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # a connection.execute_wrapper
+        self.queries += 1
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds['db'] += time.perf_counter() - start
+
+    def milliseconds(self, name):
+        return self.seconds[name] * 1000
+
+    def over_budget(self):
+        # what exceeded its budget, as messages
+        budgets = get_budgets()
+        messages = []
+        if self.queries > self.query_budget:
+            messages.append(f'{self.queries} queries > {self.query_budget}')
+        if self.milliseconds('db') > budgets['DB_MS']:
+            messages.append(f"{self.milliseconds('db'):.0f} ms in the database > {budgets['DB_MS']}")
+        if self.milliseconds('total') > budgets['TOTAL_MS']:
+            messages.append(f"{self.milliseconds('total'):.0f} ms in total > {budgets['TOTAL_MS']}")
+        return messages
+
+    def server_timing(self):
+        return ', '.join(
+            f'{name};dur={self.milliseconds(name):.1f}' + (f';desc="{self.queries} queries"' if name == 'db' else '')
+            for name in TIMINGS
+        )
+
+
+def get_metrics():
+    # the metrics of the current request, None outside of requests
+    return _metrics.get()
+
+
+@contextmanager
+def timed(name):
+    '''
+    Adds the time spent in the block to the current request's `name`
+    timing. Nested blocks of the same name are counted once.
+    '''
+    metrics = _metrics.get()
+    if metrics is None or name in metrics._running:
+        yield
+        return
+    metrics._running.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._running.discard(name)
+        metrics.seconds[name] += time.perf_counter() - start
+
+
+class TimedSerializerMixin:
+    # validating and representing data is the request's "serializer" time
+    def run_validation(self, *args, **kwargs):
+        with timed('serializer'):
+            return super().run_validation(*args, **kwargs)
+
+    def to_representation(self, *args, **kwargs):
+        with timed('serializer'):
+            return super().to_representation(*args, **kwargs)
+
+
+class RequestMetricsMiddleware:
+    '''
+    Goes first, so the queries of the other middleware (sessions,
+    authentication) are counted as well. Streamed responses are measured
+    up to their first byte.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        metrics.seconds['total'] = time.perf_counter() - start
+        if metrics._view_start is not None:
+            metrics.seconds['view'] = time.perf_counter() - metrics._view_start
+
+        over_budget = metrics.over_budget()
+        if over_budget:
+            logger.warning(
+                'Request over budget: %s %s (%s): %s',
+                request.method, request.path, metrics.view_name or 'no view', ', '.join(over_budget),
+            )
+        if getattr(settings, 'REQUEST_TIMING_HEADERS', False):
+            response['Server-Timing'] = metrics.server_timing()
+            response[QUERY_COUNT_HEADER] = str(metrics.queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = request.metrics
+        # DRF's viewsets keep the class and the method -> action mapping on the view function
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is not None:
+            action = getattr(view_func, 'actions', {}).get(request.method.lower(), request.method.lower())
+            metrics.view_name = f'{view_class.__name__}.{action}'
+            metrics.query_budget = get_query_budget(view_class, action)
+        else:
+            metrics.view_name = getattr(view_func, '__name__', None)
+        metrics._view_start = time.perf_counter()
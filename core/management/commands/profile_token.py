@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = 'Prints a token that profiles requests of a staff user (core.profiling).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--path', default='/store/', help='Only requests under this path are profiled.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{User.USERNAME_FIELD: options['username']})
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}.")
+        if not (user.is_staff and user.is_active):
+            raise CommandError('Only active staff users can profile requests.')
+
+        self.stdout.write(profiling.make_token(user, options['path']))
+        self.stderr.write(
+            f"Send it as a {profiling.TOKEN_HEADER} header or ?{profiling.TOKEN_PARAMETER}=..., "
+            f"valid for {profiling.get_setting('TOKEN_MAX_AGE')} seconds."
+        )
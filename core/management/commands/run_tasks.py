@@ -0,0 +1,90 @@
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from django.core.management.base import BaseCommand
+from core import taskprocess, tasks
+
+logger = logging.getLogger(__name__)
+
+
+def succeeded(future):
+    try:
+        return future.result()
+    except Exception:
+        # the outcome could not be recorded (database locked ...), the task's lease runs out and it is claimed again
+        logger.exception('Could not record the outcome of a task')
+        return False
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background tasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Tasks run at the same time.')
+        parser.add_argument('--processes', action='store_true',
+                            help='Run tasks in a process pool instead of threads, for CPU bound work.')
+        parser.add_argument('--batch-size', type=int, default=tasks.get_setting('BATCH_SIZE'))
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Run what is due now and exit.')
+
+    def handle(self, *args, **options):
+        worker_id = tasks.new_worker_id()
+        workers = max(options['workers'], 1)
+        # never claim more than the pool can start on, the rest would just sit on a lease
+        batch_size = min(options['batch_size'], workers)
+
+        if options['processes']:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=taskprocess.setup,
+                initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+            )
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        # restored afterwards, the command may run inside another process (call_command, tests)
+        previous_handlers = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            done = failed = 0
+            running = set()
+            with pool:
+                while not stopping:
+                    free = workers - len(running)
+                    claimed = tasks.claim(worker_id, min(batch_size, free)) if free else []
+                    for task in claimed:
+                        running.add(pool.submit(taskprocess.run, task.id, worker_id))
+
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    finished, running = wait(running, timeout=options['poll_interval'], return_when='FIRST_COMPLETED')
+                    for future in finished:
+                        if succeeded(future):
+                            done += 1
+                        else:
+                            failed += 1
+
+                # let running tasks finish, their leases would otherwise have to expire first
+                for future in wait(running).done:
+                    if succeeded(future):
+                        done += 1
+                    else:
+                        failed += 1
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        self.stdout.write(self.style.SUCCESS(f'{done} tasks done, {failed} failed.'))
@@ -0,0 +1,216 @@
+'''
+Profiles of single requests, on demand.
+
+A staff member gets a signed token for a path prefix:
+
+    python manage.py profile_token <username> --path /store/product/
+
+and sends it with the slow request, as an `X-Profile-Token` header or a
+`profile` query parameter. `RequestProfilerMiddleware` then samples the
+request's stack every `INTERVAL_MS` (a thread reading the request thread's
+frames, so the request itself runs at full speed) and records its SQL. Two
+files are written to `DIRECTORY`, named after the `X-Profile-Id` response
+header:
+
+- `<id>.collapsed`: one "frame;frame;frame count" line per distinct stack,
+  the input of flamegraph.pl, speedscope and the like
+- `<id>.sql.json`: every query with its start and duration in ms
+
+Only `MAX_PER_MINUTE` requests are profiled (one at a time per process),
+tokens expire after `TOKEN_MAX_AGE` seconds and their user must still be
+active staff. A request whose token doesn't pass is served as usual.
+'''
+import json
+import logging
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Profile-Token'
+TOKEN_PARAMETER = 'profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+SALT = 'core.profiling'
+
+DEFAULTS = {
+    'DIRECTORY': 'profiles',
+    'PATH_PREFIXES': ['/store/'],
+    'INTERVAL_MS': 5,
+    'MAX_PER_MINUTE': 6,
+    'TOKEN_MAX_AGE': 3600,
+}
+
+# one profiled request at a time per process, the others run as usual
+_profiling = threading.Lock()
+
+
+def get_setting(name):
+    return getattr(settings, 'REQUEST_PROFILING', {}).get(name, DEFAULTS[name])
+
+
+# ------------------------------ tokens
+
+def make_token(user, path='/store/'):
+    return signing.dumps({'user': user.pk, 'path': path}, salt=SALT)
+
+
+def read_token(token):
+    '''
+    The user id and path prefix of a token, None when it is forged or
+    expired.
+    '''
+    try:
+        data = signing.loads(token, salt=SALT, max_age=get_setting('TOKEN_MAX_AGE'))
+    except signing.BadSignature:  # SignatureExpired included
+        return None
+    return data['user'], data['path']
+
+
+def _allowed(request):
+    token = request.headers.get(TOKEN_HEADER) or request.GET.get(TOKEN_PARAMETER)
+    if not token or not request.path.startswith(tuple(get_setting('PATH_PREFIXES'))):
+        return False
+    claims = read_token(token)
+    if claims is None:
+        logger.warning('Invalid profiling token for %s %s', request.method, request.path)
+        return False
+    user_id, path = claims
+    if not request.path.startswith(path):
+        return False
+    return get_user_model().objects.filter(pk=user_id, is_staff=True, is_active=True).exists()
+
+
+def _rate_limit_key():
+    return f'core:profiling:{int(time.time() // 60)}'
+
+
+def _within_rate_limit():
+    # counted in the cache, so the limit holds across processes sharing it
+    key = _rate_limit_key()
+    cache.add(key, 0, 60)
+    try:
+        return cache.incr(key) <= get_setting('MAX_PER_MINUTE')
+    except ValueError:  # expired in between
+        return False
+
+
+# ------------------------------ recording
+
+class Sampler:
+    '''
+    Samples the stack of the thread `thread_id` from a background thread
+    and counts identical stacks.
+    '''
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        if stack:
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class SQLTimeline:
+    # a connection.execute_wrapper
+    def __init__(self, start):
+        self.start = start
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'start_ms': round((started - self.start) * 1000, 3),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'database': context['connection'].alias,
+                'sql': sql,
+                'many': many,
+            })
+
+
+def profile_id(request):
+    path = re.sub(r'[^\w-]+', '-', request.path).strip('-')
+    return f"{datetime.now():%Y%m%dT%H%M%S}-{request.method.lower()}-{path}-{uuid.uuid4().hex[:8]}"
+
+
+class RequestProfilerMiddleware:
+    '''
+    Goes first, so the other middleware shows up in the profiles as well.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (_allowed(request) and _within_rate_limit() and _profiling.acquire(blocking=False)):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            _profiling.release()
+
+    def profile(self, request):
+        start = time.perf_counter()
+        timeline = SQLTimeline(start)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timeline))
+            sampler = stack.enter_context(Sampler(threading.get_ident(), get_setting('INTERVAL_MS') / 1000))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        name = profile_id(request)
+        directory = Path(get_setting('DIRECTORY'))
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f'{name}.collapsed').write_text(sampler.collapsed())
+        (directory / f'{name}.sql.json').write_text(json.dumps({
+            'method': request.method,
+            'path': request.path,  # not the query string, it may carry the token
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'interval_ms': get_setting('INTERVAL_MS'),
+            'samples': sum(sampler.stacks.values()),
+            'queries': timeline.queries,
+        }, indent=2))
+        logger.info('Profiled %s %s into %s', request.method, request.path, directory / name)
+        response[PROFILE_ID_HEADER] = name
+        return response
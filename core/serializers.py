@@ -1,6 +1,9 @@
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from django.conf import settings
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from .auth import ClaimsRefreshToken
 
 
 class UserCreateSerializer(BaseUserCreateSerializer):
@@ -11,4 +14,11 @@ class UserCreateSerializer(BaseUserCreateSerializer):
 class UserSerializer(BaseUserSerializer):
     
     class Meta(BaseUserSerializer.Meta):
-        fields = ['id', 'username', 'email', 'first_name', 'last_name']
\ No newline at end of file
+        fields = ['id', 'username', 'email', 'first_name', 'last_name']
+
+# used by the djoser JWT endpoints (SIMPLE_JWT settings), access tokens get the core.auth claims
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
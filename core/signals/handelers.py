@@ -1,10 +1,50 @@
-from django.dispatch import receiver   
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from core import auth
+from core.tasks import async_receiver
+from store import cache
+from store.models import Customer, Product
 from store.signals import order_created
+from tags.models import Tag, TaggedItem
 
 
-# recevier( signal {for which signal this function should execute}, sender{from where this signal should be received})
-@receiver(order_created)
-def on_order_created(seders, **kwargs):
+# async_receiver( signal ) works like receiver() but the function runs later on a task worker (python manage.py run_tasks)
+@async_receiver(order_created)
+def on_order_created(sender, **kwargs):
     # understanding how to connect multiple modules using signals
     # Here we are connecting 2 modules store and core
-    print(kwargs['order'])
\ No newline at end of file
+    print(kwargs['order'])
+
+
+# tags are part of the product representation: move last_update (ETags) and drop cached responses
+def touch_products(product_ids):
+    if Product.objects.filter(pk__in=product_ids).update(last_update=timezone.now()):
+        cache.invalidate(cache.PRODUCTS)
+
+@receiver([post_save, post_delete], sender=TaggedItem)
+def on_product_tagged(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Product).id:
+        touch_products([instance.object_id])
+
+@receiver(post_save, sender=Tag)
+def on_tag_renamed(sender, instance, created, **kwargs):
+    if not created:
+        touch_products(
+            TaggedItem.objects
+            .filter(tag=instance, content_type=ContentType.objects.get_for_model(Product))
+            .values('object_id')
+        )
+
+
+@receiver(post_delete, sender=Customer)
+def on_customer_deleted(sender, instance, **kwargs):
+    auth.forget_customer_id(instance.user_id)
+
+
+# users kept by StatelessJWTAuthentication in this process
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def on_user_changed(sender, instance, **kwargs):
+    auth.user_cache.delete(instance.pk)
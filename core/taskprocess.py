@@ -0,0 +1,17 @@
+'''
+Entry points for task worker processes. Workers are spawned, so they start
+with a fresh interpreter and have to set Django up themselves before any
+task can run.
+'''
+import os
+
+
+def setup(settings_module):
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def run(task_id, worker_id):
+    from core import tasks
+    return tasks.run_by_id(task_id, worker_id)
@@ -0,0 +1,217 @@
+'''
+A small database backed task queue.
+
+Functions decorated with `@task` can be queued with `func.delay(**kwargs)`;
+signal receivers decorated with `@async_receiver(signal)` are queued every
+time the signal is sent. The task row is written in the caller's
+transaction, so workers only see it once that commits and it is rolled
+back with it. The `run_tasks` management command runs the worker.
+'''
+import logging
+import os
+import random
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, models
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 10,
+    'LEASE_SECONDS': 300,
+    'RETRY_BASE_DELAY': 5,
+    'RETRY_MAX_DELAY': 3600,
+    'MAX_ATTEMPTS': 5,
+}
+
+_registry = {}
+
+
+def get_setting(name):
+    return getattr(settings, 'TASK_QUEUE', {}).get(name, DEFAULTS[name])
+
+
+def _task_model():
+    # looked up lazily so worker processes can import this module before django.setup()
+    return apps.get_model('core', 'Task')
+
+
+# ------------------------------ payloads
+
+def encode(value):
+    '''
+    Model instances are stored as references and fetched again by the
+    worker, so a task always sees the committed row.
+    '''
+    if isinstance(value, models.Model):
+        return {'__model__': value._meta.label_lower, 'pk': value.pk}
+    if isinstance(value, type):
+        return f'{value.__module__}.{value.__qualname__}'
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    return value
+
+
+def decode(value):
+    if isinstance(value, dict):
+        if '__model__' in value:
+            return apps.get_model(value['__model__']).objects.get(pk=value['pk'])
+        return {key: decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+# ------------------------------ registering and queueing
+
+def task(func=None, *, name=None, max_attempts=None):
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        _registry[task_name] = func
+        func.task_name = task_name
+        func.delay = lambda **kwargs: enqueue(task_name, kwargs, max_attempts=max_attempts)
+        return func
+    return register(func) if func is not None else register
+
+
+def async_receiver(signal, **kwargs):
+    '''
+    Like `django.dispatch.receiver`, but the receiver runs later on a worker
+    instead of inside `send()`. `sender` is passed as its dotted path.
+    '''
+    def connect(func):
+        task(func)
+
+        def enqueue_receiver(sender, signal=None, **named):
+            enqueue(func.task_name, {'sender': sender, **named})
+
+        # signals hold weak references by default, keep the closure alive
+        signal.connect(enqueue_receiver, weak=False, dispatch_uid=func.task_name, **kwargs)
+        return func
+    return connect
+
+
+def enqueue(name, kwargs, run_at=None, max_attempts=None):
+    if name not in _registry:
+        raise KeyError(f'Unknown task {name}')
+
+    # not deferred with on_commit: an order could then commit while its task is lost
+    return _task_model().objects.create(
+        name=name,
+        payload=encode(kwargs),
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or get_setting('MAX_ATTEMPTS'),
+    )
+
+
+# ------------------------------ running
+
+def new_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def claim(worker_id, batch_size=None):
+    '''
+    Claims up to `batch_size` due tasks for this worker with one conditional
+    UPDATE: a row another worker claimed in the meantime no longer matches,
+    so each task is only ever handed to one worker. Tasks whose lease ran
+    out (crashed worker) are claimed again, unless that was their last
+    attempt: those are failed, a task that crashes its worker every time
+    is not retried forever.
+    '''
+    Task = _task_model()
+    now = timezone.now()
+    expired = Q(status=Task.STATUS_RUNNING, locked_until__lt=now)
+    Task.objects \
+        .filter(expired, attempts__gte=F('max_attempts')) \
+        .update(status=Task.STATUS_FAILED, locked_until=None, last_error='The lease of the last attempt ran out.')
+    claimable = Q(status=Task.STATUS_QUEUED, run_at__lte=now) \
+        | (expired & Q(attempts__lt=F('max_attempts')))
+
+    ids = list(
+        Task.objects
+        .filter(claimable)
+        .order_by('run_at')
+        .values_list('id', flat=True)[:batch_size or get_setting('BATCH_SIZE')]
+    )
+    if not ids:
+        return []
+
+    Task.objects.filter(claimable, id__in=ids).update(
+        status=Task.STATUS_RUNNING,
+        locked_by=worker_id,
+        locked_until=now + timedelta(seconds=get_setting('LEASE_SECONDS')),
+        attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(id__in=ids, status=Task.STATUS_RUNNING, locked_by=worker_id))
+
+
+def retry_delay(attempts):
+    # exponential backoff with jitter, so failing tasks don't retry in lockstep
+    delay = min(get_setting('RETRY_BASE_DELAY') * 2 ** (attempts - 1), get_setting('RETRY_MAX_DELAY'))
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def run(task):
+    '''
+    Runs a claimed task and records the outcome. Returns True on success.
+    '''
+    Task = _task_model()
+    mine = Task.objects.filter(pk=task.pk, locked_by=task.locked_by, status=Task.STATUS_RUNNING)
+    try:
+        func = _registry[task.name]
+        func(**decode(task.payload))
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Task %s failed (attempt %s of %s)', task, task.attempts, task.max_attempts)
+        if task.attempts >= task.max_attempts:
+            mine.update(status=Task.STATUS_FAILED, last_error=error, locked_until=None)
+        else:
+            mine.update(
+                status=Task.STATUS_QUEUED,
+                last_error=error,
+                locked_until=None,
+                run_at=timezone.now() + retry_delay(task.attempts),
+            )
+        return False
+
+    mine.update(status=Task.STATUS_DONE, locked_until=None, last_error='')
+    return True
+
+
+def run_by_id(task_id, worker_id):
+    # entry point for pool workers, they only get the id
+    close_old_connections()
+    try:
+        task = _task_model().objects.get(pk=task_id, locked_by=worker_id)
+        return run(task)
+    finally:
+        close_old_connections()
+
+
+def run_pending(worker_id=None, batch_size=None):
+    '''
+    Claims and runs one batch in the current thread, returns the number of
+    tasks run. Handy in tests and for draining the queue from a shell.
+    '''
+    worker_id = worker_id or new_worker_id()
+    tasks = claim(worker_id, batch_size)
+    for claimed in tasks:
+        run(claimed)
+    return len(tasks)
+
+
+def prune(older_than):
+    Task = _task_model()
+    deleted, _ = Task.objects \
+        .filter(status=Task.STATUS_DONE, created_at__lt=timezone.now() - older_than) \
+        .delete()
+    return deleted
@@ -1,9 +1,16 @@
 from django.contrib import admin, messages
-from django.db.models.aggregates import Count
+from django.core.files.storage import default_storage
 from django.db.models.query import QuerySet
 from django.utils.html import format_html, urlencode
 from django.urls import reverse
 from . import models
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # changelists of tables that grow with traffic: no COUNT(*) over the whole table per page view
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class InventoryFilter(admin.SimpleListFilter):
@@ -27,12 +34,17 @@ class ProductImageInline(admin.TabularInline):
     
     def thumbnail(self, instance):
         if instance.image and instance.image.name:
+            # the small rendition once the workers made it, the original until then
+            url = instance.image.url
+            thumbnail = instance.renditions.get('thumbnail')
+            if thumbnail:
+                url = default_storage.url(thumbnail.get('webp') or next(iter(thumbnail.values())))
             return format_html(
-                f'<img src="{instance.image.url}" style="width: 100px; height: 100px; object-fit: cover;" />'
+                '<img src="{}" style="width: 100px; height: 100px; object-fit: cover;" />', url
                 )
             
 @admin.register(models.Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     autocomplete_fields = ['collection']
     prepopulated_fields = {
         'slug': ['title']
@@ -43,12 +55,13 @@ class ProductAdmin(admin.ModelAdmin):
     list_editable = ['unit_price']
     list_filter = ['collection', 'last_update', InventoryFilter]
     list_per_page = 10
-    list_prefetch_related = ['collection']
+    list_select_related = ['collection']
     inlines = [ProductImageInline]
     search_fields = ['title']
 
+    @admin.display(ordering='collection__title')
     def collection_title(self, product):
-        return product.collection.title
+        return product.collection.title if product.collection else None
 
     @admin.display(ordering='inventory')
     def inventory_status(self, product):
@@ -87,14 +100,9 @@ class CollectionAdmin(admin.ModelAdmin):
             }))
         return format_html('<a href="{}">{} Products</a>', url, collection.products_count)
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            products_count=Count('products')
-        )
-
 
 @admin.register(models.Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(LargeTableAdmin):
     # due to custom usermodel we have to create methods for attributes of custome user model (like first_name, last_name) inside our Customer model (def first_name, def last_name)
     list_display = ['first_name', 'last_name',  'membership', 'orders']
     list_editable = ['membership']
@@ -115,11 +123,6 @@ class CustomerAdmin(admin.ModelAdmin):
             }))
         return format_html('<a href="{}">{} Orders</a>', url, customer.orders_count)
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            orders_count=Count('order')
-        )
-
 
 class OrderItemInline(admin.TabularInline):
     autocomplete_fields = ['product']
@@ -130,7 +133,8 @@ class OrderItemInline(admin.TabularInline):
 
 
 @admin.register(models.Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     autocomplete_fields = ['customer']
     inlines = [OrderItemInline]
     list_display = ['id', 'placed_at', 'customer']
+    list_select_related = ['customer__user']  # Customer.__str__ uses the user's name
@@ -0,0 +1,331 @@
+'''
+Load benchmarks for the store API, run with `python manage.py benchmark_api`.
+
+A scenario is one kind of request (a product page, adding to a cart,
+checkout ...). Each is sent `requests` times by `concurrency` threads,
+either in-process through Django's test client or over HTTP to a threaded
+WSGI server, and summarized as latency percentiles, requests per second
+and queries per request. `compare` checks a run against a saved one.
+'''
+import http.client
+import itertools
+import json
+import math
+import platform
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+import django
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from core.auth import ClaimsRefreshToken
+from . import seeding
+from .models import Cart, CartItem, Product
+
+MODES = ['inprocess', 'server']
+
+# see store.seeding
+DEFAULT_SIZES = {
+    'products': 2000,
+    'customers': 200,
+    'orders': 2000,
+    'reviews': 4000,
+    'tagged_items': 2000,
+}
+
+# set by the server wrapper, the client can't count the server's queries itself
+QUERY_COUNT_HEADER = 'X-Benchmark-Query-Count'
+
+
+# ------------------------------ data
+
+def seed(sizes=None, random_seed=0):
+    '''
+    Adds products, customers, orders and reviews (store.seeding), and
+    returns what the scenarios need to know about them.
+    '''
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    plan = seeding.seed(sizes, random_seed=random_seed)
+    ids = plan['ids']
+    # checkout must not run out
+    Product.objects.filter(id__in=ids['products']).update(inventory=10 ** 6)
+
+    # the first customer is the one with the most orders
+    user = get_user_model().objects.get(pk=ids['users'][0])
+    return {
+        'sizes': sizes,
+        'collection_ids': list(ids['collections']),
+        'product_ids': list(ids['products']),
+        'popular_products': seeding.Zipf(ids['products']),
+        'token': str(ClaimsRefreshToken.for_user(user).access_token),
+        'carts': deque(),
+    }
+
+
+def prepare_carts(dataset, count, random_seed=0):
+    # filled carts, one per checkout request
+    rng = random.Random(random_seed)
+    carts = Cart.objects.bulk_create([Cart() for _ in range(count)])
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, product_id=product_id, quantity=1)
+        for cart in carts
+        for product_id in rng.sample(dataset['product_ids'], 3)
+    ], batch_size=500)
+    dataset['carts'].extend(str(cart.id) for cart in carts)
+
+
+# ------------------------------ scenarios
+# (dataset, rng) -> method, path, JSON body, authenticated
+
+def product_list(dataset, rng):
+    return 'GET', '/store/product/', None, False
+
+
+def product_list_filtered(dataset, rng):
+    collection_id = rng.choice(dataset['collection_ids'])
+    return 'GET', f'/store/product/?collection_id={collection_id}&unit_price__gte=10&ordering=-last_update', None, False
+
+
+def product_detail(dataset, rng):
+    return 'GET', f"/store/product/{dataset['popular_products'].pick(rng)}/", None, False
+
+
+def product_search(dataset, rng):
+    return 'GET', f'/store/product/?search=product+{rng.randint(1, 99)}', None, False
+
+
+def cart_detail(dataset, rng):
+    return 'GET', f"/store/cart/{dataset['cart']}/", None, False
+
+
+def cart_add_item(dataset, rng):
+    body = {'product_id': rng.choice(dataset['product_ids']), 'quantity': 1}
+    return 'POST', f"/store/cart/{dataset['cart']}/items/", body, False
+
+
+def checkout(dataset, rng):
+    return 'POST', '/store/orders/', {'cart_id': dataset['carts'].popleft()}, True
+
+
+def order_list(dataset, rng):
+    return 'GET', '/store/orders/', None, True
+
+
+SCENARIOS = {
+    'product-list': product_list,
+    'product-list-filtered': product_list_filtered,
+    'product-detail': product_detail,
+    'product-search': product_search,
+    'cart-detail': cart_detail,
+    'cart-add-item': cart_add_item,
+    'checkout': checkout,
+    'order-list': order_list,
+}
+
+
+# ------------------------------ sending requests
+
+class QueryCounter:
+    # a connection.execute_wrapper
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def in_process():
+    # a sender factory: every thread gets its own client (and database connection)
+    client = Client(raise_request_exception=False)  # a failing request is counted as an error
+
+    def send(method, path, body, token):
+        extra = {'HTTP_AUTHORIZATION': f'JWT {token}'} if token else {}
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = client.generic(
+                method, path, json.dumps(body) if body is not None else '',
+                content_type='application/json', **extra,
+            )
+        return response.status_code, counter.count
+    return send
+
+
+def over_http(address):
+    host, port = address[:2]
+
+    def factory():
+        session = http.client.HTTPConnection(host, port, timeout=30)
+
+        def send(method, path, body, token):
+            headers = {'Content-Type': 'application/json'}
+            if token:
+                headers['Authorization'] = f'JWT {token}'
+            session.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = session.getresponse()
+            response.read()
+            return response.status, int(response.getheader(QUERY_COUNT_HEADER, 0))
+        return send
+    return factory
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def counting_queries(app):
+    # reports the queries of every request in a response header
+    def wrapped(environ, start_response):
+        counter = QueryCounter()
+
+        def start(status, headers, exc_info=None):
+            return start_response(status, [*headers, (QUERY_COUNT_HEADER, str(counter.count))], exc_info)
+
+        with connection.execute_wrapper(counter):
+            return app(environ, start)
+    return wrapped
+
+
+@contextmanager
+def serve():
+    '''
+    Runs the project on a threaded WSGI server (the one behind runserver)
+    on a free local port, yields its address.
+    '''
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+    server.daemon_threads = True
+    server.set_app(counting_queries(WSGIHandler()))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_address
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# ------------------------------ running and reporting
+
+def percentile(values, percent):
+    # nearest rank
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, queries, errors, seconds, concurrency):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'concurrency': concurrency,
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(len(latencies) / seconds, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+        'max_queries': max(queries),
+    }
+
+
+def run_scenario(sender_factory, name, dataset, requests=200, concurrency=4, warmup=5, random_seed=0):
+    scenario = SCENARIOS[name]
+    if name == 'checkout':
+        prepare_carts(dataset, requests + warmup * concurrency, random_seed)
+    if name in ['cart-detail', 'cart-add-item'] and 'cart' not in dataset:
+        dataset['cart'] = str(Cart.objects.create().id)
+
+    latencies, queries = [], []
+    errors = 0
+    lock = threading.Lock()
+    numbers = itertools.count()  # next() is atomic, so every request number is taken once
+
+    def worker(index):
+        nonlocal errors
+        rng = random.Random(f'{random_seed}:{name}:{index}')
+        send = sender_factory()
+        try:
+            # warm up caches and connections, not recorded
+            for _ in range(warmup):
+                send(*_token(dataset, scenario(dataset, rng)))
+            while next(numbers) < requests:
+                request = _token(dataset, scenario(dataset, rng))
+                start = time.perf_counter()
+                status_code, query_count = send(*request)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    queries.append(query_count)
+                    errors += status_code >= 400
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return summarize(latencies, queries, errors, time.perf_counter() - start, concurrency)
+
+
+def _token(dataset, request):
+    method, path, body, authenticated = request
+    return method, path, body, dataset['token'] if authenticated else None
+
+
+def run(dataset, scenarios=None, modes=None, requests=200, concurrency=4, warmup=5, random_seed=0, report=None):
+    '''
+    Runs every scenario in every mode, returns the results document.
+    `report(mode, name, summary)` is called after each scenario.
+    '''
+    results = {}
+    for mode in modes or MODES:
+        with (serve() if mode == 'server' else nullcontext()) as address:
+            factory = over_http(address) if mode == 'server' else in_process
+            for name in scenarios or SCENARIOS:
+                summary = run_scenario(factory, name, dataset, requests, concurrency, warmup, random_seed)
+                results.setdefault(mode, {})[name] = summary
+                if report:
+                    report(mode, name, summary)
+    return {
+        'created': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        },
+        'sizes': dataset['sizes'],
+        'results': results,
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+    Returns the regressions of `results` against `baseline`, as messages:
+    p95 latency or throughput more than `tolerance` worse, more queries
+    per request (those don't vary between runs) or new errors.
+    '''
+    regressions = []
+    for mode, scenarios in results['results'].items():
+        for name, current in scenarios.items():
+            before = baseline.get('results', {}).get(mode, {}).get(name)
+            if before is None:
+                continue
+            label = f'{mode} {name}'
+            if current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{label}: p95 {before['p95_ms']} ms -> {current['p95_ms']} ms")
+            if current['requests_per_second'] < before['requests_per_second'] / (1 + tolerance):
+                regressions.append(
+                    f"{label}: {before['requests_per_second']} -> {current['requests_per_second']} requests/s"
+                )
+            if current['max_queries'] > before['max_queries']:
+                regressions.append(f"{label}: {before['max_queries']} -> {current['max_queries']} queries per request")
+            if current['errors'] > before['errors']:
+                regressions.append(f"{label}: {before['errors']} -> {current['errors']} errors")
+    return regressions
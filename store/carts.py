@@ -0,0 +1,177 @@
+'''
+Writing cart items, and removing abandoned carts: carts are created
+anonymously and only deleted on checkout, so the ones nobody came back to
+are swept up here.
+'''
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from .models import Cart, CartItem, Product
+
+logger = logging.getLogger(__name__)
+
+# CartItem.quantity is a PositiveSmallIntegerField, this is its range on every database
+MAX_QUANTITY = 32767
+
+
+class QuantityLimitExceeded(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f'Quantity over {MAX_QUANTITY} for products {sorted(product_ids)}')
+        self.product_ids = sorted(product_ids)
+
+
+def upsert_items(cart_id, quantities, replace=False, using='default'):
+    '''
+    Adds `{product_id: quantity}` to a cart with one INSERT ... ON CONFLICT
+    DO UPDATE statement: new products get an item, products already in the
+    cart have the quantity added (or set, with `replace`). Concurrent adds
+    of the same product can't collide on the (cart, product) constraint.
+
+    Unknown products (and everything, for an unknown cart) are skipped by
+    the statement itself, so no existence queries are needed; compare the
+    returned items with what was asked for. Returns the written items,
+    built from RETURNING rather than fetched again.
+
+    Raises QuantityLimitExceeded, and writes nothing, when an item would
+    end up with more than MAX_QUANTITY. Inside a transaction that
+    transaction is rolled back as well.
+    '''
+    if not quantities:
+        return []
+    connection = connections[using]
+    features = connection.features
+    if not (features.supports_update_conflicts_with_target and features.can_return_columns_from_insert):
+        return _upsert_items_one_by_one(cart_id, quantities, replace, using)
+
+    qn = connection.ops.quote_name
+    item_table, product_table, cart_table = (qn(model._meta.db_table) for model in [CartItem, Product, Cart])
+    cart_id = Cart._meta.pk.get_db_prep_value(cart_id, connection)  # ValidationError for a malformed id
+    new_quantity = 'excluded."quantity"' if replace else f'{item_table}."quantity" + excluded."quantity"'
+
+    values = ', '.join(['(%s, %s)'] * len(quantities))
+    sql = (
+        f'WITH v(product_id, quantity) AS (VALUES {values}) '
+        f'INSERT INTO {item_table} ("cart_id", "product_id", "quantity") '
+        f'SELECT c."id", p."id", v.quantity FROM v '
+        f'JOIN {product_table} p ON p."id" = v.product_id '
+        f'JOIN {cart_table} c ON c."id" = %s '
+        # `WHERE true` keeps SQLite from reading ON CONFLICT as part of the join
+        f'WHERE true '
+        f'ON CONFLICT ("cart_id", "product_id") DO UPDATE SET "quantity" = {new_quantity} '
+        # an item that would overflow is left alone, and so missing from RETURNING
+        f'WHERE {new_quantity} <= {MAX_QUANTITY} '
+        f'RETURNING "id", "product_id", "quantity"'
+    )
+    params = [value for item in quantities.items() for value in item] + [cart_id]
+
+    # both or neither: a caller retrying after a failed touch must not add the quantities twice
+    with transaction.atomic(using=using, savepoint=False):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        if len(rows) < len(quantities):
+            # unknown products are skipped too, items that exist were over the limit
+            missing = set(quantities) - {product_id for _, product_id, _ in rows}
+            over_limit = list(
+                CartItem.objects.using(using)
+                .filter(cart_id=cart_id, product_id__in=missing)
+                .values_list('product_id', flat=True)
+            )
+            if over_limit:
+                raise QuantityLimitExceeded(over_limit)
+        if rows:
+            Cart.objects.using(using).filter(pk=cart_id).update(last_activity=timezone.now())
+
+    return [
+        CartItem(id=item_id, cart_id=cart_id, product_id=product_id, quantity=quantity)
+        for item_id, product_id, quantity in rows
+    ]
+
+
+def _upsert_items_one_by_one(cart_id, quantities, replace, using):
+    # databases without ON CONFLICT ... RETURNING
+    if not Cart.objects.using(using).filter(pk=cart_id).exists():
+        return []
+    known = set(Product.objects.using(using).filter(pk__in=quantities.keys()).values_list('id', flat=True))
+    items = []
+    with transaction.atomic(using=using):
+        for product_id, quantity in quantities.items():
+            if product_id not in known:
+                continue
+            item, created = CartItem.objects.using(using).select_for_update().get_or_create(
+                cart_id=cart_id, product_id=product_id, defaults={'quantity': quantity},
+            )
+            if not created:
+                item.quantity = quantity if replace else item.quantity + quantity
+                if item.quantity > MAX_QUANTITY:
+                    raise QuantityLimitExceeded([product_id])
+                item.save(update_fields=['quantity'])
+            items.append(item)
+    return items
+
+
+def get_expiry():
+    return timedelta(days=getattr(settings, 'CART_EXPIRY_DAYS', 30))
+
+
+class SweepResult:
+    def __init__(self):
+        self.carts = 0
+        self.items = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {
+            'carts_deleted': self.carts,
+            'items_deleted': self.items,
+            'batches': self.batches,
+            'seconds': round(self.seconds, 3),
+        }
+
+
+def sweep(older_than=None, batch_size=500, pause=0.0, max_batches=None, dry_run=False):
+    '''
+    Deletes carts without activity for `older_than` (CART_EXPIRY_DAYS by
+    default) and their items, `batch_size` carts per transaction so write
+    locks are only ever held briefly. `pause` seconds between batches
+    leave room for other writers.
+    '''
+    cutoff = timezone.now() - (older_than or get_expiry())
+    expired = Cart.objects.filter(last_activity__lt=cutoff)
+    result = SweepResult()
+    started = time.monotonic()
+
+    if dry_run:
+        result.carts = expired.count()
+        result.items = CartItem.objects.filter(cart__in=expired.values('id')).count()
+        result.seconds = time.monotonic() - started
+        return result
+
+    while max_batches is None or result.batches < max_batches:
+        with transaction.atomic():
+            candidates = expired.order_by('last_activity').values_list('id', flat=True)
+            if connection.features.has_select_for_update_skip_locked:
+                # carts being written to right now are left for the next run
+                candidates = candidates.select_for_update(skip_locked=True)
+            ids = list(candidates[:batch_size])
+            if not ids:
+                break
+            # filtered again: a cart touched since it was picked stays
+            batch = Cart.objects.filter(id__in=ids, last_activity__lt=cutoff)
+            _, deleted = batch.delete()
+
+        result.batches += 1
+        result.carts += deleted.get(Cart._meta.label, 0)
+        result.items += deleted.get(CartItem._meta.label, 0)
+        logger.info('Swept %s carts, %s items', deleted.get(Cart._meta.label, 0), deleted.get(CartItem._meta.label, 0))
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    result.seconds = time.monotonic() - started
+    return result
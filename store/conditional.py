@@ -0,0 +1,61 @@
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalResponseMixin:
+    '''
+    Answers `If-None-Match` / `If-Modified-Since` with 304 Not Modified
+    before the view queries and serializes anything.
+
+    `get_version` returns a cheap `(version, last_modified)` pair (either
+    may be None), or None when no validator can be derived (e.g. the object
+    doesn't exist) and the request is handled normally.
+    '''
+
+    def conditional_response(self, get_version, handler, request, *args, **kwargs):
+        validators = get_version(request)
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        version, last_modified = validators
+        etag = self.make_etag(request, version) if version is not None else None
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            return not_modified
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            if etag is not None:
+                response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def make_etag(self, request, version):
+        # the same version renders differently per URL (filters, page) and media type,
+        # the query parameters are sorted so their order doesn't make a new ETag
+        query = sorted(request.query_params.lists())
+        source = f'{version}|{request.path}?{query}|{request.accepted_media_type}'
+        return quote_etag(hashlib.md5(source.encode()).hexdigest())
+
+
+class ConditionalGetMixin(ConditionalResponseMixin):
+    '''
+    Conditional `list` and `retrieve`, views implement `get_list_version`
+    and `get_detail_version`.
+    '''
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(self.get_list_version, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(self.get_detail_version, super().retrieve, request, *args, **kwargs)
+
+    def get_list_version(self, request):
+        return None
+
+    def get_detail_version(self, request):
+        return None
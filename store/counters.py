@@ -0,0 +1,68 @@
+'''
+Materialized counters: Collection.products_count and Customer.orders_count.
+
+Signals keep them current on single saves and deletes (see
+store.signals.handelers); bulk writes have to call `adjust` themselves.
+`recount` recomputes them from the source tables.
+'''
+from collections import Counter
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from .models import Collection, Customer, Order, Product
+
+# counter model, counter field, counted model, counted model's foreign key to the counter model
+COLLECTION_PRODUCTS = (Collection, 'products_count', Product, 'collection')
+CUSTOMER_ORDERS = (Customer, 'orders_count', Order, 'customer')
+
+
+def adjust(counter, deltas):
+    '''
+    Applies `{pk: delta}` to a counter with one UPDATE, relative to the
+    stored value (F()) so concurrent writers don't overwrite each other.
+    '''
+    model, field, _, _ = counter
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+    if not deltas:
+        return
+    model.objects.filter(pk__in=deltas.keys()).update(**{
+        field: F(field) + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    })
+
+
+def moved(old_id, new_id):
+    # the deltas of one row created (old_id None), deleted (new_id None) or moved
+    deltas = Counter()
+    if old_id != new_id:
+        deltas[old_id] -= 1
+        deltas[new_id] += 1
+    return deltas
+
+
+def recount(counter, batch_size=1000):
+    '''
+    Recomputes a counter for every row, one UPDATE per batch of ids.
+    Returns the number of rows that had drifted.
+    '''
+    model, field, counted_model, foreign_key = counter
+    actual = Coalesce(
+        Subquery(
+            counted_model.objects
+            .filter(**{foreign_key: OuterRef('pk')})
+            .order_by()
+            .values(foreign_key)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+    ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+    fixed = 0
+    for start in range(0, len(ids), batch_size):
+        batch = model.objects.filter(pk__in=ids[start:start + batch_size])
+        fixed += batch.annotate(actual=actual).exclude(**{field: F('actual')}).count()
+        batch.update(**{field: actual})
+    return fixed
@@ -0,0 +1,107 @@
+import csv
+from datetime import datetime, time, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from .models import OrderItem
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+FORMATS = [FORMAT_NDJSON, FORMAT_CSV]
+
+CONTENT_TYPES = {
+    FORMAT_NDJSON: 'application/x-ndjson',
+    FORMAT_CSV: 'text/csv',
+}
+
+ORDER_FIELDS = ['id', 'placed_at', 'payment_status', 'customer_id']
+ITEM_FIELDS = ['id', 'product_id', 'product__title', 'product__sku', 'quantity', 'unit_price']
+
+CSV_HEADER = [
+    'order_id', 'placed_at', 'payment_status', 'customer_id',
+    'item_id', 'product_id', 'product_title', 'product_sku', 'quantity', 'unit_price',
+]
+
+
+def filter_orders(queryset, placed_after=None, placed_before=None, payment_status=None):
+    '''
+    Dates are inclusive and compared as datetime ranges so that an index on
+    `placed_at` can be used.
+    '''
+    if placed_after is not None:
+        queryset = queryset.filter(placed_at__gte=_start_of_day(placed_after))
+    if placed_before is not None:
+        queryset = queryset.filter(placed_at__lt=_start_of_day(placed_before + timedelta(days=1)))
+    if payment_status is not None:
+        queryset = queryset.filter(payment_status=payment_status)
+    return queryset
+
+
+def iter_orders(orders, chunk_size=2000):
+    '''
+    Yields `(order, items)` dicts for every order, walking orders and their
+    items as two server side cursors sorted by order id and merging them,
+    so memory stays constant however many rows there are.
+    '''
+    order_rows = orders.order_by('id').values(*ORDER_FIELDS).iterator(chunk_size=chunk_size)
+    item_rows = OrderItem.objects \
+        .filter(order__in=orders.values('id')) \
+        .order_by('order_id', 'id') \
+        .values('order_id', *ITEM_FIELDS) \
+        .iterator(chunk_size=chunk_size)
+
+    item = next(item_rows, None)
+    for order in order_rows:
+        # items of orders filtered out in between can't exist, both sides use the same filter
+        while item is not None and item['order_id'] < order['id']:
+            item = next(item_rows, None)
+        items = []
+        while item is not None and item['order_id'] == order['id']:
+            items.append(item)
+            item = next(item_rows, None)
+        yield order, items
+
+
+def iter_ndjson(orders, chunk_size=2000):
+    encoder = DjangoJSONEncoder()
+    for order, items in iter_orders(orders, chunk_size):
+        yield encoder.encode({
+            **order,
+            'items': [
+                {
+                    'id': item['id'],
+                    'product_id': item['product_id'],
+                    'product_title': item['product__title'],
+                    'product_sku': item['product__sku'],
+                    'quantity': item['quantity'],
+                    'unit_price': item['unit_price'],
+                }
+                for item in items
+            ],
+        }) + '\n'
+
+
+class _Echo:
+    # csv.writer needs a file, this one hands every line straight back
+    def write(self, value):
+        return value
+
+
+def iter_csv(orders, chunk_size=2000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order, items in iter_orders(orders, chunk_size):
+        order_columns = [order['id'], order['placed_at'].isoformat(), order['payment_status'], order['customer_id']]
+        if not items:
+            yield writer.writerow(order_columns + [''] * 6)
+        for item in items:
+            yield writer.writerow(order_columns + [item[field] for field in ITEM_FIELDS])
+
+
+def iter_export(file_format, orders, chunk_size=2000):
+    if file_format == FORMAT_CSV:
+        return iter_csv(orders, chunk_size)
+    return iter_ndjson(orders, chunk_size)
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
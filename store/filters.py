@@ -1,15 +1,22 @@
 from dataclasses import field
 from django_filters import rest_framework as filters
 from django_filters.rest_framework import FilterSet
+from tags.models import TaggedItem
 from .models import Product, Review
 
 class ProductFilter(FilterSet):
+    tag = filters.CharFilter(method='filter_tag')  # tag label, exact
+
+    def filter_tag(self, queryset, name, value):
+        return queryset.filter(id__in=TaggedItem.objects.object_ids_tagged(Product, value))
+
     class Meta:
         model = Product
         fields = {
             'collection_id' : ['exact'],
             'unit_price' : ['gte', 'lte'],
-            
+            'rating_avg' : ['gte', 'lte'],
+            'rating_count' : ['gte'],
         }
         
 class ReviewFilter(FilterSet):
@@ -0,0 +1,46 @@
+'''
+Image work that runs in the rendition worker processes. Only depends on
+Pillow (not on Django) so spawned workers can import it without setting
+up the project.
+'''
+import os
+from PIL import Image, ImageOps
+
+SAVE_OPTIONS = {
+    'jpeg': {'quality': 85, 'optimize': True, 'progressive': True},
+    'png': {'optimize': True},
+    'webp': {'quality': 80, 'method': 4},
+}
+EXTENSIONS = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp'}
+
+
+def rendition_name(source_name, image_id, rendition, extension):
+    directory = os.path.dirname(source_name)
+    return os.path.join(directory, 'renditions', f'{image_id}_{rendition}.{extension}')
+
+
+def render_renditions(media_root, source_name, image_id, sizes):
+    '''
+    Writes every rendition of the source image as a fixed size crop, once
+    in a fallback format (JPEG, or PNG when the image has transparency) and
+    once as WebP. Returns `{rendition: {format: name}}` with names relative
+    to `media_root`.
+    '''
+    renditions = {}
+    with Image.open(os.path.join(media_root, source_name)) as source:
+        source = ImageOps.exif_transpose(source)
+        has_alpha = source.mode in ('RGBA', 'LA') or 'transparency' in source.info
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+        fallback = 'png' if has_alpha else 'jpeg'
+
+        for rendition, size in sizes.items():
+            image = ImageOps.fit(source, tuple(size), Image.LANCZOS)
+            names = {}
+            for image_format in [fallback, 'webp']:
+                name = rendition_name(source_name, image_id, rendition, EXTENSIONS[image_format])
+                path = os.path.join(media_root, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                image.save(path, image_format.upper(), **SAVE_OPTIONS[image_format])
+                names[image_format] = name
+            renditions[rendition] = names
+    return renditions
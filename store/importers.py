@@ -0,0 +1,244 @@
+import csv
+import io
+import json
+import re
+from collections import Counter
+from functools import reduce
+from operator import or_
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+from . import cache, counters, search
+from .models import Collection, Product
+from .serializers import ProductImportRowSerializer
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMATS = [FORMAT_CSV, FORMAT_NDJSON]
+
+SLUG_MAX_LENGTH = Product._meta.get_field('slug').max_length
+
+# columns that may be left empty in a CSV file
+OPTIONAL_FIELDS = ['collection', 'slug']
+
+
+def guess_format(filename):
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return FORMAT_NDJSON
+    return FORMAT_CSV
+
+
+def read_rows(stream, format):
+    '''
+    Yields `(line_number, row)` from a binary stream one line at a time, so
+    files of any size are parsed without loading them. `row` is None for a
+    line that could not be parsed.
+    '''
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if format == FORMAT_NDJSON:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            for field in OPTIONAL_FIELDS:
+                if row.get(field) == '':
+                    row[field] = None
+            yield reader.line_num, row
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+class ProductImporter:
+    '''
+    Upserts products keyed on `sku` in batches: each batch is validated,
+    resolves its collections and existing products with one query each and
+    is written with bulk_create/bulk_update in its own transaction. Bad rows
+    are reported and skipped, they never abort the file. A batch the
+    database rejects is retried row by row.
+    '''
+    update_fields = ['title', 'description', 'unit_price', 'inventory', 'collection', 'last_update']
+
+    def __init__(self, batch_size=1000, max_errors=1000):
+        self.batch_size = batch_size
+        self.result = ImportResult(max_errors)
+
+    def run(self, rows):
+        batch = []
+        for line, row in rows:
+            batch.append((line, row))
+            if len(batch) == self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+
+        if self.result.created or self.result.updated:
+            cache.invalidate(cache.PRODUCTS, cache.COLLECTIONS)
+        return self.result
+
+    def import_batch(self, batch):
+        rows = self.validate(batch)
+        rows = self.resolve_collections(rows)
+        if not rows:
+            return
+
+        existing = {}
+        for product in Product.objects.filter(sku__in=rows.keys()).order_by('-id'):
+            existing[product.sku] = product  # lowest id wins if a sku was ever duplicated
+
+        now = timezone.now()
+        changes = []  # (line, product, collection deltas)
+        for sku, (line, data) in rows.items():
+            product = existing.get(sku)
+            if product is None:
+                product = Product(sku=sku, slug=data.get('slug') or '')
+                deltas = counters.moved(None, data.get('collection'))
+            else:
+                deltas = counters.moved(product.collection_id, data.get('collection'))
+            product.title = data['title']
+            product.description = data['description']
+            product.unit_price = data['unit_price']
+            product.inventory = data['inventory']
+            product.collection_id = data.get('collection')
+            product.last_update = now
+            changes.append((line, product, deltas))
+
+        try:
+            self.write(changes)
+        except IntegrityError:
+            # e.g. a concurrent writer took one of the slugs: retry row by row to find the rows that clash
+            for change in changes:
+                try:
+                    self.write([change])
+                except IntegrityError as error:
+                    self.result.add_error(change[0], {'non_field_errors': [f'Could not be saved: {error}']})
+
+    def write(self, changes):
+        to_create = [product for _, product, _ in changes if product._state.adding]
+        to_update = [product for _, product, _ in changes if not product._state.adding]
+        collection_deltas = Counter()  # bulk writes skip the signals keeping products_count
+        for _, _, deltas in changes:
+            collection_deltas.update(deltas)
+        slugs = [product.slug for product in to_create]
+
+        try:
+            with transaction.atomic():
+                SlugAllocator().assign(to_create)
+                Product.objects.bulk_create(to_create)
+                Product.objects.bulk_update(to_update, self.update_fields)
+                counters.adjust(counters.COLLECTION_PRODUCTS, collection_deltas)
+                search.index_products(to_create + to_update)
+        except IntegrityError:
+            # rolled back, the new products are new again
+            for product, slug in zip(to_create, slugs):
+                product.pk, product.slug = None, slug
+                product._state.adding = True
+            raise
+
+        self.result.created += len(to_create)
+        self.result.updated += len(to_update)
+
+    def validate(self, batch):
+        rows = {}
+        for line, row in batch:
+            if row is None:
+                self.result.add_error(line, {'non_field_errors': ['Could not parse line.']})
+                continue
+            serializer = ProductImportRowSerializer(data=row)
+            if not serializer.is_valid():
+                self.result.add_error(line, serializer.errors)
+                continue
+            # the last row for a sku wins, like it would importing row by row
+            rows.pop(serializer.validated_data['sku'], None)
+            rows[serializer.validated_data['sku']] = (line, serializer.validated_data)
+        return rows
+
+    def resolve_collections(self, rows):
+        collection_ids = {data['collection'] for _, data in rows.values() if data.get('collection') is not None}
+        known = set(Collection.objects.filter(id__in=collection_ids).values_list('id', flat=True))
+
+        resolved = {}
+        for sku, (line, data) in rows.items():
+            if data.get('collection') is not None and data['collection'] not in known:
+                self.result.add_error(line, {'collection': [f"Invalid pk \"{data['collection']}\" - object does not exist."]})
+                continue
+            resolved[sku] = (line, data)
+        return resolved
+
+
+class SlugAllocator:
+    '''
+    Gives every new product a unique slug, querying the database once for
+    the whole batch (plus once more only if some slugs are taken).
+    Taken slugs get the next free numeric suffix: `shirt`, `shirt-2`, ...
+    '''
+
+    def assign(self, products):
+        bases = [self.base_slug(product) for product in products]
+        taken = set(Product.objects.filter(slug__in=set(bases)).values_list('slug', flat=True))
+
+        used = set()
+        clashes = []
+        for product, base in zip(products, bases):
+            if base in taken or base in used:
+                clashes.append((product, base))
+            else:
+                product.slug = base
+                used.add(base)
+
+        if clashes:
+            next_suffix = self.next_suffixes({base for _, base in clashes})
+            for product, base in clashes:
+                while True:
+                    suffix = f'-{next_suffix[base]}'
+                    next_suffix[base] += 1
+                    slug = base[:SLUG_MAX_LENGTH - len(suffix)] + suffix
+                    if slug not in used:
+                        break
+                product.slug = slug
+                used.add(slug)
+
+    def base_slug(self, product):
+        return (slugify(product.slug or product.title) or 'product')[:SLUG_MAX_LENGTH]
+
+    def next_suffixes(self, bases):
+        suffix = {base: 2 for base in bases}
+        # suffixed slugs of a long base are truncated, so look them up by a shorter prefix
+        condition = reduce(or_, [Q(slug__startswith=base[:SLUG_MAX_LENGTH - 10]) for base in bases])
+        for slug in Product.objects.filter(condition).values_list('slug', flat=True):
+            match = re.match(r'^(.*)-(\d+)$', slug)
+            if match is None:
+                continue
+            head, number = match.group(1), int(match.group(2))
+            for base in bases:
+                if head == base[:SLUG_MAX_LENGTH - len(match.group(2)) - 1]:
+                    suffix[base] = max(suffix[base], number + 1)
+        return suffix
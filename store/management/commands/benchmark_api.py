@@ -0,0 +1,86 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from store import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Load tests the store API on a freshly seeded database and reports latency, throughput and queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=list(benchmarks.SCENARIOS), help='Repeat for several, all by default.')
+        parser.add_argument('--mode', choices=['inprocess', 'server', 'both'], default='both')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per thread before measuring.')
+        parser.add_argument('--seed', type=int, default=0)
+        for name, size in benchmarks.DEFAULT_SIZES.items():
+            parser.add_argument(f'--{name}', type=int, default=size)
+        parser.add_argument('--database', help='SQLite file to seed, a temporary one by default. It is overwritten.')
+        parser.add_argument('--keep-db', action='store_true', help='Leave the seeded database in place.')
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the results.')
+        parser.add_argument('--baseline', help='Results of an earlier run to compare with.')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against the baseline (0.2 = 20%%).')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The benchmark seeds its own SQLite database, the default database must be SQLite.')
+        baseline = None
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())
+
+        # the benchmark gets its own database, like the test runner does
+        directory = None
+        database = options['database']
+        if database is None:
+            directory = tempfile.mkdtemp(prefix='benchmark-')
+            database = str(Path(directory) / 'benchmark.sqlite3')
+        old_name = connection.settings_dict['NAME']
+        old_test_settings = connection.settings_dict.get('TEST', {})
+        connection.settings_dict['TEST'] = {**old_test_settings, 'NAME': database}
+
+        # DEBUG keeps a log of every query, production doesn't
+        with override_settings(DEBUG=False, DATABASE_REPLICAS=[], ALLOWED_HOSTS=['testserver', '127.0.0.1']):
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                dataset = benchmarks.seed(
+                    {name: options[name] for name in benchmarks.DEFAULT_SIZES},
+                    random_seed=options['seed'],
+                )
+                results = benchmarks.run(
+                    dataset,
+                    scenarios=options['scenario'],
+                    modes=benchmarks.MODES if options['mode'] == 'both' else [options['mode']],
+                    requests=options['requests'],
+                    concurrency=options['concurrency'],
+                    warmup=options['warmup'],
+                    random_seed=options['seed'],
+                    report=self.report,
+                )
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keep_db'])
+                connection.settings_dict['TEST'] = old_test_settings
+                if directory is not None and not options['keep_db']:
+                    shutil.rmtree(directory, ignore_errors=True)
+
+        if options['keep_db']:
+            self.stdout.write(f'Seeded database kept in {database}')
+        Path(options['output']).write_text(json.dumps(results, indent=2))
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = benchmarks.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def report(self, mode, name, summary):
+        self.stdout.write(
+            f"{mode:<9} {name:<22} {summary['requests_per_second']:>8} req/s  "
+            f"p50 {summary['p50_ms']:>7} ms  p95 {summary['p95_ms']:>7} ms  p99 {summary['p99_ms']:>7} ms  "
+            f"{summary['queries_per_request']:>5} queries  {summary['errors']} errors"
+        )
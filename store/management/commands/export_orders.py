@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from store import exports
+from store.models import Order
+from store.serializers import OrderExportSerializer
+
+
+class Command(BaseCommand):
+    help = 'Streams orders with their items as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=exports.FORMATS, default=exports.FORMAT_NDJSON)
+        parser.add_argument('--placed-after', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--placed-before', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--payment-status', help='P, C or F')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--output', help='File to write to, stdout by default.')
+
+    def handle(self, *args, **options):
+        params = OrderExportSerializer(data={
+            key: options[key]
+            for key in ['placed_after', 'placed_before', 'payment_status']
+            if options[key] is not None
+        })
+        if not params.is_valid():
+            raise CommandError(params.errors)
+        filters = dict(params.validated_data)
+        filters.pop('export_format')
+
+        orders = exports.filter_orders(Order.objects.all(), **filters)
+        lines = exports.iter_export(options['format'], orders, options['chunk_size'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,48 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from store import imaging, renditions
+from store.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generates thumbnails and WebP variants for product images that have none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate images that already have renditions.')
+        parser.add_argument('--workers', type=int, default=settings.PRODUCT_IMAGE_RENDITION_WORKERS)
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.order_by('id')
+        if not options['all']:
+            images = images.filter(renditions={})
+        jobs = list(images.values_list('id', 'image'))
+
+        media_root = str(settings.MEDIA_ROOT)
+        sizes = renditions.get_sizes()
+        generated = failed = 0
+
+        def finish(image_id, name, render):
+            nonlocal generated, failed
+            try:
+                renditions.store_result(image_id, name, render())
+                generated += 1
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'image {image_id}: {error}')
+
+        if options['workers'] <= 0:
+            for image_id, name in jobs:
+                finish(image_id, name, lambda: imaging.render_renditions(media_root, name, image_id, sizes))
+        else:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as pool:
+                futures = {
+                    pool.submit(imaging.render_renditions, media_root, name, image_id, sizes): (image_id, name)
+                    for image_id, name in jobs
+                }
+                for future in as_completed(futures):
+                    finish(*futures[future], future.result)
+
+        self.stdout.write(self.style.SUCCESS(f'{generated} images rendered, {failed} failed.'))
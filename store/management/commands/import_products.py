@@ -0,0 +1,29 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from store import importers
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates products (matched on sku) from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=importers.FORMATS, help='Guessed from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-errors', type=int, default=1000, help='Number of row errors to print.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or importers.guess_format(options['path'])
+        importer = importers.ProductImporter(options['batch_size'], options['max_errors'])
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = importer.run(importers.read_rows(stream, file_format))
+        except OSError as error:
+            raise CommandError(error)
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.created} created, {result.updated} updated, {result.error_count} errors.'
+        ))
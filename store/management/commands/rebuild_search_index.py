@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from store import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product full text search index from the product table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if not search.is_available(options['database']):
+            self.stdout.write(self.style.WARNING(
+                'No full text index on this database, search uses the icontains fallback.'
+            ))
+            return
+
+        indexed = search.rebuild_index(options['batch_size'], options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} products.'))
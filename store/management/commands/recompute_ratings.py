@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from store import ratings
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the rating statistics of products from their reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('products', nargs='*', type=int, help='Product ids, all products by default.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['products']:
+            products = products.filter(id__in=options['products'])
+
+        updated = ratings.recompute(products, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed ratings of {updated} products.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from store import counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the materialized counters (products per collection, orders per customer).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for name, counter in [
+            ('collection products_count', counters.COLLECTION_PRODUCTS),
+            ('customer orders_count', counters.CUSTOMER_ORDERS),
+        ]:
+            fixed = counters.recount(counter, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{name}: {fixed} rows corrected.'))
@@ -0,0 +1,53 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from store import seeding
+
+
+class Command(BaseCommand):
+    help = 'Adds generated products, customers, orders, reviews, carts and tags, quickly and reproducibly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100000, help='About how many rows to add in total.')
+        for kind in seeding.SHARES:
+            parser.add_argument(f"--{kind.replace('_', '-')}", type=int, dest=kind, help=f'Overrides the {kind} count derived from --size.')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed always generates the same data.')
+        parser.add_argument('--skew', type=float, default=seeding.DEFAULT_SKEW, help='Zipf exponent of product and customer popularity.')
+        parser.add_argument('--processes', type=int, default=0, help='Worker processes generating chunks, 0 generates in this process.')
+        parser.add_argument('--chunk-size', type=int, default=seeding.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--end-date', type=datetime.fromisoformat, help='Latest generated timestamp, today by default (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        sizes = seeding.sizes_for(options['size'])
+        sizes.update({kind: options[kind] for kind in seeding.SHARES if options[kind] is not None})
+        end = options['end_date']
+        if end is not None and timezone.is_naive(end):
+            end = timezone.make_aware(end)
+
+        started = time.perf_counter()
+        total = 0
+
+        def report(kind, rows, seconds):
+            nonlocal total
+            if rows is None:
+                self.stdout.write(f'{kind:<14} {seconds:>8.1f}s')
+                return
+            total += rows
+            self.stdout.write(f'{kind:<14} {rows:>10} rows {seconds:>8.1f}s')
+
+        try:
+            seeding.seed(
+                sizes,
+                random_seed=options['seed'],
+                skew=options['skew'],
+                processes=options['processes'],
+                chunk_size=options['chunk_size'],
+                end=end,
+                report=report,
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        seconds = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'{total} rows in {seconds:.1f}s ({total / seconds:.0f} rows/s).'))
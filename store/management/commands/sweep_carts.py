@@ -0,0 +1,35 @@
+import json
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from store import carts
+
+
+class Command(BaseCommand):
+    help = 'Deletes carts without activity for longer than CART_EXPIRY_DAYS, in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, help='Idle days before a cart expires, CART_EXPIRY_DAYS by default.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to wait between batches.')
+        parser.add_argument('--max-batches', type=int)
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted.')
+        parser.add_argument('--json', action='store_true', help='Print the metrics as JSON.')
+
+    def handle(self, *args, **options):
+        result = carts.sweep(
+            older_than=timedelta(days=options['days']) if options['days'] is not None else None,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_batches=options['max_batches'],
+            dry_run=options['dry_run'],
+        )
+        metrics = result.as_dict()
+        if options['json']:
+            self.stdout.write(json.dumps(metrics))
+            return
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {metrics['carts_deleted']} carts and {metrics['items_deleted']} items "
+            f"in {metrics['batches']} batches ({metrics['seconds']}s)."
+        ))
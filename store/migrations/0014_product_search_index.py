@@ -0,0 +1,37 @@
+from django.db import migrations, OperationalError
+
+
+FTS_TABLE = 'store_product_fts'
+
+
+def create_search_index(apps, schema_editor):
+    # only SQLite builds with FTS5 get the index, other databases use the icontains fallback
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            "USING fts5(title, description, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        return
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+        'SELECT id, title, description FROM store_product'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_alter_productimage_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Collection = apps.get_model('store', 'Collection')
+    Customer = apps.get_model('store', 'Customer')
+    Product = apps.get_model('store', 'Product')
+    Order = apps.get_model('store', 'Order')
+
+    def count(model, foreign_key):
+        return Coalesce(Subquery(
+            model.objects
+            .filter(**{foreign_key: OuterRef('pk')})
+            .order_by()
+            .values(foreign_key)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ), 0)
+
+    Collection.objects.update(products_count=count(Product, 'collection'))
+    Customer.objects.update(orders_count=count(Order, 'customer'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_product_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='orders_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:21
+
+from django.db import migrations, models
+import django.utils.timezone
+from django.db.models import F
+
+
+def start_from_created_at(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    Cart.objects.update(last_activity=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_materialized_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='last_activity',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(start_from_created_at, migrations.RunPython.noop),
+    ]
@@ -4,10 +4,24 @@ from django.contrib import admin
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 from store import permissions
 from .validators import validate_file_size
 
+
+def exclude_from_update(instance, fields, kwargs):
+    '''
+    For save() overrides: leaves `fields` out of the UPDATE of an existing
+    row. Counters moved with F() updates must never be written back from a
+    loaded instance, that would undo every change made since it was loaded.
+    '''
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        kwargs['update_fields'] = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in fields
+        ]
+
 class Promotion(models.Model):
     DISCOUNT_TYPE_CHOICES = [
         ('PERCENTAGE', 'Percentage'),
@@ -40,9 +54,15 @@ class Collection(models.Model):
         null=True,
         related_name='+'  #don't make reverse relation with Product Models
         )
+    # maintained by store.counters
+    products_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.title
+
+    def save(self, *args, **kwargs):
+        exclude_from_update(self, ['products_count'], kwargs)
+        super().save(*args, **kwargs)
     
     class Meta:
         ordering = ['title']
@@ -51,7 +71,7 @@ class Collection(models.Model):
 class Product(models.Model):
     title = models.CharField(max_length=250)
     description = models.TextField()
-    sku = models.CharField(max_length=20)
+    sku = models.CharField(max_length=20, db_index=True)
     slug = models.SlugField(unique=True)
 
     unit_price = models.DecimalField(max_digits=6, decimal_places=2, validators=[MinValueValidator(Decimal(1.0))])
@@ -65,19 +85,59 @@ class Product(models.Model):
     
     last_update = models.DateTimeField(auto_now=True, editable=False)
 
+    # review statistics, kept up to date by store.ratings (never set them directly)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False, db_index=True)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    RATING_FIELDS = [
+        'rating_count', 'rating_sum', 'rating_avg',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    ]
+
     def __str__(self) -> str:
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # lets the counter signals see a product moving to another collection without a query
+        instance._loaded_collection_id = instance.__dict__.get('collection_id')
+        return instance
+    
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}_count') for star in range(1, 6)}
 
     def save(self, *args, **kwargs):
         if not self.slug:  # Only set the slug if it hasn't been set yet
             self.slug = slugify(self.title)  # Generate the slug from the title
+        exclude_from_update(self, self.RATING_FIELDS, kwargs)
         super().save(*args, **kwargs)  # Call the original save method
 
+    # the filter and ordering paths of ProductViewSet (store/tests/test_query_plans.py checks they are used)
+    class Meta:
+        indexes = [
+            # ?collection_id= with a price range or ?ordering=unit_price
+            models.Index(fields=['collection', 'unit_price']),
+            # price range across all collections
+            models.Index(fields=['unit_price']),
+            models.Index(fields=['title']),
+            # ?ordering=-last_update, and the Max(last_update) of the conditional GET version
+            models.Index(fields=['last_update']),
+        ]
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='store/images', validators=[validate_file_size]) #path related to media root
+    # {rendition: {format: path}}, filled in by the rendition workers after upload
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
 
 class Customer(models.Model):
@@ -95,10 +155,16 @@ class Customer(models.Model):
     membership = models.CharField(
         max_length=1, choices=MEMBERSHIP_CHOICES, default=MEMBERSHIP_BRONZE)
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # maintained by store.counters
+    orders_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f'{self.user.first_name} {self.user.last_name}'
 
+    def save(self, *args, **kwargs):
+        exclude_from_update(self, ['orders_count'], kwargs)
+        super().save(*args, **kwargs)
+
     @admin.display(ordering='user__first_name')
     def first_name(self):
         return self.user.first_name
@@ -132,11 +198,23 @@ class Order(models.Model):
         )
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_customer_id = instance.__dict__.get('customer_id')
+        return instance
+    
     class Meta:
         permissions = [
             # (Code Name{will not be available in Admin Panel}, Description),
             ('cancel_order', 'Can Cancel Order')
         ]
+        # OrderViewSet lists newest first, the export filters on status and dates
+        indexes = [
+            models.Index(fields=['customer', 'placed_at']),
+            models.Index(fields=['payment_status', 'placed_at']),
+            models.Index(fields=['placed_at']),
+        ]
 
 
 class OrderItem(models.Model):
@@ -157,6 +235,12 @@ class Address(models.Model):
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    # moved by every item change, carts idle for too long are removed by `manage.py sweep_carts`
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)
+
+    @classmethod
+    def touch(cls, cart_id):
+        cls.objects.filter(pk=cart_id).update(last_activity=timezone.now())
 
 
 class CartItem(models.Model):
@@ -169,6 +253,16 @@ class CartItem(models.Model):
     class Meta:
         unique_together = [['cart', 'product'],]
 
+    # not signals: deleting whole carts has to stay a fast DELETE ... WHERE cart_id IN (...)
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Cart.touch(self.cart_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Cart.touch(self.cart_id)
+        return result
+
 
 
 class Review(models.Model):
@@ -187,4 +281,10 @@ class Review(models.Model):
     
     def __str__(self):
         return f'Review for {self.product.title}: {self.title}'
+
+    class Meta:
+        indexes = [
+            # rating range filters within a product (ReviewFilter)
+            models.Index(fields=['product', 'rating']),
+        ]
     
@@ -1,4 +1,248 @@
-from rest_framework.pagination import PageNumberPagination
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import AutoField, Max, Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
 
 class DefaultPagination(PageNumberPagination):
-    page_size = 15
\ No newline at end of file
+    page_size = 15
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Cursor pagination that seeks on the ordering columns (plus `id` as a
+    tie-breaker) instead of using OFFSET, and never runs a COUNT(*).
+
+    The ordering is taken from the queryset, so it follows whatever
+    OrderingFilter applied for the request.
+    '''
+    page_size = 15
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    mode_query_value = 'cursor'
+    default_ordering = ('id',)
+    tie_breaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @classmethod
+    def is_requested(cls, request):
+        params = request.query_params
+        return bool(params.get(cls.cursor_query_param)) \
+            or params.get(cls.mode_query_param) == cls.mode_query_value
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'page')
+        # orderings that can't be seeked on are replaced by the default one
+        self.ordering = self.get_ordering(queryset) or self.get_ordering(queryset.order_by())
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['reverse']
+
+        order_by = [self._order_term(name, desc != reverse) for name, desc in self.ordering]
+        queryset = queryset.order_by(*order_by)
+        if cursor is not None:
+            queryset = queryset.filter(self.seek_filter(cursor['position'], reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_ordering(self, queryset):
+        '''
+        Returns the ordering as a list of (field, descending) pairs, always
+        ending with the tie-breaker so that every position is unique. Model
+        fields and annotations (like search_rank) can be seeked on; None
+        when the ordering has anything else (related lookups, expressions).
+        '''
+        ordering = list(queryset.query.order_by) or list(self.default_ordering)
+
+        model = queryset.model
+        fields = []
+        for term in ordering:
+            if not isinstance(term, str):
+                return None
+            name = term.lstrip('-')
+            if name == 'pk':
+                name = model._meta.pk.name
+            if name not in queryset.query.annotations:
+                try:
+                    model._meta.get_field(name)
+                except FieldDoesNotExist:
+                    return None
+            fields.append((name, term.startswith('-')))
+
+        if self.tie_breaker not in [name for name, _ in fields]:
+            fields.append((self.tie_breaker, fields[0][1] if fields else False))
+        return fields
+
+    @classmethod
+    def can_paginate(cls, queryset):
+        return cls().get_ordering(queryset) is not None
+
+    def seek_filter(self, position, reverse):
+        # (a, b, id) > (x, y, z)  ==  a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+        condition = Q()
+        for index, (name, desc) in enumerate(self.ordering):
+            lookup = 'lt' if desc != reverse else 'gt'
+            equal = {prev_name: position[i] for i, (prev_name, _) in enumerate(self.ordering[:index])}
+            condition |= Q(**equal, **{f'{name}__{lookup}': position[index]})
+        return condition
+
+    def encode_cursor(self, obj, reverse):
+        payload = {
+            'o': self._ordering_key(),
+            'p': [self._value_of(obj, name) for name, _ in self.ordering],
+            'r': int(reverse),
+        }
+        encoded = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode()))
+            position, ordering_key, reverse = payload['p'], payload['o'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        # a cursor only makes sense for the ordering it was issued for
+        if ordering_key != self._ordering_key() or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return {'position': position, 'reverse': reverse}
+
+    def _ordering_key(self):
+        return ','.join(('-' if desc else '') + name for name, desc in self.ordering)
+
+    def _value_of(self, obj, name):
+        try:
+            field = obj._meta.get_field(name)
+        except FieldDoesNotExist:
+            return getattr(obj, name)  # an annotation, a number (search_rank) or a string
+        return field.value_to_string(obj)
+
+    @staticmethod
+    def _order_term(name, desc):
+        return f'-{name}' if desc else name
+
+
+class KeysetOrPageNumberPagination(DefaultPagination):
+    '''
+    Page number pagination by default; clients opt in to keyset pagination
+    per request with `?pagination=cursor` and then follow the `next` links.
+    Orderings keyset pagination can't seek on are paginated by page number.
+    '''
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_pagination_class.is_requested(request) \
+                and self.keyset_pagination_class.can_paginate(queryset):
+            self.keyset = self.keyset_pagination_class()
+            self.keyset.page_size = self.page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Django paginator (for admin changelists) that doesn't COUNT(*) whole
+    big tables. Unfiltered querysets get the row count the database keeps
+    in its statistics (or the highest id on SQLite before ANALYZE), and
+    only when that says the table is small is the exact count taken.
+    Filtered querysets are always counted exactly.
+    '''
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if getattr(queryset, 'query', None) is None or queryset.query.where:
+            return super().count
+        estimate = estimate_row_count(queryset)
+        if estimate is None or estimate < self.exact_count_limit:
+            return super().count
+        return estimate
+
+
+def estimate_row_count(queryset):
+    '''
+    Cheap and possibly stale row count of the queryset's table, None when
+    the database has nothing better than an exact count.
+    '''
+    model = queryset.model
+    connection = connections[queryset.db]
+    table = model._meta.db_table
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            # -1 until the table was first vacuumed/analyzed
+            return row[0] if row and row[0] >= 0 else None
+
+        if connection.vendor == 'sqlite':
+            if 'sqlite_stat1' in connection.introspection.table_names(cursor):
+                # "rows [rows per index column ...]", written by ANALYZE
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+
+    # integer ids only grow, the highest one is an upper bound found with an index lookup
+    if isinstance(model._meta.pk, AutoField):  # BigAutoField included
+        return queryset.order_by().aggregate(highest = Max('pk'))['highest'] or 0
+    return None
@@ -0,0 +1,91 @@
+'''
+Denormalized review statistics on Product (rating_count, rating_sum,
+rating_avg and one counter per star). Every review write moves them with a
+single UPDATE built from F() expressions, so concurrent reviews never lose
+each other's changes. `recompute` rebuilds them from the reviews.
+'''
+from django.db.models import Count, DecimalField, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+from django.utils import timezone
+from . import cache
+from .models import Product, Review
+
+STARS = [1, 2, 3, 4, 5]
+STAR_FIELDS = {star: f'rating_{star}_count' for star in STARS}
+
+
+def average(rating_sum, rating_count):
+    # 0 for products without reviews, the division gives NULL there
+    return Coalesce(
+        Round(Cast(rating_sum, FloatField()) / NullIf(rating_count, 0), 2),
+        Value(0.0),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def apply_change(product_id, old_rating=None, new_rating=None):
+    '''
+    Moves the statistics of a product for one review going from
+    `old_rating` to `new_rating` (None for a review created or deleted).
+    '''
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    sum_delta = (new_rating or 0) - (old_rating or 0)
+    if not count_delta and not sum_delta:
+        return
+
+    updates = {
+        'rating_count': F('rating_count') + count_delta,
+        'rating_sum': F('rating_sum') + sum_delta,
+        # F() refers to the values before the update, so the deltas are added again here
+        'rating_avg': average(F('rating_sum') + sum_delta, F('rating_count') + count_delta),
+        'last_update': timezone.now(),
+    }
+    if old_rating in STAR_FIELDS:
+        updates[STAR_FIELDS[old_rating]] = F(STAR_FIELDS[old_rating]) - 1
+    if new_rating in STAR_FIELDS:
+        star_field = STAR_FIELDS[new_rating]
+        updates[star_field] = updates[star_field] + 1 if star_field in updates else F(star_field) + 1
+
+    if Product.objects.filter(pk=product_id).update(**updates):
+        cache.invalidate(cache.PRODUCTS)
+
+
+def _review_stat(aggregate):
+    return Coalesce(
+        Subquery(
+            Review.objects
+            .filter(product=OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(value=aggregate)
+            .values('value')
+        ),
+        0,
+        output_field=IntegerField(),
+    )
+
+
+def recompute(products=None, batch_size=1000):
+    '''
+    Recomputes the statistics of `products` (all by default) from their
+    reviews, one UPDATE per batch of product ids. Returns the number of
+    products updated.
+    '''
+    products = Product.objects.all() if products is None else products
+    ids = list(products.order_by('id').values_list('id', flat=True))
+
+    stats = {
+        'rating_count': _review_stat(Count('id')),
+        'rating_sum': _review_stat(Sum('rating')),
+        **{field: _review_stat(Count('id', filter=Q(rating=star))) for star, field in STAR_FIELDS.items()},
+    }
+    updated = 0
+    for start in range(0, len(ids), batch_size):
+        batch = Product.objects.filter(id__in=ids[start:start + batch_size])
+        updated += batch.update(**stats, last_update=timezone.now())
+        # a second statement, the first one's new values are what the average is built from
+        batch.update(rating_avg=average(F('rating_sum'), F('rating_count')))
+
+    if updated:
+        cache.invalidate(cache.PRODUCTS)
+    return updated
@@ -0,0 +1,95 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from . import cache, imaging
+from .models import Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDITIONS = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sizes():
+    return getattr(settings, 'PRODUCT_IMAGE_RENDITIONS', DEFAULT_RENDITIONS)
+
+
+def get_executor():
+    '''
+    The process pool is started lazily on first use. Workers are spawned
+    (not forked) so they never inherit the server's threads or database
+    connections.
+    '''
+    global _executor
+    if _executor is None:
+        # two requests uploading at once must not both start a pool
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=settings.PRODUCT_IMAGE_RENDITION_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _executor
+
+
+def schedule(image):
+    # the file and row have to be committed before a worker can see them
+    transaction.on_commit(partial(submit, image.pk, image.image.name))
+
+
+def delete_files(image):
+    # once the row is really gone, a rolled back delete keeps its files
+    names = [name for formats in image.renditions.values() for name in formats.values()]
+    transaction.on_commit(partial(_delete_files, names))
+
+
+def _delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def submit(image_id, source_name):
+    args = (str(settings.MEDIA_ROOT), source_name, image_id, get_sizes())
+
+    if not getattr(settings, 'PRODUCT_IMAGE_RENDITION_WORKERS', 0):
+        # inline mode, for tests
+        try:
+            store_result(image_id, source_name, imaging.render_renditions(*args))
+        except OSError:
+            logger.exception('Could not generate renditions for product image %s', image_id)
+        return
+
+    future = get_executor().submit(imaging.render_renditions, *args)
+    future.add_done_callback(partial(_on_done, image_id, source_name))
+
+
+def store_result(image_id, source_name, renditions):
+    # an image replaced in the meantime gets its own renditions, don't overwrite them
+    updated = ProductImage.objects \
+        .filter(pk=image_id, image=source_name) \
+        .update(renditions=renditions)
+    if updated:
+        product_id = ProductImage.objects.filter(pk=image_id).values_list('product_id', flat=True).first()
+        Product.objects.filter(pk=product_id).update(last_update=timezone.now())
+        cache.invalidate(cache.PRODUCTS)
+
+
+def _on_done(image_id, source_name, future):
+    # runs on the executor's callback thread, which has its own connection
+    try:
+        store_result(image_id, source_name, future.result())
+    except Exception:
+        logger.exception('Could not generate renditions for product image %s', image_id)
+    finally:
+        connections.close_all()
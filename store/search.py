@@ -0,0 +1,117 @@
+import re
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+from . import cache
+from .models import Product
+
+FTS_TABLE = 'store_product_fts'
+
+# bm25() column weights: a hit in the title counts ten times a hit in the description
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_available = {}
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    '''
+    True when the database is SQLite and the FTS5 table was created by the
+    migration (SQLite builds without FTS5 simply skip it).
+    '''
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+
+    key = (using, str(connection.settings_dict['NAME']))
+    if key not in _available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _available[key] = cursor.fetchone() is not None
+    return _available[key]
+
+
+def build_match_query(terms):
+    '''
+    Turns user input into a safe FTS5 query: every word is quoted (so FTS
+    syntax can't be injected) and used as a prefix, all words must match.
+    '''
+    words = re.findall(r'\w+', ' '.join(terms))
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def index_products(products, using=DEFAULT_DB_ALIAS):
+    rows = [(product.id, product.title, product.description) for product in products]
+    if not rows or not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)', rows)
+
+
+def remove_products(product_ids, using=DEFAULT_DB_ALIAS):
+    if not product_ids or not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+
+def rebuild_index(batch_size=2000, using=DEFAULT_DB_ALIAS):
+    '''
+    Re-creates the index from the product table, returns the number of
+    products indexed.
+    '''
+    if not is_available(using):
+        return 0
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    indexed = 0
+    batch = []
+    queryset = Product.objects.using(using).only('id', 'title', 'description').order_by('id')
+    for product in queryset.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) == batch_size:
+            index_products(batch, using)
+            indexed += len(batch)
+            batch = []
+    index_products(batch, using)
+    indexed += len(batch)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    cache.invalidate(cache.PRODUCTS)
+    return indexed
+
+
+class ProductSearchFilter(SearchFilter):
+    '''
+    `?search=` backed by the FTS5 index and ranked by BM25 (best match
+    first, unless the client asks for another `ordering`). Every word is
+    matched as a prefix, so `?search=blu shi` finds "Blue Shirt".
+
+    Falls back to DRF's `icontains` search over `search_fields` on
+    databases without the index.
+    '''
+
+    def filter_queryset(self, request, queryset, view):
+        match = build_match_query(self.get_search_terms(request))
+        if match is None:
+            return queryset
+        if not is_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        # the FTS table is only read in subqueries, so the queryset stays free to filter, order and paginate on search_rank
+        pk = f'"{queryset.model._meta.db_table}"."{queryset.model._meta.pk.column}"'
+        rank = RawSQL(
+            f'SELECT bm25({FTS_TABLE}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {pk}',
+            [match],
+            output_field=FloatField(),
+        )
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank).order_by('search_rank')
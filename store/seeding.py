@@ -0,0 +1,395 @@
+'''
+Synthetic store data for local load testing, see `python manage.py seed_store`.
+
+Rows are written with bulk_create and explicit primary keys, in chunks
+that can be generated by several processes at once. Every chunk has its
+own random generator seeded from (seed, kind, chunk), so the same seed on
+the same database always produces the same data, whatever the number of
+processes (only the ids of order items, cart items, reviews and tagged
+items, which the database assigns, depend on the order chunks finish in).
+Popularity follows a Zipf-like law: a few products get most of the
+orders, reviews and cart adds, and a few customers place most orders.
+'''
+import bisect
+import itertools
+import multiprocessing
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.db.models import signals as model_signals
+from django.utils import timezone
+from tags.models import Tag, TaggedItem
+from . import cache, counters, ratings, search, seedprocess
+from .models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product, Review
+from .signals import order_created
+
+# share of the target size per kind, orders and carts bring ~3 items each
+SHARES = {
+    'products': 0.04,
+    'customers': 0.03,  # plus as many users
+    'orders': 0.12,
+    'reviews': 0.15,
+    'carts': 0.03,
+    'tagged_items': 0.10,
+}
+ITEMS_PER_ORDER = (1, 5)
+ITEMS_PER_CART = (1, 5)
+PRODUCTS_PER_COLLECTION = 200
+TAGS = 200
+
+DEFAULT_SKEW = 1.1
+DEFAULT_CHUNK_SIZE = 20000
+BATCH_SIZE = 2000
+HISTORY_DAYS = 365
+
+# generated in this order, a stage only references rows of earlier stages
+STAGES = [
+    ['products', 'customers'],
+    ['orders', 'reviews', 'carts', 'tagged_items'],
+]
+
+# timestamps are generated too, instead of all being "now"
+GENERATED_TIMESTAMPS = [
+    (Product, 'created_at'), (Product, 'last_update'),
+    (Order, 'placed_at'), (Cart, 'created_at'), (Review, 'date'),
+]
+
+
+def sizes_for(target):
+    '''
+    Row counts per kind for about `target` rows in total.
+    '''
+    return {kind: max(1, int(target * share)) for kind, share in SHARES.items()}
+
+
+# ------------------------------ helpers
+
+class Zipf:
+    '''
+    Picks ids from `ids` (a range), the n-th one with a weight of 1/n^skew.
+    '''
+    def __init__(self, ids, skew=DEFAULT_SKEW):
+        self.ids = ids
+        self.cum_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, len(ids) + 1)))
+        self.total = self.cum_weights[-1]
+
+    def pick(self, rng):
+        return self.ids[bisect.bisect(self.cum_weights, rng.random() * self.total, hi=len(self.ids) - 1)]
+
+    def sample(self, rng, count):
+        # distinct ids, for rows unique per (parent, product)
+        picked = set()
+        for _ in range(count * 3):
+            picked.add(self.pick(rng))
+            if len(picked) == count:
+                break
+        return sorted(picked)
+
+
+def unit_price(product_id):
+    # a function of the id, so order items get their product's price without reading it back
+    return Decimal(100 + product_id * 7919 % 49900) / 100
+
+
+def _timestamp(rng, end):
+    return end - timedelta(seconds=rng.randrange(HISTORY_DAYS * 24 * 3600))
+
+
+@contextmanager
+def explicit_timestamps():
+    # auto_now(_add) would overwrite the generated values on bulk_create
+    fields = [model._meta.get_field(name) for model, name in GENERATED_TIMESTAMPS]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+@contextmanager
+def signals_suppressed():
+    '''
+    Disconnects every model signal receiver (and order_created) for the
+    block. bulk_create doesn't send post_save, but any per row save left in
+    here would otherwise create customers, index products or queue tasks.
+    '''
+    suppressed = [
+        model_signals.pre_save, model_signals.post_save,
+        model_signals.pre_delete, model_signals.post_delete,
+        model_signals.m2m_changed, order_created,
+    ]
+    saved = [signal.receivers for signal in suppressed]
+    for signal in suppressed:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in zip(suppressed, saved):
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+# ------------------------------ chunks
+# (plan, rng, first id, count) -> rows written; ids of parent rows are explicit, children get theirs from the database
+
+def _products(plan, rng, first, count):
+    collections = plan['ids']['collections']
+    end = plan['end']
+    products = []
+    for product_id in range(first, first + count):
+        created_at = _timestamp(rng, end)
+        products.append(Product(
+            id=product_id,
+            title=f'Product {product_id}',
+            slug=f'product-{product_id}',
+            description=f'Description of product {product_id}',
+            sku=f'SKU{product_id:010}',
+            unit_price=unit_price(product_id),
+            inventory=rng.randint(0, 1000),
+            collection_id=collections[rng.randrange(len(collections))],
+            created_at=created_at,
+            last_update=created_at,
+        ))
+    Product.objects.bulk_create(products, batch_size=BATCH_SIZE)
+    return count
+
+
+def _customers(plan, rng, first, count):
+    user_ids = plan['ids']['users']
+    User = get_user_model()
+    offset = first - plan['ids']['customers'].start
+    users, customers = [], []
+    for number in range(count):
+        user_id = user_ids[offset + number]
+        users.append(User(
+            id=user_id,
+            username=f'user{user_id}',
+            email=f'user{user_id}@example.com',
+            first_name=f'First{user_id}',
+            last_name=f'Last{user_id}',
+            password=plan['password'],
+            date_joined=_timestamp(rng, plan['end']),
+        ))
+        customers.append(Customer(
+            id=first + number,
+            user_id=user_id,
+            phone=f'555{user_id:07}',
+            membership=rng.choice('BBBSG'),
+        ))
+    User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+    Customer.objects.bulk_create(customers, batch_size=BATCH_SIZE)
+    return count * 2
+
+
+def _orders(plan, rng, first, count):
+    customers, products = plan['zipf']['customers'], plan['zipf']['products']
+    orders, items = [], []
+    for order_id in range(first, first + count):
+        orders.append(Order(
+            id=order_id,
+            customer_id=customers.pick(rng),
+            placed_at=_timestamp(rng, plan['end']),
+            payment_status=rng.choice('CCCCPF'),
+        ))
+        for product_id in products.sample(rng, rng.randint(*ITEMS_PER_ORDER)):
+            items.append(OrderItem(
+                order_id=order_id, product_id=product_id,
+                quantity=rng.randint(1, 5), unit_price=unit_price(product_id),
+            ))
+    Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+    OrderItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+    return len(orders) + len(items)
+
+
+def _reviews(plan, rng, first, count):
+    products = plan['zipf']['products']
+    Review.objects.bulk_create([
+        Review(
+            product_id=products.pick(rng),
+            # mostly good, like real reviews
+            rating=rng.choices(range(1, 6), weights=[1, 1, 2, 4, 6])[0],
+            title=f'Review {number}',
+            description='Generated review',
+            date=_timestamp(rng, plan['end']).date(),
+        )
+        for number in range(first, first + count)
+    ], batch_size=BATCH_SIZE)
+    return count
+
+
+def _carts(plan, rng, first, count):
+    products = plan['zipf']['products']
+    carts, items = [], []
+    for _ in range(count):
+        cart_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        # recent carts mostly, some old enough for sweep_carts
+        created_at = plan['end'] - timedelta(seconds=rng.randrange(60 * 24 * 3600))
+        carts.append(Cart(id=cart_id, created_at=created_at, last_activity=created_at))
+        for product_id in products.sample(rng, rng.randint(*ITEMS_PER_CART)):
+            items.append(CartItem(cart_id=cart_id, product_id=product_id, quantity=rng.randint(1, 3)))
+    Cart.objects.bulk_create(carts, batch_size=BATCH_SIZE)
+    CartItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+    return len(carts) + len(items)
+
+
+def _tagged_items(plan, rng, first, count):
+    products, tags = plan['zipf']['products'], plan['zipf']['tags']
+    pairs = {(tags.ids[rng.randrange(len(tags.ids))], products.pick(rng)) for _ in range(count)}
+    TaggedItem.objects.bulk_create([
+        TaggedItem(tag_id=tag_id, content_type_id=plan['product_type'], object_id=product_id)
+        for tag_id, product_id in sorted(pairs)
+    ], batch_size=BATCH_SIZE)
+    return len(pairs)
+
+
+GENERATORS = {
+    'products': _products,
+    'customers': _customers,
+    'orders': _orders,
+    'reviews': _reviews,
+    'carts': _carts,
+    'tagged_items': _tagged_items,
+}
+
+
+def generate(plan, kind, first, count, chunk):
+    '''
+    Writes one chunk in its own transaction, returns the rows written.
+    Runs in the seeding process or in a worker.
+    '''
+    rng = random.Random(f"{plan['seed']}:{kind}:{chunk}")
+    if 'zipf' not in plan:
+        ids = plan['ids']
+        plan['zipf'] = {
+            'products': Zipf(ids['products'], plan['skew']),
+            'customers': Zipf(ids['customers'], plan['skew']),
+            'tags': Zipf(ids['tags'], plan['skew']),
+        }
+    with explicit_timestamps(), signals_suppressed(), transaction.atomic():
+        return GENERATORS[kind](plan, rng, first, count)
+
+
+# ------------------------------ seeding
+
+def seed(sizes, random_seed=0, skew=DEFAULT_SKEW, processes=0, chunk_size=DEFAULT_CHUNK_SIZE, end=None, report=None):
+    '''
+    Adds `sizes` rows (see `sizes_for`) to the database next to any that
+    are there, then brings the derived data up to date: counters, ratings,
+    the search index and the planner statistics. `report(kind, rows,
+    seconds)` is called as kinds finish. Returns the plan, with the id
+    range of every kind in `plan['ids']`.
+    '''
+    sizes = {**{kind: 0 for kind in SHARES}, **sizes}
+    if sizes['products'] < 1 or sizes['customers'] < 1:
+        raise ValueError('At least one product and one customer are needed.')
+    # timestamps count back from midnight, pass `end` to get the same ones on another day
+    end = end or timezone.make_aware(datetime.combine(timezone.now().date(), datetime.min.time()))
+
+    with signals_suppressed():
+        collection_count = max(1, sizes['products'] // PRODUCTS_PER_COLLECTION)
+        first_collection = _next_id(Collection)
+        Collection.objects.bulk_create([
+            Collection(id=collection_id, title=f'Collection {collection_id}')
+            for collection_id in range(first_collection, first_collection + collection_count)
+        ])
+        first_tag = _next_id(Tag)
+        Tag.objects.bulk_create([Tag(id=tag_id, label=f'tag-{tag_id}') for tag_id in range(first_tag, first_tag + TAGS)])
+
+    ids = {
+        'collections': range(first_collection, first_collection + collection_count),
+        'tags': range(first_tag, first_tag + TAGS),
+    }
+    for kind, model in [('products', Product), ('customers', Customer), ('users', get_user_model()), ('orders', Order)]:
+        first = _next_id(model)
+        ids[kind] = range(first, first + sizes['customers' if kind == 'users' else kind])
+    plan = {
+        'seed': random_seed,
+        'skew': skew,
+        'end': end,
+        'ids': ids,
+        # hashing is slow on purpose, every generated user shares one password: "seed"
+        'password': make_password('seed', salt=f'seed{random_seed}'),
+        'product_type': ContentType.objects.get_for_model(Product).id,
+    }
+
+    pool = None
+    if processes > 0:
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=seedprocess.setup,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'storefront.settings'), plan),
+        )
+        # the seeding process may hold an open transaction or lock, the workers write on their own
+        connection.close()
+
+    try:
+        for stage in STAGES:
+            jobs = []
+            for kind in stage:
+                start = ids[kind].start if kind in ids else 0
+                for chunk, first in enumerate(range(start, start + sizes[kind], chunk_size)):
+                    jobs.append((kind, first, min(chunk_size, start + sizes[kind] - first), chunk))
+            started = time.perf_counter()
+            if pool is None:
+                written = [generate(plan, *job) for job in jobs]
+            else:
+                written = list(pool.map(seedprocess.generate, *zip(*jobs))) if jobs else []
+            if report:
+                for kind in stage:
+                    rows = sum(count for job, count in zip(jobs, written) if job[0] == kind)
+                    report(kind, rows, time.perf_counter() - started)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    started = time.perf_counter()
+    reset_sequences()
+    refresh_derived_data()
+    # recomputing the ratings stamped the products with the current time
+    Product.objects.filter(id__in=ids['products']).update(last_update=F('created_at'))
+    if report:
+        report('derived data', None, time.perf_counter() - started)
+    return plan
+
+
+def reset_sequences():
+    # the ids were set explicitly, databases with sequences (PostgreSQL) have to skip past them
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [Collection, Tag, Product, get_user_model(), Customer, Order],
+    )
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def refresh_derived_data():
+    # everything the signals would have maintained for rows saved one by one
+    counters.recount(counters.COLLECTION_PRODUCTS)
+    counters.recount(counters.CUSTOMER_ORDERS)
+    ratings.recompute()
+    search.rebuild_index()
+    # row counts for the query planner and store.pagination's estimates
+    if connection.vendor in ['sqlite', 'postgresql']:
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    cache.invalidate(cache.PRODUCTS, cache.COLLECTIONS)
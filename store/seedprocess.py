@@ -0,0 +1,25 @@
+'''
+Entry points for seed_store worker processes. Like core.taskprocess, this
+module imports nothing from Django at the top: spawned workers load it
+before Django is set up.
+'''
+_plan = None
+
+
+def setup(settings_module, plan):
+    global _plan
+    from core import taskprocess
+    taskprocess.setup(settings_module)
+    from django.conf import settings
+    # SQLite takes one writer at a time, the chunks queue up for the lock instead of failing
+    settings.SQLITE_PRAGMAS = {**getattr(settings, 'SQLITE_PRAGMAS', {}), 'busy_timeout': 10 * 60 * 1000}
+    _plan = plan
+
+
+def generate(kind, first, count, chunk):
+    from django.db import connections
+    from store import seeding
+    try:
+        return seeding.generate(_plan, kind, first, count, chunk)
+    finally:
+        connections.close_all()
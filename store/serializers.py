@@ -1,37 +1,72 @@
+from decimal import Decimal
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
 from django.db import transaction
+from django.db.models import Case, Count, F, Q, When
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from core.instrumentation import TimedSerializerMixin
 from .models import Cart, CartItem, Customer, Order, OrderItem, Product, Collection, ProductImage, Review
+from . import carts, exports
+from .cache import invalidate, PRODUCTS
 from .signals import order_created
 
 
 class CollectionSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(read_only = True)
+    products_count = serializers.IntegerField(read_only = True)
     
     class Meta:
         model = Collection
-        fields = ['id', 'title', 'description', 'featured_product']
+        fields = ['id', 'title', 'description', 'featured_product', 'products_count']
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # opt-in (?with_counts=true), the plain representation stays as it was
+        if not self.context.get('with_counts'):
+            self.fields.pop('products_count')
     
     def create(self, validated_data):
         return super().create(validated_data)
     
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
-        fields = [ 'id' , 'image']
+        fields = [ 'id' , 'image', 'renditions']
+    
+    def get_renditions(self, image):
+        # same url style as `image`: absolute when the request is available
+        request = self.context.get('request')
+        urls = {}
+        for rendition, files in image.renditions.items():
+            urls[rendition] = {}
+            for image_format, name in files.items():
+                url = default_storage.url(name)
+                urls[rendition][image_format] = request.build_absolute_uri(url) if request else url
+        return urls
         
     def create(self, validated_data):
         product_id = self.context['product_pk']
         return ProductImage.objects.create(product_id = product_id, **validated_data)
         
         
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many = True, read_only = True)
+    rating_histogram = serializers.DictField(child = serializers.IntegerField(), read_only = True)
+    tags = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
-        fields = ['id', 'title', 'description', 'slug', 'inventory', 'unit_price', 'collection', 'images']
+        fields = ['id', 'title', 'description', 'slug', 'inventory', 'unit_price', 'collection', 'images',
+                  'rating_avg', 'rating_count', 'rating_histogram', 'tags']
+
+    def get_tags(self, product):
+        # attached in bulk by the view (TaggedItem.objects.attach_tags)
+        return [tag.label for tag in getattr(product, 'tags', [])]
 
     # collection = serializers.HyperlinkedRelatedField(
     #     queryset=models.Collection.objects.all(),
@@ -39,6 +74,17 @@ class ProductSerializer(serializers.ModelSerializer):
     # )
  
     
+class ProductImportRowSerializer(serializers.Serializer):
+    # plain serializer on purpose: ModelSerializer would add a unique query per row for the slug
+    sku = serializers.CharField(max_length = 20)
+    title = serializers.CharField(max_length = 250)
+    description = serializers.CharField()
+    unit_price = serializers.DecimalField(max_digits = 6, decimal_places = 2, min_value = Decimal(1))
+    inventory = serializers.IntegerField(min_value = 0)
+    collection = serializers.IntegerField(required = False, allow_null = True)
+    slug = serializers.SlugField(required = False, allow_blank = True, allow_null = True, max_length = 50)
+    
+    
 class SimpleProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
@@ -60,7 +106,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         )
         
         
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     product = SimpleProductSerializer(read_only = True)
     total_price = serializers.SerializerMethodField()
 
@@ -73,7 +119,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         return obj.quantity * obj.product.unit_price
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     cart_items = CartItemSerializer(many=True, read_only = True)
     total_price = serializers.SerializerMethodField()
     
@@ -88,40 +134,95 @@ class CartSerializer(serializers.ModelSerializer):
         return sum(all_products_total_price)
     
     
-class AddCartItemSerializer(serializers.ModelSerializer):
+class AddCartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     product_id = serializers.IntegerField()
-    
-    def validate_product_id(self, pid):
-        if not Product.objects.filter(pk=pid).exists():
-            raise serializers.ValidationError('No product found with given product id')
-        return pid
+    quantity = serializers.IntegerField(min_value = 1, max_value = carts.MAX_QUANTITY)
     
     def save(self, **kwargs):
         cart_id = self.context['cart_id']
         product_id = self.validated_data['product_id']
         quantity = self.validated_data['quantity']
         
+        # one upsert adds to the quantity or creates the item, and skips unknown products/carts
         try:
-            #updating qty
-            cart_item = CartItem.objects.get(cart_id=cart_id, product_id = product_id)
-            cart_item.quantity += quantity
-            cart_item.save()
-            self.instance = cart_item
-        except CartItem.DoesNotExist:
-            #create new item
-            cart_item = CartItem.objects.create(cart_id=cart_id, **self.validated_data)
-            self.instance = cart_item # read docs about Models Serializer and its base save method
-            
+            items = carts.upsert_items(cart_id, {product_id: quantity})
+        except DjangoValidationError:
+            raise NotFound('No cart found with given cart id')  # not a UUID
+        except carts.QuantityLimitExceeded:
+            raise serializers.ValidationError({'quantity': [f'The cart can hold at most {carts.MAX_QUANTITY} of a product.']})
+        if not items:
+            # only failed adds pay for finding out why
+            if not Cart.objects.filter(pk = cart_id).exists():
+                raise NotFound('No cart found with given cart id')
+            raise serializers.ValidationError({'product_id': ['No product found with given product id']})
+        
+        self.instance = items[0]
         return self.instance
             
-            
     
     class Meta:
         model = CartItem
         fields = [ 'id', 'product_id', 'quantity']
         
         
-class UpdateCartItemSerializer(serializers.ModelSerializer):
+class CartItemLineSerializer(serializers.Serializer):
+    # one line of a bulk cart update (CartItemViewSet.create with a list)
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value = 1, max_value = carts.MAX_QUANTITY)
+
+
+class BulkCartItemSerializer(TimedSerializerMixin, serializers.Serializer):
+    MODE_MERGE = 'merge'
+    MODE_REPLACE = 'replace'
+    
+    mode = serializers.ChoiceField(choices = [MODE_MERGE, MODE_REPLACE], default = MODE_MERGE)
+    items = CartItemLineSerializer(many = True, allow_empty = True)
+    
+    def validate(self, attrs):
+        # merging adds repeated products up, like posting them one by one would;
+        # replacing sets each product to one quantity, so a product may appear once
+        replace = attrs['mode'] == self.MODE_REPLACE
+        quantities = {}
+        repeated = set()
+        for line in attrs['items']:
+            if line['product_id'] in quantities:
+                repeated.add(line['product_id'])
+            quantities[line['product_id']] = quantities.get(line['product_id'], 0) + line['quantity']
+        
+        if replace and repeated:
+            raise serializers.ValidationError({'items': [f'Products {sorted(repeated)} appear more than once.']})
+        too_many = sorted(product_id for product_id, quantity in quantities.items() if quantity > carts.MAX_QUANTITY)
+        if too_many:
+            raise serializers.ValidationError({'items': [f'Products {too_many} add up to more than {carts.MAX_QUANTITY}.']})
+        known = set(Product.objects.filter(pk__in = quantities.keys()).values_list('id', flat = True))
+        unknown = sorted(set(quantities) - known)
+        if unknown:
+            raise serializers.ValidationError({'items': [f'No products found with ids {unknown}.']})
+        return {**attrs, 'items': quantities}
+    
+    def save(self, **kwargs):
+        cart_id = self.context['cart_id']
+        quantities = self.validated_data['items']
+        replace = self.validated_data['mode'] == self.MODE_REPLACE
+        
+        try:
+            with transaction.atomic():
+                if replace:
+                    CartItem.objects \
+                        .filter(cart_id = cart_id) \
+                            .exclude(product_id__in = quantities.keys()) \
+                                .delete()
+                if quantities:
+                    carts.upsert_items(cart_id, quantities, replace = replace)
+                else:
+                    Cart.touch(cart_id)  # upsert_items does it otherwise
+        except carts.QuantityLimitExceeded as error:
+            # merged with what the cart already holds
+            raise serializers.ValidationError({'items': [f'Products {error.product_ids} would exceed {carts.MAX_QUANTITY} in the cart.']})
+        return cart_id
+
+
+class UpdateCartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     
     class Meta:
         model = CartItem
@@ -144,7 +245,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'unit_price', 'quantity']
         
         
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     
     items = OrderItemSerializer(many = True)
     
@@ -153,35 +254,60 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'customer', 'placed_at', 'payment_status', 'items'] 
   
   
-class UpdateOrderSerializer(serializers.ModelSerializer):
+class UpdateOrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['payment_status']
       
 
-class CreateOrderSerializer(serializers.Serializer):
+class OrderExportSerializer(serializers.Serializer):
+    # query parameters of the order export
+    export_format = serializers.ChoiceField(choices = exports.FORMATS, default = exports.FORMAT_NDJSON)
+    placed_after = serializers.DateField(required = False)
+    placed_before = serializers.DateField(required = False)
+    payment_status = serializers.ChoiceField(choices = Order.PAYMENT_STATUS_CHOICES, required = False)
+      
+
+class CreateOrderSerializer(TimedSerializerMixin, serializers.Serializer):
     cart_id = serializers.UUIDField()
     
     def validate_cart_id(self, cart_id):
-        if not Cart.objects.filter(pk = cart_id).exists():
+        # one round trip: None -> no cart, 0 -> empty cart
+        items_count = Cart.objects \
+            .filter(pk = cart_id) \
+                .annotate(items_count = Count('cart_items')) \
+                    .values_list('items_count', flat = True) \
+                        .first()
+        if items_count is None:
             raise serializers.ValidationError('No cart with given id found!')
-        if CartItem.objects.filter(cart_id = cart_id).count() == 0:
+        if items_count == 0:
             raise serializers.ValidationError('The cart is empty.')
         return cart_id
     
     def save(self, **kwargs):
         with transaction.atomic():
             cart_id = self.validated_data['cart_id']
-            user_id = self.context['user_id']
-            
-            customer= Customer.objects.get(user_id = user_id)
-            order = Order.objects.create(customer = customer)  # created an entry in database for order object
+            user_id = self.context.get('user_id')
             
+            # write first: on SQLite the transaction then waits for the write lock (busy_timeout),
+            # a transaction that has read already fails right away when another checkout wrote in between
+            Cart.touch(cart_id)
             
             # queryset for cart_items 
-            cart_items = CartItem.objects \
-                .select_related('product') \
-                    .filter(cart_id = cart_id)
+            cart_items = list(
+                CartItem.objects \
+                    .select_related('product') \
+                        .filter(cart_id = cart_id)
+            )
+            if not cart_items:
+                raise serializers.ValidationError({'cart_id': ['The cart is empty.']})
+            
+            reserve_inventory(cart_items)
+            
+            # the view passes it in from the token claims, saving a query
+            customer_id = self.context.get('customer_id') \
+                or Customer.objects.values_list('id', flat = True).get(user_id = user_id)
+            order = Order.objects.create(customer_id = customer_id)  # created an entry in database for order object
                     
             order_items = [
                 OrderItem( 
@@ -196,6 +322,41 @@ class CreateOrderSerializer(serializers.Serializer):
             
             Cart.objects.filter(pk = cart_id).delete()
             
-            order_created(self.__class__, order = order)
+            # send, not send_robust: a receiver that fails (e.g. queueing its task) rolls the order back
+            order_created.send(self.__class__, order = order)
             
-            return order
\ No newline at end of file
+            return order
+
+
+def reserve_inventory(cart_items):
+    '''
+    Decrements stock for every cart item with a single conditional UPDATE.
+    A row is only updated while it still has enough inventory, so if fewer
+    rows than items were updated someone else got there first and the
+    surrounding transaction is rolled back by the raised error.
+    '''
+    in_stock = Q()
+    new_inventory = []
+    for item in cart_items:
+        in_stock |= Q(pk = item.product_id, inventory__gte = item.quantity)
+        new_inventory.append(When(pk = item.product_id, then = F('inventory') - item.quantity))
+    
+    updated = Product.objects.filter(in_stock).update(
+        inventory = Case(*new_inventory, default = F('inventory')),
+        last_update = timezone.now(),
+    )
+    if updated == len(cart_items):
+        invalidate(PRODUCTS)
+        return
+    
+    # failure path only: report which products ran out
+    quantities = {item.product_id: item.quantity for item in cart_items}
+    short = Product.objects \
+        .filter(pk__in = quantities.keys()) \
+            .values_list('id', 'inventory')
+    raise serializers.ValidationError({
+        'cart_id': [
+            f'Not enough inventory for product {product_id} (available: {inventory}).'
+            for product_id, inventory in short if inventory < quantities[product_id]
+        ] or ['Not enough inventory.']
+    })
@@ -1,9 +1,113 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from store.models import Customer
+from django.utils import timezone
+from store import cache, counters, ratings, renditions, search
+from store.models import Collection, Customer, Order, Product, ProductImage, Promotion, Review
 
 @receiver(post_save, sender = settings.AUTH_USER_MODEL)
 def create_customer_for_new_user(sender, **kwargs):
     if kwargs['created']:
-        Customer.objects.create(user = kwargs['instance'])
\ No newline at end of file
+        Customer.objects.create(user = kwargs['instance'])
+
+
+# keeping the full text index in sync (bulk writes have to call store.search themselves)
+@receiver(post_save, sender = Product)
+def index_product(sender, instance, using, **kwargs):
+    search.index_products([instance], using)
+
+@receiver(post_delete, sender = Product)
+def unindex_product(sender, instance, using, **kwargs):
+    search.remove_products([instance.id], using)
+
+
+# invalidating cached catalog responses
+@receiver([post_save, post_delete], sender = Product)
+def invalidate_product_responses(sender, **kwargs):
+    # collections reference their featured product
+    cache.invalidate(cache.PRODUCTS, cache.COLLECTIONS)
+
+@receiver([post_save, post_delete], sender = ProductImage)
+@receiver([post_save, post_delete], sender = Promotion)
+def invalidate_product_related_responses(sender, **kwargs):
+    cache.invalidate(cache.PRODUCTS)
+
+@receiver([post_save, post_delete], sender = Collection)
+def invalidate_collection_responses(sender, **kwargs):
+    cache.invalidate(cache.COLLECTIONS)
+
+
+# images are part of the product representation, so they move its last_update (used as Last-Modified)
+@receiver([post_save, post_delete], sender = ProductImage)
+def touch_product(sender, instance, **kwargs):
+    Product.objects.filter(pk = instance.product_id).update(last_update = timezone.now())
+
+
+@receiver(pre_save, sender = ProductImage)
+def remember_previous_image(sender, instance, **kwargs):
+    instance._previous_image = None
+    if instance.pk is not None:
+        instance._previous_image = ProductImage.objects \
+            .filter(pk = instance.pk) \
+            .values_list('image', flat = True) \
+            .first()
+
+# only new or replaced images are rendered again
+@receiver(post_save, sender = ProductImage)
+def generate_renditions(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_previous_image', None) != instance.image.name:
+        renditions.schedule(instance)
+
+@receiver(post_delete, sender = ProductImage)
+def delete_renditions(sender, instance, **kwargs):
+    renditions.delete_files(instance)
+
+
+
+# rating statistics on Product (store.ratings), moved by the difference every review write makes
+@receiver(pre_save, sender = Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk is not None:
+        instance._previous_rating = Review.objects \
+            .filter(pk = instance.pk) \
+            .values_list('product_id', 'rating') \
+            .first()
+
+@receiver(post_save, sender = Review)
+def update_product_rating(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is None:
+        ratings.apply_change(instance.product_id, new_rating = instance.rating)
+    elif previous[0] != instance.product_id:
+        ratings.apply_change(previous[0], old_rating = previous[1])
+        ratings.apply_change(instance.product_id, new_rating = instance.rating)
+    else:
+        ratings.apply_change(instance.product_id, old_rating = previous[1], new_rating = instance.rating)
+
+@receiver(post_delete, sender = Review)
+def remove_product_rating(sender, instance, **kwargs):
+    ratings.apply_change(instance.product_id, old_rating = instance.rating)
+
+
+
+# materialized counters (store.counters): products per collection, orders per customer
+@receiver(post_save, sender = Product)
+def count_product(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_loaded_collection_id', instance.collection_id)
+    counters.adjust(counters.COLLECTION_PRODUCTS, counters.moved(previous, instance.collection_id))
+    instance._loaded_collection_id = instance.collection_id
+
+@receiver(post_delete, sender = Product)
+def uncount_product(sender, instance, **kwargs):
+    counters.adjust(counters.COLLECTION_PRODUCTS, counters.moved(instance.collection_id, None))
+
+@receiver(post_save, sender = Order)
+def count_order(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_loaded_customer_id', instance.customer_id)
+    counters.adjust(counters.CUSTOMER_ORDERS, counters.moved(previous, instance.customer_id))
+    instance._loaded_customer_id = instance.customer_id
+
+@receiver(post_delete, sender = Order)
+def uncount_order(sender, instance, **kwargs):
+    counters.adjust(counters.CUSTOMER_ORDERS, counters.moved(instance.customer_id, None))
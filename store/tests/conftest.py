@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from rest_framework.test import APIClient
 import pytest
 
@@ -12,4 +13,18 @@ def api_client():
 def authenticate(api_client):
     def do_authenticate(is_staff = False):
         return api_client.force_authenticate(user=User(is_staff=is_staff))
-    return do_authenticate
\ No newline at end of file
+    return do_authenticate
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # cached responses must not leak between tests that reuse the same ids
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    # uploads stay out of the project's media folder, images are rendered inline
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    settings.PRODUCT_IMAGE_RENDITION_WORKERS = 0
+    return settings.MEDIA_ROOT
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+from model_bakery import baker
+from store.models import Collection, Order, Product
+from store.pagination import EstimatedCountPaginator
+
+
+@pytest.fixture
+def admin_client(client):
+    client.force_login(baker.make(settings.AUTH_USER_MODEL, is_staff=True, is_superuser=True))
+    return client
+
+
+def make_customers(quantity):
+    return [user.customer for user in baker.make(settings.AUTH_USER_MODEL, _quantity=quantity)]
+
+
+def make_products(quantity):
+    return baker.make(Product, collection=baker.make(Collection), _quantity=quantity)
+
+
+def make_orders(quantity):
+    return [baker.make(Order, customer=customer) for customer in make_customers(quantity)]
+
+
+@pytest.mark.django_db
+class TestChangelistQueries:
+
+    # session, user, count(s), page, plus whatever list filters need
+    @pytest.mark.parametrize('path, make_rows, budget', [
+        ('/admin/store/product/', make_products, 7),
+        ('/admin/store/order/', make_orders, 6),
+        ('/admin/store/customer/', make_customers, 6),
+        ('/admin/store/collection/', lambda quantity: baker.make(Collection, _quantity=quantity), 5),
+    ])
+    def test_query_count_is_constant_and_within_budget(self, admin_client, path, make_rows, budget):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = admin_client.get(path)
+            assert response.status_code == 200
+            return len(queries)
+
+        make_rows(2)
+        few = count_queries()
+        make_rows(8)
+        many = count_queries()
+
+        assert many == few
+        assert many <= budget
+
+    def test_big_changelist_does_not_count_the_table(self, admin_client, monkeypatch):
+        monkeypatch.setattr(EstimatedCountPaginator, 'exact_count_limit', 5)
+        make_orders(7)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = admin_client.get('/admin/store/order/')
+
+        assert response.status_code == 200
+        assert not [q for q in queries if 'COUNT(*)' in q['sql'] and 'store_order' in q['sql']]
+
+
+@pytest.mark.django_db
+class TestEstimatedCountPaginator:
+
+    def test_small_tables_are_counted_exactly(self):
+        products = make_products(3)
+        Product.objects.filter(pk=products[0].pk).delete()
+
+        assert EstimatedCountPaginator(Product.objects.order_by('id'), 10).count == 2
+
+    def test_big_unfiltered_tables_are_estimated(self, monkeypatch):
+        monkeypatch.setattr(EstimatedCountPaginator, 'exact_count_limit', 2)
+        products = make_products(3)
+        Product.objects.filter(pk=products[0].pk).delete()
+
+        # an upper bound from the highest id, deleted rows are still counted
+        assert EstimatedCountPaginator(Product.objects.order_by('id'), 10).count == products[-1].id
+
+    def test_filtered_querysets_are_counted_exactly(self, monkeypatch):
+        monkeypatch.setattr(EstimatedCountPaginator, 'exact_count_limit', 2)
+        make_products(3)
+
+        queryset = Product.objects.filter(collection__isnull=False).order_by('id')
+
+        assert EstimatedCountPaginator(queryset, 10).count == 3
@@ -0,0 +1,147 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+import pytest
+from model_bakery import baker
+from store.models import Order
+
+
+@pytest.fixture
+def user():
+    user = baker.make(settings.AUTH_USER_MODEL, username='jane')
+    user.set_password('secret-pass')
+    user.save()
+    return user
+
+
+@pytest.fixture
+def obtain_tokens(api_client, user):
+    def do_obtain_tokens():
+        response = api_client.post('/auth/jwt/create/', {'username': 'jane', 'password': 'secret-pass'})
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+    return do_obtain_tokens
+
+
+@pytest.mark.django_db
+class TestTokenClaims:
+
+    def test_access_token_carries_customer_id_and_staff_flag(self, obtain_tokens, user):
+        access = AccessToken(obtain_tokens()['access'])
+
+        assert access['customer_id'] == user.customer.id
+        assert access['is_staff'] is False
+
+    def test_refreshed_access_token_gets_current_claims(self, api_client, obtain_tokens, user):
+        refresh = obtain_tokens()['refresh']
+        user.is_staff = True
+        user.save()
+
+        response = api_client.post('/auth/jwt/refresh/', {'refresh': refresh})
+
+        access = AccessToken(response.data['access'])
+        assert access['customer_id'] == user.customer.id
+        assert access['is_staff'] is True
+
+    def test_orders_and_me_do_not_look_up_the_customer(self, api_client, obtain_tokens, user):
+        api_client.credentials(HTTP_AUTHORIZATION=f"JWT {obtain_tokens()['access']}")
+        baker.make(Order, customer=user.customer)
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            orders = api_client.get('/store/orders/')
+            me = api_client.get('/store/customers/me/')
+
+        assert orders.data['count'] == 1
+        assert me.data['id'] == user.customer.id
+        customer_lookups = [q['sql'] for q in queries if 'FROM "store_customer"' in q['sql']]
+        # only `me` itself, which loads the customer by primary key
+        assert len(customer_lookups) == 1
+
+
+@pytest.mark.django_db
+class TestCustomerIdFallback:
+
+    def test_session_users_get_their_orders(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        baker.make(Order, customer=user.customer)
+        baker.make(Order, customer=baker.make(settings.AUTH_USER_MODEL).customer)
+
+        response = api_client.get('/store/orders/')
+
+        assert response.data['count'] == 1
+
+
+def user_queries(queries):
+    return [q['sql'] for q in queries if 'FROM "core_user"' in q['sql']]
+
+
+@pytest.mark.django_db
+class TestStatelessAuthentication:
+
+    @pytest.fixture
+    def jwt_client(self, api_client, obtain_tokens):
+        api_client.credentials(HTTP_AUTHORIZATION=f"JWT {obtain_tokens()['access']}")
+        return api_client
+
+    def test_catalog_and_orders_do_not_load_the_user(self, jwt_client):
+        with CaptureQueriesContext(connection) as queries:
+            products = jwt_client.get('/store/product/')
+            orders = jwt_client.get('/store/orders/')
+
+        assert products.status_code == orders.status_code == status.HTTP_200_OK
+        assert user_queries(queries) == []
+
+    def test_staff_flag_is_checked_against_the_user(self, api_client, obtain_tokens, user):
+        user.is_staff = True
+        user.save()
+        api_client.credentials(HTTP_AUTHORIZATION=f"JWT {obtain_tokens()['access']}")
+        baker.make(Order, customer=baker.make(settings.AUTH_USER_MODEL).customer)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get('/store/orders/')
+
+        assert response.data['count'] == 1
+        assert len(user_queries(queries)) == 1
+
+    @pytest.mark.parametrize('change', [{'is_active': False}, {'is_staff': False}])
+    def test_deactivated_or_demoted_staff_lose_admin_access(self, api_client, obtain_tokens, user, change):
+        user.is_staff = True
+        user.save()
+        api_client.credentials(HTTP_AUTHORIZATION=f"JWT {obtain_tokens()['access']}")
+        order = baker.make(Order, customer=baker.make(settings.AUTH_USER_MODEL).customer)
+        assert api_client.get('/store/orders/export/').status_code == status.HTTP_200_OK
+
+        for field, value in change.items():
+            setattr(user, field, value)
+        user.save()
+        response = api_client.patch(f'/store/orders/{order.id}/', {'payment_status': 'C'})
+
+        assert response.status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+        order.refresh_from_db()
+        assert order.payment_status != 'C'
+
+    def test_user_is_loaded_once_when_a_view_needs_it(self, jwt_client):
+        with CaptureQueriesContext(connection) as queries:
+            first = jwt_client.get('/auth/users/me/')
+            second = jwt_client.get('/auth/users/me/')
+
+        assert first.data['username'] == second.data['username'] == 'jane'
+        assert len(user_queries(queries)) == 1
+
+    def test_views_can_update_the_user(self, jwt_client, user):
+        response = jwt_client.patch('/auth/users/me/', {'first_name': 'Janet'})
+
+        assert response.status_code == status.HTTP_200_OK
+        user.refresh_from_db()
+        assert user.first_name == 'Janet'
+
+    def test_deleted_user_is_rejected_when_loaded(self, jwt_client, user):
+        user.delete()
+
+        response = jwt_client.get('/auth/users/me/')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
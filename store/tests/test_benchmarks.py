@@ -0,0 +1,88 @@
+import json
+from django.core.management import call_command
+from django.core.management.base import CommandError
+import pytest
+from store import benchmarks
+from store.models import Order, Product
+
+SIZES = {'products': 20, 'customers': 3, 'orders': 10, 'reviews': 20, 'tagged_items': 10}
+
+
+def summary(**values):
+    return {'p95_ms': 10.0, 'requests_per_second': 100.0, 'max_queries': 3, 'errors': 0, **values}
+
+
+class TestCompare:
+
+    def test_changes_within_the_tolerance_are_not_regressions(self):
+        baseline = {'results': {'server': {'product-list': summary()}}}
+        results = {'results': {'server': {'product-list': summary(p95_ms=11.5, requests_per_second=85.0)}}}
+
+        assert benchmarks.compare(results, baseline, tolerance=0.2) == []
+
+    def test_reports_slower_responses_and_more_queries(self):
+        baseline = {'results': {'server': {'product-list': summary()}}}
+        results = {'results': {'server': {'product-list': summary(p95_ms=15.0, requests_per_second=50.0, max_queries=4)}}}
+
+        regressions = benchmarks.compare(results, baseline, tolerance=0.2)
+
+        assert len(regressions) == 3
+        assert all(message.startswith('server product-list') for message in regressions)
+
+    def test_scenarios_missing_from_the_baseline_are_skipped(self):
+        results = {'results': {'inprocess': {'checkout': summary(errors=5)}}}
+
+        assert benchmarks.compare(results, {'results': {}}) == []
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+
+    assert benchmarks.percentile(values, 50) == 50
+    assert benchmarks.percentile(values, 99) == 99
+    assert benchmarks.percentile([7], 95) == 7
+
+
+# the requests run on other threads, which can only see committed data
+@pytest.mark.django_db(transaction=True)
+class TestRun:
+
+    def test_seed_creates_the_requested_sizes(self):
+        benchmarks.seed(SIZES)
+
+        assert Product.objects.count() == 20
+        assert Order.objects.count() == 10
+
+    @pytest.mark.parametrize('mode', benchmarks.MODES)
+    def test_records_latency_throughput_and_queries(self, settings, mode):
+        settings.ALLOWED_HOSTS = ['testserver', '127.0.0.1']
+        dataset = benchmarks.seed(SIZES)
+
+        results = benchmarks.run(
+            dataset, scenarios=['product-detail', 'checkout'], modes=[mode], requests=5, concurrency=1, warmup=1,
+        )
+
+        for name in ['product-detail', 'checkout']:
+            result = results['results'][mode][name]
+            assert result['requests'] == 5
+            assert result['errors'] == 0
+            assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+            assert result['requests_per_second'] > 0
+            assert result['max_queries'] > 0
+        assert Order.objects.count() == 10 + 5 + 1
+
+
+def test_command_fails_on_regressions(tmp_path, monkeypatch):
+    results = {'results': {'inprocess': {'product-list': summary(max_queries=9)}}}
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps({'results': {'inprocess': {'product-list': summary()}}}))
+    # the seeding and measuring are covered above
+    monkeypatch.setattr(benchmarks, 'seed', lambda *args, **kwargs: {})
+    monkeypatch.setattr(benchmarks, 'run', lambda *args, **kwargs: results)
+    monkeypatch.setattr('django.db.backends.base.creation.BaseDatabaseCreation.create_test_db', lambda *args, **kwargs: None)
+    monkeypatch.setattr('django.db.backends.base.creation.BaseDatabaseCreation.destroy_test_db', lambda *args, **kwargs: None)
+
+    with pytest.raises(CommandError, match='3 -> 9 queries'):
+        call_command('benchmark_api', '--output', str(tmp_path / 'results.json'), '--baseline', str(baseline))
+
+    assert json.loads((tmp_path / 'results.json').read_text()) == results
@@ -0,0 +1,76 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store.models import Collection, Product, ProductImage, Promotion
+
+
+@pytest.fixture(params=['locmem', 'filebased'])
+def catalog_cache(request, settings, tmp_path):
+    backends = {
+        'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'filebased': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path)},
+    }
+    settings.CACHES = {'default': backends[request.param]}
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures('catalog_cache')
+class TestCatalogCache:
+
+    def test_repeated_list_is_served_without_queries(self, api_client, django_assert_num_queries):
+        baker.make(Product, _quantity=3)
+        first = api_client.get('/store/product/', {'ordering': 'title'})
+
+        with django_assert_num_queries(0):
+            second = api_client.get('/store/product/', {'ordering': 'title'})
+
+        assert second.status_code == status.HTTP_200_OK
+        assert second.data == first.data
+
+    def test_query_string_is_part_of_the_key(self, api_client):
+        cheap = baker.make(Product, unit_price=5)
+        baker.make(Product, unit_price=50)
+
+        api_client.get('/store/product/')
+        response = api_client.get('/store/product/', {'unit_price__lte': 10})
+
+        assert [p['id'] for p in response.data['results']] == [cheap.id]
+
+    def test_product_save_invalidates_list_and_detail(self, api_client):
+        product = baker.make(Product, title='Old')
+        api_client.get('/store/product/')
+        api_client.get(f'/store/product/{product.id}/')
+
+        product.title = 'New'
+        product.save()
+
+        assert api_client.get('/store/product/').data['results'][0]['title'] == 'New'
+        assert api_client.get(f'/store/product/{product.id}/').data['title'] == 'New'
+
+    def test_image_write_invalidates_products(self, api_client):
+        product = baker.make(Product)
+        api_client.get(f'/store/product/{product.id}/')
+
+        ProductImage.objects.create(product=product, image='store/images/test.jpg')
+
+        assert len(api_client.get(f'/store/product/{product.id}/').data['images']) == 1
+
+    def test_promotion_write_invalidates_products(self, api_client):
+        product = baker.make(Product)
+        api_client.get(f'/store/product/{product.id}/')
+
+        baker.make(Promotion)
+
+        with CaptureQueriesContext(connection) as queries:
+            api_client.get(f'/store/product/{product.id}/')
+        assert len(queries) > 0
+
+    def test_collection_delete_invalidates_collections(self, api_client):
+        collection = baker.make(Collection)
+        assert api_client.get('/store/collections/').data['count'] == 1
+
+        collection.delete()
+
+        assert api_client.get('/store/collections/').data['count'] == 0
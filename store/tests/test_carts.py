@@ -0,0 +1,299 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+import json
+import time
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store import carts
+from store.models import Cart, CartItem, Product
+
+
+@pytest.fixture
+def make_cart():
+    def do_make_cart(idle_days=0, items=1):
+        cart = baker.make(Cart)
+        if items:
+            baker.make(CartItem, cart=cart, quantity=1, _quantity=items)
+        Cart.objects.filter(pk=cart.pk).update(last_activity=timezone.now() - timedelta(days=idle_days))
+        return cart
+    return do_make_cart
+
+
+@pytest.mark.django_db
+class TestLastActivity:
+
+    def test_adding_an_item_moves_last_activity(self, api_client, make_cart):
+        cart = make_cart(idle_days=3, items=0)
+
+        response = api_client.post(
+            f'/store/cart/{cart.id}/items/',
+            {'product_id': baker.make(Product).id, 'quantity': 1},
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        cart.refresh_from_db()
+        assert timezone.now() - cart.last_activity < timedelta(minutes=1)
+
+
+@pytest.mark.django_db
+class TestSweep:
+
+    def test_deletes_expired_carts_and_their_items_only(self, make_cart):
+        expired = [make_cart(idle_days=40, items=2) for _ in range(5)]
+        fresh = make_cart(idle_days=1, items=2)
+
+        result = carts.sweep(batch_size=2)
+
+        assert result.as_dict()['carts_deleted'] == 5
+        assert result.items == 10
+        assert result.batches == 3
+        assert not Cart.objects.filter(id__in=[cart.id for cart in expired]).exists()
+        assert list(Cart.objects.all()) == [fresh]
+        assert CartItem.objects.count() == 2
+
+    def test_batch_queries_do_not_grow_with_items(self, make_cart):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                carts.sweep(batch_size=10)
+            return len(queries)
+
+        make_cart(idle_days=40, items=1)
+        few = count_queries()
+        for _ in range(5):
+            make_cart(idle_days=40, items=10)
+        many = count_queries()
+
+        assert many == few
+
+    def test_dry_run_deletes_nothing(self, make_cart):
+        make_cart(idle_days=40, items=3)
+
+        result = carts.sweep(dry_run=True)
+
+        assert (result.carts, result.items) == (1, 3)
+        assert Cart.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_sweep_carts_command_reports_metrics(make_cart):
+    make_cart(idle_days=10, items=2)
+    out = StringIO()
+
+    call_command('sweep_carts', '--days', '7', '--json', stdout=out)
+
+    metrics = json.loads(out.getvalue())
+    assert metrics['carts_deleted'] == 1
+    assert metrics['items_deleted'] == 2
+
+
+@pytest.fixture
+def add_item(api_client):
+    def do_add_item(cart_id, product_id, quantity=1):
+        return api_client.post(f'/store/cart/{cart_id}/items/', {'product_id': product_id, 'quantity': quantity})
+    return do_add_item
+
+
+@pytest.mark.django_db
+class TestAddCartItem:
+
+    def test_adding_a_product_twice_adds_up_the_quantity(self, add_item):
+        cart = baker.make(Cart)
+        product = baker.make(Product)
+
+        first = add_item(cart.id, product.id, 2)
+        second = add_item(cart.id, product.id, 3)
+
+        assert first.status_code == second.status_code == status.HTTP_201_CREATED
+        assert second.data == {'id': first.data['id'], 'product_id': product.id, 'quantity': 5}
+        assert CartItem.objects.get().quantity == 5
+
+    def test_add_is_one_statement_plus_the_activity_update(self, add_item):
+        cart = baker.make(Cart)
+        product = baker.make(Product)
+
+        with CaptureQueriesContext(connection) as queries:
+            add_item(cart.id, product.id)
+
+        assert len(queries) == 2
+
+    def test_unknown_product_returns_400(self, add_item):
+        cart = baker.make(Cart)
+
+        response = add_item(cart.id, 999)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['product_id'] is not None
+        assert not CartItem.objects.exists()
+
+    @pytest.mark.parametrize('cart_id', ['6f1c5cb4-1c8b-4f6c-bd6e-2f7a9d0f0c11', 'not-a-uuid'])
+    def test_unknown_cart_returns_404(self, add_item, cart_id):
+        response = add_item(cart_id, baker.make(Product).id)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert not CartItem.objects.exists()
+
+
+# outside of the test's transaction, like a request: the failed add rolls back the transaction it runs in
+@pytest.mark.django_db(transaction=True)
+def test_adding_past_the_quantity_limit_returns_400(add_item):
+    cart = baker.make(Cart)
+    product = baker.make(Product)
+    add_item(cart.id, product.id, 32000)
+
+    response = add_item(cart.id, product.id, 1000)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data['quantity'] is not None
+    assert CartItem.objects.get().quantity == 32000
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_adds_of_the_same_product_end_up_in_one_item():
+    cart = baker.make(Cart)
+    product = baker.make(Product)
+
+    def add(_):
+        try:
+            for _ in range(500):
+                try:
+                    return carts.upsert_items(cart.id, {product.id: 1})
+                except OperationalError:
+                    # the test database only allows one writer at a time
+                    time.sleep(0.005)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(add, range(20)))
+
+    assert CartItem.objects.get(cart=cart).quantity == 20
+
+
+@pytest.fixture
+def bulk_items(api_client):
+    def do_bulk_items(cart_id, lines, mode=None):
+        url = f'/store/cart/{cart_id}/items/' + (f'?mode={mode}' if mode else '')
+        return api_client.post(url, lines, format='json')
+    return do_bulk_items
+
+
+@pytest.mark.django_db
+class TestBulkCartItems:
+
+    def test_merge_adds_to_existing_items(self, bulk_items):
+        cart = baker.make(Cart)
+        kept, added = baker.make(Product, _quantity=2)
+        baker.make(CartItem, cart=cart, product=kept, quantity=2)
+
+        response = bulk_items(cart.id, [
+            {'product_id': kept.id, 'quantity': 1},
+            {'product_id': added.id, 'quantity': 2},
+            {'product_id': added.id, 'quantity': 3},
+        ])
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['id'] == str(cart.id)
+        quantities = {item['product']['id']: item['quantity'] for item in response.data['cart_items']}
+        assert quantities == {kept.id: 3, added.id: 5}
+
+    def test_replace_sets_quantities_and_drops_missing_products(self, bulk_items):
+        cart = baker.make(Cart)
+        dropped, kept, added = baker.make(Product, _quantity=3)
+        baker.make(CartItem, cart=cart, product=dropped, quantity=1)
+        baker.make(CartItem, cart=cart, product=kept, quantity=4)
+
+        response = bulk_items(cart.id, [
+            {'product_id': kept.id, 'quantity': 1},
+            {'product_id': added.id, 'quantity': 2},
+        ], mode='replace')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert dict(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity')) == {kept.id: 1, added.id: 2}
+
+    def test_replace_with_no_lines_empties_the_cart(self, bulk_items, make_cart):
+        cart = make_cart(idle_days=3, items=2)
+
+        response = bulk_items(cart.id, [], mode='replace')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['cart_items'] == []
+        cart.refresh_from_db()
+        assert timezone.now() - cart.last_activity < timedelta(minutes=1)
+
+    def test_unknown_product_changes_nothing(self, bulk_items):
+        cart = baker.make(Cart)
+        product = baker.make(Product)
+        baker.make(CartItem, cart=cart, product=product, quantity=1)
+
+        response = bulk_items(cart.id, [
+            {'product_id': product.id, 'quantity': 5},
+            {'product_id': 999, 'quantity': 1},
+        ], mode='replace')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert '999' in str(response.data['items'])
+        assert CartItem.objects.get().quantity == 1
+
+    def test_replace_rejects_repeated_products(self, bulk_items):
+        cart = baker.make(Cart)
+        product = baker.make(Product)
+
+        response = bulk_items(cart.id, [
+            {'product_id': product.id, 'quantity': 2},
+            {'product_id': product.id, 'quantity': 3},
+        ], mode='replace')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert str(product.id) in str(response.data['items'])
+        assert not CartItem.objects.exists()
+
+    @pytest.mark.parametrize('in_cart, lines', [
+        (0, [30000, 3000]),  # the lines add up past the limit
+        (30000, [3000]),  # so do the line and the cart
+    ])
+    def test_merge_past_the_quantity_limit_changes_nothing(self, bulk_items, in_cart, lines):
+        cart = baker.make(Cart)
+        product, other = baker.make(Product, _quantity=2)
+        if in_cart:
+            baker.make(CartItem, cart=cart, product=product, quantity=in_cart)
+
+        response = bulk_items(cart.id, [{'product_id': other.id, 'quantity': 1}] + [
+            {'product_id': product.id, 'quantity': quantity} for quantity in lines
+        ])
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert str(product.id) in str(response.data['items'])
+        assert list(CartItem.objects.values_list('product_id', 'quantity')) == ([(product.id, in_cart)] if in_cart else [])
+
+    @pytest.mark.parametrize('mode, lines', [
+        ('swap', []),
+        ('merge', [{'product_id': 1, 'quantity': 0}]),
+    ])
+    def test_invalid_request_returns_400(self, bulk_items, mode, lines):
+        response = bulk_items(baker.make(Cart).id, lines, mode=mode)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.parametrize('cart_id', ['6f1c5cb4-1c8b-4f6c-bd6e-2f7a9d0f0c11', 'not-a-uuid'])
+    def test_unknown_cart_returns_404(self, bulk_items, cart_id):
+        response = bulk_items(cart_id, [{'product_id': baker.make(Product).id, 'quantity': 1}])
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_queries_do_not_grow_with_lines(self, bulk_items):
+        cart = baker.make(Cart)
+        products = baker.make(Product, _quantity=20)
+
+        def count_queries(products):
+            with CaptureQueriesContext(connection) as queries:
+                response = bulk_items(cart.id, [{'product_id': p.id, 'quantity': 1} for p in products], mode='replace')
+            assert response.status_code == status.HTTP_200_OK
+            return len(queries)
+
+        assert count_queries(products[:2]) == count_queries(products)
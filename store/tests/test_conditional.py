@@ -0,0 +1,97 @@
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store.models import Cart, CartItem, Collection, Product, ProductImage
+
+
+@pytest.mark.django_db
+class TestProductConditionalGet:
+
+    def test_detail_returns_304_for_matching_etag(self, api_client, django_assert_num_queries):
+        product = baker.make(Product)
+        first = api_client.get(f'/store/product/{product.id}/')
+
+        with django_assert_num_queries(1):
+            response = api_client.get(f'/store/product/{product.id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_detail_returns_304_for_if_modified_since(self, api_client):
+        product = baker.make(Product)
+        first = api_client.get(f'/store/product/{product.id}/')
+
+        response = api_client.get(f'/store/product/{product.id}/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_detail_etag_changes_when_product_or_images_change(self, api_client):
+        product = baker.make(Product)
+        etag = api_client.get(f'/store/product/{product.id}/')['ETag']
+
+        ProductImage.objects.create(product=product, image='store/images/test.jpg')
+        response = api_client.get(f'/store/product/{product.id}/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    def test_missing_product_still_returns_404(self, api_client):
+        assert api_client.get('/store/product/999/').status_code == status.HTTP_404_NOT_FOUND
+        assert api_client.get('/store/product/abc/').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_list_etag_follows_query_params_and_deletes(self, api_client):
+        products = baker.make(Product, _quantity=2)
+        etag = api_client.get('/store/product/')['ETag']
+
+        assert api_client.get('/store/product/', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+        assert api_client.get('/store/product/', {'page': 1}, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+        products[0].delete()
+        assert api_client.get('/store/product/', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+    def test_list_is_validated_without_queries(self, api_client, django_assert_num_queries):
+        baker.make(Product, _quantity=2)
+        etag = api_client.get('/store/product/', {'ordering': 'title', 'pagination': 'cursor'})['ETag']
+
+        # same parameters in another order
+        with django_assert_num_queries(0):
+            response = api_client.get('/store/product/?pagination=cursor&ordering=title', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db
+class TestCollectionConditionalGet:
+
+    def test_etag_changes_after_write(self, api_client):
+        collection = baker.make(Collection)
+        etag = api_client.get(f'/store/collections/{collection.id}/')['ETag']
+
+        assert api_client.get(f'/store/collections/{collection.id}/', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+
+        collection.title = 'Renamed'
+        collection.save()
+        assert api_client.get(f'/store/collections/{collection.id}/', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestCartConditionalGet:
+
+    def test_etag_changes_with_items_and_prices(self, api_client):
+        cart = baker.make(Cart)
+        item = baker.make(CartItem, cart=cart, quantity=1)
+        etag = api_client.get(f'/store/cart/{cart.id}/')['ETag']
+
+        assert api_client.get(f'/store/cart/{cart.id}/', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+
+        item.quantity = 2
+        item.save()
+        response = api_client.get(f'/store/cart/{cart.id}/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+
+        item.product.unit_price += 1
+        item.product.save()
+        assert api_client.get(f'/store/cart/{cart.id}/', HTTP_IF_NONE_MATCH=response['ETag']).status_code == status.HTTP_200_OK
+
+    def test_unknown_cart_returns_404(self, api_client):
+        assert api_client.get('/store/cart/not-a-uuid/').status_code == status.HTTP_404_NOT_FOUND
+        assert api_client.get('/store/cart/6f1c5cb4-1c8b-4f6c-bd6e-2f7a9d0f0c11/').status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,105 @@
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store import importers
+from store.models import Collection, Customer, Order, Product
+
+
+def products_count(collection):
+    collection.refresh_from_db()
+    return collection.products_count
+
+
+@pytest.fixture
+def customer():
+    return baker.make(settings.AUTH_USER_MODEL).customer
+
+
+@pytest.mark.django_db
+class TestCollectionProductsCount:
+
+    def test_create_move_and_delete(self):
+        shirts, hats = baker.make(Collection, _quantity=2)
+        product = baker.make(Product, collection=shirts)
+        baker.make(Product, collection=shirts)
+
+        assert products_count(shirts) == 2
+
+        product = Product.objects.get(pk=product.pk)
+        product.collection = hats
+        product.save()
+
+        assert (products_count(shirts), products_count(hats)) == (1, 1)
+
+        product.delete()
+
+        assert products_count(hats) == 0
+
+    def test_saving_a_loaded_collection_keeps_the_count(self):
+        collection = baker.make(Collection)
+        stale = Collection.objects.get(pk=collection.pk)
+        baker.make(Product, collection=collection)
+
+        stale.title = 'renamed'
+        stale.save()
+
+        assert products_count(collection) == 1
+
+    def test_bulk_import_adjusts_counts(self):
+        shirts, hats = baker.make(Collection, _quantity=2)
+        baker.make(Product, sku='A1', collection=shirts)
+        rows = [
+            (1, {'sku': 'A1', 'title': 'a', 'description': 'a', 'unit_price': '5', 'inventory': 1, 'collection': hats.id}),
+            (2, {'sku': 'B2', 'title': 'b', 'description': 'b', 'unit_price': '5', 'inventory': 1, 'collection': hats.id}),
+        ]
+
+        importers.ProductImporter().run(rows)
+
+        assert (products_count(shirts), products_count(hats)) == (0, 2)
+
+    def test_collection_can_include_the_count(self, api_client):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, _quantity=3)
+
+        plain = api_client.get(f'/store/collections/{collection.id}/')
+        counted = api_client.get(f'/store/collections/{collection.id}/', {'with_counts': 'true'})
+
+        assert plain.status_code == counted.status_code == status.HTTP_200_OK
+        assert 'products_count' not in plain.data
+        assert counted.data['products_count'] == 3
+
+
+@pytest.mark.django_db
+class TestCustomerOrdersCount:
+
+    def test_checkout_and_delete(self, customer):
+        order = baker.make(Order, customer=customer)
+        baker.make(Order, customer=customer)
+        customer.refresh_from_db()
+
+        assert customer.orders_count == 2
+
+        order.delete()
+        customer.refresh_from_db()
+
+        assert customer.orders_count == 1
+
+
+@pytest.mark.django_db
+def test_recount_fixes_drift(customer):
+    collection = baker.make(Collection)
+    baker.make(Product, collection=collection, _quantity=2)
+    baker.make(Order, customer=customer)
+    Collection.objects.update(products_count=9)
+    Customer.objects.filter(pk=customer.pk).update(orders_count=0)
+    out = StringIO()
+
+    call_command('recount', stdout=out)
+
+    customer.refresh_from_db()
+    assert products_count(collection) == 2
+    assert customer.orders_count == 1
+    assert 'collection products_count: 1 rows corrected' in out.getvalue()
@@ -0,0 +1,140 @@
+import sqlite3
+from django.db import connection, connections, transaction
+from django.db.utils import ConnectionHandler
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from core import db
+from store.models import Cart, Collection, Order, Product, Review
+
+
+@pytest.fixture
+def replica(tmp_path, settings):
+    '''
+    A `replica` alias backed by a copy of the test database in a local
+    SQLite file. Rows created by the test afterwards only exist on the
+    primary, which tells where a read was sent.
+    '''
+    path = tmp_path / 'replica.sqlite3'
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    connection.connection.backup(target)
+    target.close()
+
+    connections.settings['replica'] = {**connection.settings_dict, 'NAME': str(path), 'TEST': {}}
+    settings.DATABASE_REPLICAS = ['replica']
+    db.unpin()
+    yield 'replica'
+    connections['replica'].close()
+    del connections['replica']
+    del connections.settings['replica']
+    db.unpin()
+
+
+# not wrapped in a transaction: reads inside one always use the primary
+@pytest.mark.django_db(transaction=True)
+class TestPrimaryReplicaRouter:
+
+    def test_catalog_reads_go_to_a_replica(self, replica):
+        product = baker.make(Product)
+        db.unpin()
+
+        assert Product.objects.all().db == replica
+        assert not Product.objects.filter(pk=product.pk).exists()
+
+    def test_other_reads_and_all_writes_go_to_the_primary(self, replica):
+        assert Order.objects.all().db == 'default'
+        assert Cart.objects.all().db == 'default'
+        assert Collection.objects.create(title='a')._state.db == 'default'
+        assert not db.is_pinned()
+
+    def test_reads_after_a_write_go_to_the_primary(self, replica):
+        product = baker.make(Product)
+        db.unpin()
+
+        with db.pin_after_writes():
+            assert not Product.objects.filter(pk=product.pk).exists()
+            Product.objects.filter(pk=product.pk).update(title='changed')
+
+            assert Product.objects.get(pk=product.pk).title == 'changed'
+
+    def test_reads_inside_a_transaction_go_to_the_primary(self, replica):
+        product = baker.make(Product)
+        db.unpin()
+
+        with transaction.atomic():
+            assert Product.objects.filter(pk=product.pk).exists()
+
+    def test_without_replicas_everything_uses_the_primary(self):
+        db.unpin()
+
+        assert Product.objects.all().db == 'default'
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPrimaryPinMiddleware:
+
+    def test_get_reads_the_catalog_from_a_replica(self, api_client, replica):
+        review = baker.make(Review)
+
+        response = api_client.get(f'/store/product/{review.product_id}/reviews/?ordering=rating')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'] == []
+
+    def test_cached_responses_are_read_from_the_primary(self, api_client, replica):
+        # the replica hasn't caught up with the new product, its stale answer must not be served or cached
+        product = baker.make(Product)
+
+        response = api_client.get(f'/store/product/{product.id}/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert api_client.get(f'/store/product/{product.id}/').data == response.data
+
+    def test_writing_request_reads_from_the_primary(self, api_client, replica):
+        cart = baker.make(Cart)
+        product = baker.make(Product)
+
+        response = api_client.post(f'/store/cart/{cart.id}/items/', {'product_id': product.id, 'quantity': 1})
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+
+def test_sqlite_pragmas_are_applied_to_new_connections(tmp_path, settings, django_db_blocker):
+    settings.SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 1234}
+    handler = ConnectionHandler({
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(tmp_path / 'db.sqlite3')},
+    })
+
+    with django_db_blocker.unblock():
+        with handler['default'].cursor() as cursor:
+            results = {}
+            for pragma in ['journal_mode', 'synchronous', 'busy_timeout']:
+                cursor.execute(f'PRAGMA {pragma}')
+                results[pragma] = cursor.fetchone()[0]
+        handler.close_all()
+
+    # synchronous = NORMAL reads back as 1
+    assert results == {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 1234}
+
+
+def test_replicas_only_get_the_read_side_pragmas(tmp_path, settings, django_db_blocker):
+    settings.SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 1234}
+    settings.DATABASE_REPLICAS = ['replica']
+    path = tmp_path / 'replica.sqlite3'
+    sqlite3.connect(path).close()
+    handler = ConnectionHandler({
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(tmp_path / 'db.sqlite3')},
+        'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path)},
+    })
+
+    with django_db_blocker.unblock():
+        with handler['replica'].cursor() as cursor:
+            results = {}
+            for pragma in ['journal_mode', 'busy_timeout', 'query_only']:
+                cursor.execute(f'PRAGMA {pragma}')
+                results[pragma] = cursor.fetchone()[0]
+        handler.close_all()
+
+    assert results == {'journal_mode': 'delete', 'busy_timeout': 1234, 'query_only': 1}
+    assert not path.with_name('replica.sqlite3-wal').exists()
@@ -0,0 +1,85 @@
+import csv
+from datetime import timedelta
+from io import StringIO
+import json
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store.models import Order, OrderItem
+
+
+def read_stream(response):
+    return b''.join(response.streaming_content).decode()
+
+
+@pytest.fixture
+def orders():
+    customer = baker.make(settings.AUTH_USER_MODEL).customer
+    first, second, empty = baker.make(Order, customer=customer, _quantity=3)
+    baker.make(OrderItem, order=first, quantity=1, unit_price=10, _quantity=2)
+    baker.make(OrderItem, order=second, quantity=3, unit_price=5)
+    Order.objects.filter(pk=empty.pk).update(
+        placed_at=timezone.now() - timedelta(days=10),
+        payment_status=Order.PAYMENT_STATUS_COMPLETE,
+    )
+    return first, second, empty
+
+
+@pytest.mark.django_db
+class TestOrderExport:
+
+    def test_if_user_is_not_admin_returns_403(self, authenticate, api_client):
+        authenticate()
+
+        response = api_client.get('/store/orders/export/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_ndjson_has_one_line_per_order_with_items(self, authenticate, api_client, orders):
+        authenticate(is_staff=True)
+        first, second, empty = orders
+
+        response = api_client.get('/store/orders/export/')
+        lines = [json.loads(line) for line in read_stream(response).splitlines()]
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert [(line['id'], len(line['items'])) for line in lines] == [(first.id, 2), (second.id, 1), (empty.id, 0)]
+
+    def test_csv_has_one_row_per_item(self, authenticate, api_client, orders):
+        authenticate(is_staff=True)
+
+        response = api_client.get('/store/orders/export/', {'export_format': 'csv'})
+        rows = list(csv.DictReader(StringIO(read_stream(response))))
+
+        assert len(rows) == 4
+        assert rows[-1]['item_id'] == ''
+
+    def test_filters_by_date_and_payment_status(self, authenticate, api_client, orders):
+        authenticate(is_staff=True)
+        today = timezone.now().date()
+
+        recent = read_stream(api_client.get('/store/orders/export/', {'placed_after': today}))
+        complete = read_stream(api_client.get('/store/orders/export/', {'payment_status': 'C'}))
+
+        assert len(recent.splitlines()) == 2
+        assert [json.loads(line)['id'] for line in complete.splitlines()] == [orders[2].id]
+
+    def test_invalid_params_return_400(self, authenticate, api_client):
+        authenticate(is_staff=True)
+
+        response = api_client.get('/store/orders/export/', {'placed_after': 'yesterday'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_export_command_writes_file(orders, tmp_path):
+    path = tmp_path / 'orders.csv'
+
+    call_command('export_orders', '--format', 'csv', '--output', str(path), '--chunk-size', '1')
+
+    assert len(path.read_text().splitlines()) == 5
@@ -0,0 +1,114 @@
+from io import BytesIO, StringIO
+import os
+import threading
+import time
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from PIL import Image
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store import imaging, renditions
+from store.models import Product, ProductImage
+
+
+def make_image_file(name='shirt.jpg', size=(800, 400), mode='RGB', image_format='JPEG'):
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@pytest.mark.django_db
+class TestImageRenditions:
+
+    def test_upload_records_renditions_after_commit(self, api_client, media_root, django_capture_on_commit_callbacks):
+        product = baker.make(Product)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(f'/store/product/{product.id}/images/', {'image': make_image_file()}, format='multipart')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        image = ProductImage.objects.get()
+        assert set(image.renditions) == {'thumbnail', 'medium'}
+        with Image.open(os.path.join(media_root, image.renditions['thumbnail']['webp'])) as thumbnail:
+            assert (thumbnail.format, thumbnail.size) == ('WEBP', (150, 150))
+
+    def test_renditions_are_listed_with_the_product(self, api_client, django_capture_on_commit_callbacks):
+        product = baker.make(Product)
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.post(f'/store/product/{product.id}/images/', {'image': make_image_file()}, format='multipart')
+
+        response = api_client.get(f'/store/product/{product.id}/')
+
+        urls = response.data['images'][0]['renditions']['medium']
+        assert urls['jpeg'].startswith('http://testserver/media/')
+        assert urls['webp'].endswith('.webp')
+
+    def test_renditions_follow_image_changes_only(self, api_client, media_root, django_capture_on_commit_callbacks, monkeypatch):
+        product = baker.make(Product)
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.post(f'/store/product/{product.id}/images/', {'image': make_image_file()}, format='multipart')
+        image = ProductImage.objects.get()
+        scheduled = []
+        monkeypatch.setattr(renditions, 'schedule', scheduled.append)
+
+        image.save()
+        assert scheduled == []
+
+        image.image = make_image_file('hat.jpg')
+        image.save()
+        assert scheduled == [image]
+
+    def test_deleting_the_image_deletes_its_renditions(self, api_client, media_root, django_capture_on_commit_callbacks):
+        product = baker.make(Product)
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.post(f'/store/product/{product.id}/images/', {'image': make_image_file()}, format='multipart')
+        image = ProductImage.objects.get()
+        paths = [os.path.join(media_root, name) for formats in image.renditions.values() for name in formats.values()]
+        assert all(os.path.exists(path) for path in paths)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            image.delete()
+
+        assert not any(os.path.exists(path) for path in paths)
+
+    def test_transparent_images_keep_alpha(self, media_root):
+        os.makedirs(os.path.join(media_root, 'store/images'))
+        make = make_image_file('logo.png', mode='RGBA', image_format='PNG')
+        with open(os.path.join(media_root, 'store/images/logo.png'), 'wb') as file:
+            file.write(make.read())
+
+        renditions = imaging.render_renditions(media_root, 'store/images/logo.png', 1, {'thumbnail': (50, 50)})
+
+        assert set(renditions['thumbnail']) == {'png', 'webp'}
+
+    def test_command_backfills_missing_renditions(self, media_root):
+        product = baker.make(Product)
+        # saved outside a commit, so nothing was rendered yet
+        image = ProductImage.objects.create(product=product, image=make_image_file())
+
+        call_command('generate_renditions', '--workers', '0', stdout=StringIO())
+
+        image.refresh_from_db()
+        assert set(image.renditions) == {'thumbnail', 'medium'}
+
+
+def test_concurrent_first_use_starts_one_pool(monkeypatch):
+    pools = []
+
+    def slow_pool(**kwargs):
+        time.sleep(0.05)  # lets the other threads get past the first check
+        pools.append(object())
+        return pools[-1]
+    monkeypatch.setattr(renditions, 'ProcessPoolExecutor', slow_pool)
+    monkeypatch.setattr(renditions, '_executor', None)
+    executors = []
+
+    threads = [threading.Thread(target=lambda: executors.append(renditions.get_executor())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(pools) == 1
+    assert executors == pools * 4
@@ -0,0 +1,139 @@
+from io import BytesIO, StringIO
+import json
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store.importers import ProductImporter, SlugAllocator, read_rows
+from store.models import Collection, Product
+
+
+CSV_HEADER = 'sku,title,description,unit_price,inventory,collection,slug\n'
+
+
+def import_csv(text, **kwargs):
+    return ProductImporter(**kwargs).run(read_rows(BytesIO((CSV_HEADER + text).encode()), 'csv'))
+
+
+@pytest.fixture
+def upload_products(api_client):
+    def do_upload_products(name, content):
+        return api_client.post(
+            '/store/product/import/',
+            {'file': SimpleUploadedFile(name, content.encode())},
+            format='multipart',
+        )
+    return do_upload_products
+
+
+@pytest.mark.django_db
+class TestProductImporter:
+
+    def test_creates_and_updates_keyed_on_sku(self):
+        existing = baker.make(Product, sku='A1', title='Old', slug='old')
+        collection = baker.make(Collection)
+
+        result = import_csv(
+            f'A1,New,Desc,10.00,5,{collection.id},\n'
+            'B2,Shirt,Desc,12.50,3,,\n'
+        )
+
+        assert (result.created, result.updated, result.error_count) == (1, 1, 0)
+        existing.refresh_from_db()
+        assert (existing.title, existing.slug, existing.collection_id) == ('New', 'old', collection.id)
+        assert Product.objects.get(sku='B2').slug == 'shirt'
+
+    def test_bad_rows_are_reported_without_aborting(self):
+        result = import_csv(
+            'A1,Shirt,Desc,0.50,5,,\n'
+            'B2,Hat,Desc,10,5,999,\n'
+            'C3,Mug,Desc,10,5,,\n'
+        )
+
+        assert result.created == 1
+        assert [error['line'] for error in result.errors] == [2, 3]
+        assert 'unit_price' in result.errors[0]['errors']
+        assert 'collection' in result.errors[1]['errors']
+
+    def test_slug_collisions_get_a_suffix(self):
+        baker.make(Product, slug='shirt')
+        baker.make(Product, slug='shirt-4')
+
+        import_csv('A1,Shirt,Desc,10,1,,\nB2,Shirt,Desc,10,1,,\nC3,Hat,Desc,10,1,,shirt\n', batch_size=2)
+
+        slugs = dict(Product.objects.filter(sku__in=['A1', 'B2', 'C3']).values_list('sku', 'slug'))
+        assert slugs == {'A1': 'shirt-5', 'B2': 'shirt-6', 'C3': 'shirt-7'}
+
+    def test_rows_the_database_rejects_are_reported_without_aborting(self, monkeypatch):
+        assign = SlugAllocator.assign
+
+        # another writer takes B2's slug between allocating and inserting it, every time
+        def assign_and_steal(self, products):
+            assign(self, products)
+            for product in products:
+                if product.sku == 'B2':
+                    baker.make(Product, slug=product.slug)
+        monkeypatch.setattr(SlugAllocator, 'assign', assign_and_steal)
+
+        result = import_csv('A1,Shirt,Desc,10,1,,\nB2,Hat,Desc,10,1,,\nC3,Mug,Desc,10,1,,\nD4,Cap,Desc,10,1,,\n', batch_size=3)
+
+        assert (result.created, result.error_count) == (3, 1)
+        assert result.errors[0]['line'] == 3
+        assert set(Product.objects.filter(sku__in=['A1', 'B2', 'C3', 'D4']).values_list('sku', flat=True)) == {'A1', 'C3', 'D4'}
+
+    def test_queries_per_batch_do_not_grow_with_rows(self, django_assert_max_num_queries):
+        collection = baker.make(Collection)
+        rows = ''.join(f'S{n},Product {n},Desc,10,1,{collection.id},\n' for n in range(200))
+
+        # validation, collections, existing skus, slugs, insert, index, savepoints
+        with django_assert_max_num_queries(12):
+            result = import_csv(rows, batch_size=500)
+
+        assert result.created == 200
+
+    def test_ndjson_rows_and_unparsable_lines(self):
+        lines = [
+            json.dumps({'sku': 'A1', 'title': 'Shirt', 'description': 'D', 'unit_price': '10', 'inventory': 1}),
+            '{not json',
+        ]
+        result = ProductImporter().run(read_rows(BytesIO('\n'.join(lines).encode()), 'ndjson'))
+
+        assert result.created == 1
+        assert result.errors[0]['line'] == 2
+
+    def test_imported_products_are_searchable(self, api_client):
+        import_csv('A1,Striped Shirt,Desc,10,1,,\n')
+
+        assert api_client.get('/store/product/', {'search': 'strip'}).data['count'] == 1
+
+
+@pytest.mark.django_db
+class TestImportEndpoint:
+
+    def test_if_user_is_not_admin_returns_403(self, authenticate, upload_products):
+        authenticate()
+
+        response = upload_products('products.csv', CSV_HEADER)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_admin_upload_returns_report(self, authenticate, upload_products):
+        authenticate(is_staff=True)
+
+        response = upload_products('products.csv', CSV_HEADER + 'A1,Shirt,Desc,10,1,,\nB2,,Desc,10,1,,\n')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['created'] == 1
+        assert response.data['error_count'] == 1
+
+
+@pytest.mark.django_db
+def test_import_command(tmp_path):
+    path = tmp_path / 'products.ndjson'
+    path.write_text(json.dumps({'sku': 'A1', 'title': 'Shirt', 'description': 'D', 'unit_price': '10', 'inventory': 1}))
+    out = StringIO()
+
+    call_command('import_products', str(path), stdout=out, stderr=StringIO())
+
+    assert '1 created' in out.getvalue()
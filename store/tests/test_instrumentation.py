@@ -0,0 +1,133 @@
+import logging
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+from model_bakery import baker
+from core import instrumentation
+from store.models import Cart, CartItem, Collection, Order, OrderItem, Product
+from store.views import CartViewSet, OrderViewSet, ProductViewSet
+
+
+@pytest.fixture
+def products():
+    return baker.make(Product, collection=baker.make(Collection), unit_price=10, inventory=100, _quantity=20)
+
+
+@pytest.mark.django_db
+class TestRequestMetrics:
+
+    def test_counts_the_queries_of_the_request(self, api_client, products):
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get('/store/product/')
+
+        metrics = response.wsgi_request.metrics
+        assert metrics.queries == len(queries)
+        assert metrics.view_name == 'ProductViewSet.list'
+        assert metrics.seconds['total'] >= metrics.seconds['view'] >= metrics.seconds['serializer'] > 0
+        assert metrics.seconds['db'] > 0
+
+    def test_headers_are_opt_in(self, api_client, settings):
+        settings.REQUEST_TIMING_HEADERS = False
+        response = api_client.get('/store/collections/')
+
+        assert 'Server-Timing' not in response
+        assert instrumentation.QUERY_COUNT_HEADER not in response
+
+    def test_headers(self, api_client, settings, products):
+        settings.REQUEST_TIMING_HEADERS = True
+
+        response = api_client.get(f'/store/product/{products[0].id}/')
+
+        names = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        assert names == ['db', 'serializer', 'view', 'total']
+        assert response[instrumentation.QUERY_COUNT_HEADER] == str(response.wsgi_request.metrics.queries)
+
+    def test_requests_over_budget_are_logged(self, api_client, settings, products, caplog):
+        settings.REQUEST_BUDGETS = {**settings.REQUEST_BUDGETS, 'QUERIES': 1}
+
+        with caplog.at_level(logging.WARNING, logger='core.instrumentation'):
+            api_client.get('/store/collections/')  # no budget of its own
+            api_client.get('/store/product/')  # budget of 6
+
+        assert len(caplog.records) == 1
+        assert '/store/collections/ (CollectionViewSet.list)' in caplog.records[0].getMessage()
+
+    def test_view_budgets_override_the_settings(self):
+        assert instrumentation.get_query_budget(ProductViewSet, 'list') == ProductViewSet.query_budgets['list']
+        assert instrumentation.get_query_budget(ProductViewSet, 'destroy') == instrumentation.get_budgets()['QUERIES']
+
+    def test_nested_timings_are_counted_once(self):
+        metrics = instrumentation.RequestMetrics()
+        token = instrumentation._metrics.set(metrics)
+        try:
+            with instrumentation.timed('serializer'):
+                with instrumentation.timed('serializer'):
+                    inner = metrics.seconds['serializer']
+        finally:
+            instrumentation._metrics.reset(token)
+
+        assert inner == 0
+        assert metrics.seconds['serializer'] > 0
+
+
+# every request of the views below runs at most its view's query_budgets entry,
+# and as many queries with a little data as with a lot
+@pytest.mark.django_db
+class TestQueryBudgets:
+
+    def count_queries(self, response, view_class):
+        assert response.status_code < 400
+        metrics = response.wsgi_request.metrics
+        action = metrics.view_name.split('.')[1]
+        assert action in view_class.query_budgets
+        assert metrics.queries <= metrics.query_budget, f'{metrics.view_name}: {metrics.queries} queries'
+        return metrics.queries
+
+    def assert_same_at_both_sizes(self, count_requests):
+        assert count_requests(2) == count_requests(20)
+
+    def test_products(self, api_client):
+        def count_requests(size):
+            products = baker.make(Product, collection=baker.make(Collection), unit_price=10, inventory=100, _quantity=size)
+            for product in products:
+                baker.make('store.ProductImage', product=product, image='store/images/a.jpg')
+            return [
+                self.count_queries(api_client.get('/store/product/'), ProductViewSet),
+                self.count_queries(api_client.get('/store/product/?page_size=10&ordering=unit_price'), ProductViewSet),
+                self.count_queries(api_client.get(f'/store/product/{products[0].id}/'), ProductViewSet),
+            ]
+
+        self.assert_same_at_both_sizes(count_requests)
+
+    def test_carts(self, api_client):
+        def count_requests(size):
+            response = api_client.post('/store/cart/')
+            counts = [self.count_queries(response, CartViewSet)]
+            cart_id = response.data['id']
+            for product in baker.make(Product, _quantity=size):
+                baker.make(CartItem, cart_id=cart_id, product=product, quantity=1)
+            return counts + [
+                self.count_queries(api_client.get(f'/store/cart/{cart_id}/'), CartViewSet),
+                self.count_queries(api_client.delete(f'/store/cart/{cart_id}/'), CartViewSet),
+            ]
+
+        self.assert_same_at_both_sizes(count_requests)
+
+    def test_orders(self, api_client):
+        def count_requests(size):
+            user = baker.make(settings.AUTH_USER_MODEL)
+            api_client.force_authenticate(user=user)
+            products = baker.make(Product, unit_price=10, inventory=100, _quantity=size)
+            cart = baker.make(Cart)
+            for product in products:
+                baker.make(CartItem, cart=cart, product=product, quantity=1)
+            for order in baker.make(Order, customer=user.customer, _quantity=size):
+                baker.make(OrderItem, order=order, product=products[0], quantity=1, unit_price=1, _quantity=size)
+            return [
+                self.count_queries(api_client.get('/store/orders/'), OrderViewSet),
+                self.count_queries(api_client.get(f'/store/orders/{order.id}/'), OrderViewSet),
+                self.count_queries(api_client.post('/store/orders/', {'cart_id': str(cart.id)}, format='json'), OrderViewSet),
+            ]
+
+        self.assert_same_at_both_sizes(count_requests)
@@ -0,0 +1,183 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+from django.conf import settings
+from django.db import connection, OperationalError
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status, serializers
+import pytest
+from model_bakery import baker
+from store.models import Cart, CartItem, Order, OrderItem, Product
+from store.serializers import CreateOrderSerializer
+
+
+@pytest.fixture
+def user():
+    return baker.make(settings.AUTH_USER_MODEL)
+
+
+@pytest.fixture
+def make_cart():
+    def do_make_cart(*lines):
+        cart = baker.make(Cart)
+        for product, quantity in lines:
+            baker.make(CartItem, cart=cart, product=product, quantity=quantity)
+        return cart
+    return do_make_cart
+
+
+@pytest.fixture
+def checkout(api_client, user):
+    def do_checkout(cart_id):
+        api_client.force_authenticate(user=user)
+        return api_client.post('/store/orders/', {'cart_id': str(cart_id)}, format='json')
+    return do_checkout
+
+
+@pytest.mark.django_db
+class TestCheckout:
+
+    def test_if_cart_does_not_exist_returns_400(self, checkout):
+        response = checkout('6f1c5cb4-1c8b-4f6c-bd6e-2f7a9d0f0c11')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['cart_id'] is not None
+
+    def test_if_cart_is_empty_returns_400(self, checkout):
+        response = checkout(baker.make(Cart).id)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_checkout_decrements_inventory_and_deletes_cart(self, checkout, make_cart):
+        shirt = baker.make(Product, inventory=5)
+        hat = baker.make(Product, inventory=3)
+        cart = make_cart((shirt, 2), (hat, 3))
+
+        response = checkout(cart.id)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['items']) == 2
+        shirt.refresh_from_db()
+        hat.refresh_from_db()
+        assert (shirt.inventory, hat.inventory) == (3, 0)
+        assert not Cart.objects.filter(pk=cart.id).exists()
+
+    def test_insufficient_inventory_returns_400_and_changes_nothing(self, checkout, make_cart):
+        shirt = baker.make(Product, inventory=5)
+        hat = baker.make(Product, inventory=1)
+        cart = make_cart((shirt, 2), (hat, 2))
+
+        response = checkout(cart.id)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        shirt.refresh_from_db()
+        assert shirt.inventory == 5
+        assert not Order.objects.exists()
+        assert Cart.objects.filter(pk=cart.id).exists()
+
+    def test_query_count_does_not_grow_with_cart_size(self, user, make_cart, django_assert_max_num_queries):
+        def run_checkout(cart):
+            serializer = CreateOrderSerializer(data={'cart_id': cart.id}, context={'user_id': user.id})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        small = make_cart((baker.make(Product, inventory=10), 1))
+        # includes the savepoints, the cart lock and the customer's orders_count update
+        with django_assert_max_num_queries(14) as small_queries:
+            run_checkout(small)
+
+        large = make_cart(*[(product, 1) for product in baker.make(Product, inventory=10, _quantity=20)])
+        with django_assert_max_num_queries(14) as large_queries:
+            run_checkout(large)
+
+        assert len(large_queries) == len(small_queries)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_checkouts_never_oversell(make_cart):
+    stock = 10
+    product = baker.make(Product, inventory=stock)
+    users = baker.make(settings.AUTH_USER_MODEL, _quantity=25)
+    carts = [make_cart((product, 1)) for _ in users]
+
+    def run_checkout(user, cart):
+        try:
+            for _ in range(500):
+                try:
+                    serializer = CreateOrderSerializer(data={'cart_id': cart.id}, context={'user_id': user.id})
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+                    return True
+                except serializers.ValidationError:
+                    return False
+                except OperationalError:
+                    # the test database only allows one writer at a time, retry like a client would
+                    time.sleep(0.005)
+            return False
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(run_checkout, users, carts))
+
+    product.refresh_from_db()
+    sold = OrderItem.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+    assert product.inventory >= 0
+    assert sold == sum(results) == stock
+    assert product.inventory == 0
+
+
+@pytest.fixture
+def make_orders():
+    def do_make_orders(customer, orders, items_per_order):
+        for order in baker.make(Order, customer=customer, _quantity=orders):
+            baker.make(OrderItem, order=order, quantity=1, unit_price=1, _quantity=items_per_order)
+    return do_make_orders
+
+
+@pytest.mark.django_db
+class TestOrderQueries:
+
+    def count_queries(self, api_client, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(path)
+        assert response.status_code == status.HTTP_200_OK
+        return len(queries)
+
+    def test_staff_list_query_count_is_constant(self, api_client, user, make_orders):
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL, is_staff=True))
+        make_orders(user.customer, orders=2, items_per_order=1)
+        few = self.count_queries(api_client, '/store/orders/')
+
+        make_orders(user.customer, orders=10, items_per_order=5)
+        many = self.count_queries(api_client, '/store/orders/')
+
+        assert many == few
+
+    def test_customer_list_is_paginated_and_constant(self, api_client, user, make_orders):
+        api_client.force_authenticate(user=user)
+        make_orders(user.customer, orders=1, items_per_order=1)
+        api_client.get('/store/orders/')  # caches the customer id
+        few = self.count_queries(api_client, '/store/orders/')
+
+        make_orders(user.customer, orders=20, items_per_order=3)
+        make_orders(baker.make(settings.AUTH_USER_MODEL).customer, orders=2, items_per_order=1)
+        many = self.count_queries(api_client, '/store/orders/')
+        response = api_client.get('/store/orders/')
+
+        assert many == few
+        assert response.data['count'] == 21
+        assert len(response.data['results']) == 15
+
+    def test_retrieve_and_items_query_count_is_constant(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        small = baker.make(Order, customer=user.customer)
+        baker.make(OrderItem, order=small, quantity=1, unit_price=1)
+        large = baker.make(Order, customer=user.customer)
+        baker.make(OrderItem, order=large, quantity=1, unit_price=1, _quantity=10)
+        api_client.get('/store/orders/')  # caches the customer id
+
+        assert self.count_queries(api_client, f'/store/orders/{large.id}/') \
+            == self.count_queries(api_client, f'/store/orders/{small.id}/')
+        assert self.count_queries(api_client, f'/store/orders/{large.id}/items/') \
+            == self.count_queries(api_client, f'/store/orders/{small.id}/items/')
@@ -0,0 +1,175 @@
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.db.models import F
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+import pytest
+from model_bakery import baker
+from store.models import Collection, Product
+from store.pagination import KeysetPagination
+from store.search import ProductSearchFilter
+
+
+@pytest.fixture
+def list_products(api_client):
+    def do_list_products(**params):
+        return api_client.get('/store/product/', params)
+    return do_list_products
+
+
+def follow_cursor(api_client, response):
+    # walk every page by following the `next` links
+    ids = [product['id'] for product in response.data['results']]
+    while response.data['next']:
+        response = api_client.get(response.data['next'])
+        assert response.status_code == status.HTTP_200_OK
+        ids += [product['id'] for product in response.data['results']]
+    return ids
+
+
+@pytest.mark.django_db
+class TestKeysetPagination:
+
+    def test_page_number_contract_is_unchanged(self, list_products):
+        baker.make(Product, _quantity=3)
+
+        response = list_products()
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 3
+        assert len(response.data['results']) == 3
+
+    def test_cursor_mode_skips_count(self, list_products):
+        baker.make(Product, _quantity=3)
+
+        response = list_products(pagination='cursor')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 'count' not in response.data
+        assert response.data['next'] is None
+        assert response.data['previous'] is None
+
+    def test_cursor_walks_every_product_once_with_ties(self, api_client, list_products):
+        # all prices equal so only the id tie-breaker keeps pages stable
+        products = baker.make(Product, unit_price=Decimal('10.00'), _quantity=40)
+
+        response = list_products(pagination='cursor', ordering='-unit_price')
+        ids = follow_cursor(api_client, response)
+
+        assert ids == sorted(product.id for product in products)[::-1]
+
+    def test_cursor_respects_ordering_and_filters(self, api_client, list_products):
+        collection = baker.make(Collection)
+        for price in range(1, 41):
+            baker.make(Product, collection=collection, unit_price=Decimal(price))
+        baker.make(Product, unit_price=Decimal(5), _quantity=5)
+
+        response = list_products(
+            pagination='cursor', ordering='unit_price',
+            collection_id=collection.id, unit_price__gte=3,
+        )
+        ids = follow_cursor(api_client, response)
+
+        prices = list(Product.objects.filter(id__in=ids).order_by('unit_price').values_list('id', flat=True))
+        assert len(ids) == 38
+        assert ids == prices
+
+    def test_previous_link_returns_previous_page(self, api_client, list_products):
+        baker.make(Product, _quantity=20)
+
+        first = list_products(pagination='cursor', ordering='title')
+        second = api_client.get(first.data['next'])
+        back = api_client.get(second.data['previous'])
+
+        assert [p['id'] for p in back.data['results']] == [p['id'] for p in first.data['results']]
+
+    def test_cursor_from_other_ordering_returns_404(self, api_client, list_products):
+        baker.make(Product, _quantity=20)
+
+        response = list_products(pagination='cursor', ordering='title')
+        next_url = response.data['next'].replace('ordering=title', 'ordering=inventory')
+
+        assert api_client.get(next_url).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_cursor_keeps_the_search_ranking(self, api_client, list_products):
+        for words in range(1, 21):
+            baker.make(Product, title='Shirt' if words % 2 else 'Mug', description=' '.join(['shirt'] * words))
+        request = Request(APIRequestFactory().get('/', {'search': 'shirt'}))
+        ranked = ProductSearchFilter().filter_queryset(request, Product.objects.all(), None).order_by('search_rank', 'id')
+
+        ids = follow_cursor(api_client, list_products(pagination='cursor', search='shirt'))
+
+        assert ids == [product.id for product in ranked]
+
+    def test_orderings_that_cant_be_seeked_on_use_page_numbers(self, list_products):
+        assert KeysetPagination.can_paginate(Product.objects.order_by('-unit_price'))
+        assert not KeysetPagination.can_paginate(Product.objects.order_by('collection__title'))
+        assert not KeysetPagination.can_paginate(Product.objects.order_by(F('unit_price').desc()))
+
+    def test_garbage_cursor_returns_404(self, list_products):
+        response = list_products(cursor='not-a-cursor')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestProductSearch:
+
+    def test_matches_word_prefixes_and_ranks_title_hits_first(self, list_products):
+        in_description = baker.make(Product, title='Mug', description='Goes well with a blue shirt')
+        in_title = baker.make(Product, title='Blue Shirt', description='Cotton')
+        baker.make(Product, title='Red Hat', description='Wool')
+
+        response = list_products(search='blu shi')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [p['id'] for p in response.data['results']] == [in_title.id, in_description.id]
+
+    def test_combines_with_filters_and_ordering(self, list_products):
+        collection = baker.make(Collection)
+        cheap = baker.make(Product, title='Shirt', unit_price=Decimal(5), collection=collection)
+        dear = baker.make(Product, title='Shirt', unit_price=Decimal(50), collection=collection)
+        baker.make(Product, title='Shirt', unit_price=Decimal(10))
+
+        response = list_products(search='shirt', collection_id=collection.id, ordering='-unit_price')
+
+        assert response.data['count'] == 2
+        assert [p['id'] for p in response.data['results']] == [dear.id, cheap.id]
+
+    def test_index_follows_updates_and_deletes(self, list_products):
+        product = baker.make(Product, title='Shirt')
+        product.title = 'Sweater'
+        product.save()
+
+        assert list_products(search='shirt').data['count'] == 0
+        assert list_products(search='sweater').data['count'] == 1
+
+        product.delete()
+        assert list_products(search='sweater').data['count'] == 0
+
+    def test_search_syntax_is_not_interpreted(self, list_products):
+        baker.make(Product, title='Shirt')
+
+        response = list_products(search='shirt" OR NOT (*')
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_falls_back_to_icontains_without_index(self, list_products, monkeypatch):
+        monkeypatch.setattr('store.search.is_available', lambda using='default': False)
+        product = baker.make(Product, title='Blue Shirt')
+
+        response = list_products(search='ue sh')
+
+        assert [p['id'] for p in response.data['results']] == [product.id]
+
+    def test_rebuild_command_indexes_bulk_created_products(self, list_products):
+        Product.objects.bulk_create([
+            Product(title='Shirt', description='', slug='shirt', sku='1', unit_price=10, inventory=1),
+        ])
+        assert list_products(search='shirt').data['count'] == 0
+
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        assert list_products(search='shirt').data['count'] == 1
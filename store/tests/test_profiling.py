@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+import pytest
+from model_bakery import baker
+from core import profiling
+from store.models import Product
+
+
+@pytest.fixture
+def profiles(settings, tmp_path):
+    settings.REQUEST_PROFILING = {**settings.REQUEST_PROFILING, 'DIRECTORY': tmp_path / 'profiles', 'INTERVAL_MS': 1}
+    return tmp_path / 'profiles'
+
+
+@pytest.fixture
+def staff():
+    return baker.make(settings.AUTH_USER_MODEL, is_staff=True)
+
+
+@pytest.fixture
+def product():
+    return baker.make(Product)
+
+
+def read_profile(profiles, response):
+    name = response[profiling.PROFILE_ID_HEADER]
+    return (profiles / f'{name}.collapsed').read_text(), json.loads((profiles / f'{name}.sql.json').read_text())
+
+
+@pytest.mark.django_db
+class TestRequestProfiler:
+
+    def test_header_writes_stacks_and_sql(self, api_client, profiles, staff, product):
+        token = profiling.make_token(staff)
+
+        response = api_client.get(f'/store/product/{product.id}/', HTTP_X_PROFILE_TOKEN=token)
+
+        assert response.status_code == 200
+        collapsed, timeline = read_profile(profiles, response)
+        for line in collapsed.splitlines():
+            stack, count = line.rsplit(' ', 1)
+            assert int(count) > 0 and ';' in stack
+        assert timeline['status'] == 200
+        assert timeline['path'] == f'/store/product/{product.id}/'
+        assert any('store_product' in query['sql'] for query in timeline['queries'])
+        starts = [query['start_ms'] for query in timeline['queries']]
+        assert starts == sorted(starts)
+
+    def test_query_parameter(self, api_client, profiles, staff, product):
+        token = profiling.make_token(staff)
+
+        response = api_client.get(f'/store/product/?{profiling.TOKEN_PARAMETER}={token}')
+
+        assert response.status_code == 200
+        assert profiling.PROFILE_ID_HEADER in response
+        assert token not in (profiles / f'{response[profiling.PROFILE_ID_HEADER]}.sql.json').read_text()
+
+    @pytest.mark.parametrize('token', [
+        lambda user: 'forged',
+        lambda user: profiling.make_token(user, path='/store/orders/'),
+        lambda user: profiling.make_token(baker.make(settings.AUTH_USER_MODEL)),  # not staff
+    ])
+    def test_requests_without_a_valid_token_are_served_as_usual(self, api_client, profiles, staff, product, token):
+        response = api_client.get(f'/store/product/{product.id}/', HTTP_X_PROFILE_TOKEN=token(staff))
+
+        assert response.status_code == 200
+        assert profiling.PROFILE_ID_HEADER not in response
+        assert not profiles.exists()
+
+    def test_tokens_expire(self, api_client, profiles, staff, product, settings):
+        settings.REQUEST_PROFILING = {**settings.REQUEST_PROFILING, 'TOKEN_MAX_AGE': -1}
+
+        response = api_client.get(f'/store/product/{product.id}/', HTTP_X_PROFILE_TOKEN=profiling.make_token(staff))
+
+        assert profiling.PROFILE_ID_HEADER not in response
+
+    def test_profiles_are_rate_limited(self, api_client, profiles, staff, product, settings, monkeypatch):
+        settings.REQUEST_PROFILING = {**settings.REQUEST_PROFILING, 'MAX_PER_MINUTE': 2}
+        monkeypatch.setattr(profiling, '_rate_limit_key', lambda: 'core:profiling:test')  # all in the same minute
+        token = profiling.make_token(staff)
+
+        responses = [api_client.get(f'/store/product/{product.id}/', HTTP_X_PROFILE_TOKEN=token) for _ in range(4)]
+
+        assert [profiling.PROFILE_ID_HEADER in response for response in responses] == [True, True, False, False]
+        assert all(response.status_code == 200 for response in responses)
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampler_counts_the_stacks_of_the_thread():
+    with profiling.Sampler(threading.get_ident(), interval=0.001) as sampler:
+        busy_wait(0.05)
+
+    assert sampler.stacks
+    assert any(stack.endswith(f'{__name__}:busy_wait') for stack in sampler.stacks)
+
+
+@pytest.mark.django_db
+class TestProfileTokenCommand:
+
+    def test_prints_a_token_for_staff(self, staff):
+        output = StringIO()
+
+        call_command('profile_token', staff.username, '--path', '/store/product/', stdout=output, stderr=StringIO())
+
+        assert profiling.read_token(output.getvalue().strip()) == (staff.pk, '/store/product/')
+
+    def test_refuses_other_users(self):
+        user = baker.make(settings.AUTH_USER_MODEL)
+
+        with pytest.raises(CommandError):
+            call_command('profile_token', user.username, stderr=StringIO())
@@ -0,0 +1,116 @@
+import re
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store.models import Collection, Order, Product, Review
+
+# a plan step reading every row of a table, "SCAN store_product USING INDEX ..." walks an index instead
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)( AS \w+)?$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+pytestmark = pytest.mark.skipif(connection.vendor != 'sqlite', reason='reads SQLite query plans')
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+@pytest.fixture
+def plans(api_client):
+    '''
+    Requests `url` and returns the query plan of every SELECT it ran, as
+    (sql, plan steps) pairs.
+    '''
+    def do_plans(url):
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        assert response.status_code == status.HTTP_200_OK
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        assert selects
+        return [(sql, explain(sql)) for sql in selects]
+    return do_plans
+
+
+def full_scans(plans):
+    return [(sql, step) for sql, steps in plans for step in steps if FULL_SCAN.match(step)]
+
+
+def temp_sorts(plans, table):
+    # sorting the few tags or items of a page is fine, the endpoint's own table must come out of an index in order
+    return [
+        (sql, step) for sql, steps in plans for step in steps
+        if step == TEMP_SORT and sql.split(' WHERE ')[0].endswith(f'FROM "{table}"')
+    ]
+
+
+@pytest.fixture
+def catalog():
+    collection = baker.make(Collection)
+    product = baker.make(Product, collection=collection, unit_price=20)
+    baker.make(Review, product=product, rating=4, _quantity=2)
+    return product
+
+
+@pytest.mark.django_db
+class TestProductQueryPlans:
+
+    @pytest.mark.parametrize('query', [
+        'collection_id={collection}&unit_price__gte=10&unit_price__lte=50',
+        'collection_id={collection}&ordering=unit_price',
+        'unit_price__gte=10&unit_price__lte=50',
+        'ordering=title',
+        'ordering=-last_update',
+        'ordering=unit_price&pagination=cursor',
+    ])
+    def test_list_uses_indexes(self, plans, catalog, query):
+        result = plans('/store/product/?' + query.format(collection=catalog.collection_id))
+
+        assert full_scans(result) == []
+
+    def test_ordered_list_is_not_sorted_in_a_temp_table(self, plans, catalog):
+        result = plans('/store/product/?ordering=-last_update&pagination=cursor')
+
+        assert temp_sorts(result, 'store_product') == []
+
+    def test_reviews_of_a_product_use_indexes(self, plans, catalog):
+        result = plans(f'/store/product/{catalog.id}/reviews/?min_rating=3&max_rating=5&ordering=-rating')
+
+        assert full_scans(result) == []
+        assert temp_sorts(result, 'store_review') == []
+
+
+@pytest.mark.django_db
+class TestOrderQueryPlans:
+
+    def test_customer_order_list_uses_indexes(self, plans, api_client):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        baker.make(Order, customer=user.customer, _quantity=2)
+        api_client.force_authenticate(user=user)
+
+        result = plans('/store/orders/')
+
+        assert full_scans(result) == []
+        assert temp_sorts(result, 'store_order') == []
+
+    def test_staff_order_list_is_not_sorted_in_a_temp_table(self, plans, authenticate):
+        baker.make(Order, customer=baker.make(settings.AUTH_USER_MODEL).customer, _quantity=2)
+        authenticate(is_staff=True)
+
+        result = plans('/store/orders/')
+
+        assert temp_sorts(result, 'store_order') == []
+
+    def test_export_by_payment_status_uses_indexes(self, plans, authenticate):
+        baker.make(Order, customer=baker.make(settings.AUTH_USER_MODEL).customer, payment_status='C')
+        authenticate(is_staff=True)
+
+        result = plans('/store/orders/export/?payment_status=C&placed_after=2024-01-01')
+
+        assert full_scans(result) == []
@@ -0,0 +1,111 @@
+from decimal import Decimal
+from django.core.management import call_command
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store.models import Product, Review
+
+
+@pytest.fixture
+def product():
+    return baker.make(Product)
+
+
+@pytest.fixture
+def review(product):
+    def do_review(rating, target=None):
+        return baker.make(Review, product=target or product, rating=rating)
+    return do_review
+
+
+def stats(product):
+    product.refresh_from_db()
+    return product.rating_count, product.rating_avg, product.rating_histogram
+
+
+@pytest.mark.django_db
+class TestRatingStats:
+
+    def test_create_updates_count_average_and_histogram(self, product, review):
+        review(5)
+        review(4)
+        review(4)
+
+        assert stats(product) == (3, Decimal('4.33'), {1: 0, 2: 0, 3: 0, 4: 2, 5: 1})
+
+    def test_changing_a_rating_moves_it_between_stars(self, product, review):
+        first = review(5)
+        review(3)
+
+        first.rating = 1
+        first.save()
+
+        assert stats(product) == (2, Decimal('2.00'), {1: 1, 2: 0, 3: 1, 4: 0, 5: 0})
+
+    def test_moving_a_review_to_another_product(self, product, review):
+        other = baker.make(Product)
+        moved = review(2)
+
+        moved.product = other
+        moved.save()
+
+        assert stats(product) == (0, Decimal('0.00'), {1: 0, 2: 0, 3: 0, 4: 0, 5: 0})
+        assert stats(other)[:2] == (1, Decimal('2.00'))
+
+    def test_delete_removes_the_rating(self, product, review):
+        review(5).delete()
+        review(3)
+
+        assert stats(product) == (1, Decimal('3.00'), {1: 0, 2: 0, 3: 1, 4: 0, 5: 0})
+
+    def test_saving_a_loaded_product_keeps_newer_ratings(self, product, review):
+        stale = Product.objects.get(pk=product.pk)
+        review(5)
+
+        stale.title = 'renamed'
+        stale.save()
+
+        assert stats(product)[0] == 1
+        assert product.title == 'renamed'
+
+    def test_recompute_repairs_drifted_stats(self, product, review):
+        review(5)
+        review(2)
+        Product.objects.filter(pk=product.pk).update(rating_count=7, rating_avg=1, rating_5_count=0)
+        empty = baker.make(Product, rating_count=3)
+
+        call_command('recompute_ratings')
+
+        assert stats(product) == (2, Decimal('3.50'), {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+        assert stats(empty)[0] == 0
+
+
+@pytest.mark.django_db
+class TestProductRatingApi:
+
+    def test_product_exposes_rating_stats(self, api_client, product, review):
+        review(4)
+
+        response = api_client.get(f'/store/product/{product.id}/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['rating_avg'] == Decimal('4.00')
+        assert response.data['rating_count'] == 1
+        assert response.data['rating_histogram'] == {'1': 0, '2': 0, '3': 0, '4': 1, '5': 0}
+
+    def test_filter_and_order_by_rating(self, api_client, review):
+        low, high, unrated = baker.make(Product, _quantity=3)
+        review(2, low)
+        review(5, high)
+
+        response = api_client.get('/store/product/', {'rating_avg__gte': 2, 'ordering': '-rating_avg'})
+
+        assert [product['id'] for product in response.data['results']] == [high.id, low.id]
+
+    def test_new_review_changes_the_cached_product(self, api_client, product, review):
+        api_client.get(f'/store/product/{product.id}/')
+        review(3)
+
+        response = api_client.get(f'/store/product/{product.id}/')
+
+        assert response.data['rating_count'] == 1
@@ -0,0 +1,167 @@
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from io import StringIO
+import itertools
+import sqlite3
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.models import Sum
+import pytest
+from model_bakery import baker
+from tags.models import TaggedItem
+from store import seeding
+from store.models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product, Review
+
+SIZES = {'products': 50, 'customers': 20, 'orders': 200, 'reviews': 100, 'carts': 10, 'tagged_items': 50}
+END = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class Rollback(Exception):
+    pass
+
+
+def generated_rows():
+    return {
+        'orders': list(Order.objects.order_by('id').values_list('id', 'customer_id', 'placed_at', 'payment_status')),
+        'items': sorted(OrderItem.objects.values_list('order_id', 'product_id', 'quantity')),
+        'carts': sorted(CartItem.objects.values_list('cart_id', 'product_id', 'quantity')),
+        'reviews': sorted(Review.objects.values_list('product_id', 'rating')),
+    }
+
+
+def seeded_rows(**kwargs):
+    # seeds inside a transaction that is rolled back, so every run starts from the same ids
+    try:
+        with transaction.atomic():
+            seeding.seed(SIZES, end=END, chunk_size=30, **kwargs)
+            rows = generated_rows()
+            raise Rollback
+    except Rollback:
+        return rows
+
+
+@pytest.fixture
+def file_database(tmp_path, monkeypatch):
+    '''
+    Runs the block on a fresh copy of the test database in a file, for
+    the seeding workers to open: they can't see the in-memory one. They
+    start from a settings module pointing at the copy.
+    '''
+    (tmp_path / 'seeding_test_settings.py').write_text(
+        'import os\n'
+        'from storefront.settings import *\n'
+        "DATABASES = {'default': {**DATABASES['default'], 'NAME': os.environ['SEEDING_TEST_DATABASE']}}\n"
+        'DATABASE_REPLICAS = []\n'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv('DJANGO_SETTINGS_MODULE', 'seeding_test_settings')
+    original = connections['default']
+    original.ensure_connection()
+    copies = itertools.count()
+
+    @contextmanager
+    def use_copy():
+        path = tmp_path / f'db{next(copies)}.sqlite3'
+        target = sqlite3.connect(path)
+        original.connection.backup(target)
+        target.close()
+        monkeypatch.setenv('SEEDING_TEST_DATABASE', str(path))
+        copy = original.__class__({**original.settings_dict, 'NAME': str(path)}, 'default')
+        connections['default'] = copy
+        try:
+            yield
+        finally:
+            copy.close()
+            connections['default'] = original
+
+    return use_copy
+
+
+@pytest.mark.django_db
+class TestSeed:
+
+    def test_creates_the_requested_rows(self):
+        plan = seeding.seed(SIZES, end=END)
+
+        assert Product.objects.count() == 50
+        assert Customer.objects.count() == get_user_model().objects.count() == 20
+        assert Order.objects.count() == 200
+        assert Review.objects.count() == 100
+        assert Cart.objects.count() == 10
+        assert OrderItem.objects.count() >= 200
+        assert 0 < TaggedItem.objects.count() <= 50
+        assert list(Product.objects.values_list('id', flat=True).order_by('id')) == list(plan['ids']['products'])
+
+    def test_keeps_derived_data_consistent(self):
+        seeding.seed(SIZES, end=END)
+
+        assert Collection.objects.aggregate(total=Sum('products_count'))['total'] == 50
+        assert Customer.objects.aggregate(total=Sum('orders_count'))['total'] == 200
+        assert Product.objects.aggregate(total=Sum('rating_count'))['total'] == 100
+        for item in OrderItem.objects.select_related('product')[:20]:
+            assert item.unit_price == item.product.unit_price
+
+    def test_popularity_is_skewed(self):
+        plan = seeding.seed(SIZES, end=END)
+
+        orders = Counter(Order.objects.values_list('customer_id', flat=True))
+        first_customer = plan['ids']['customers'][0]
+        assert orders[first_customer] == max(orders.values())
+        assert orders[first_customer] > 200 / 20 * 2
+
+    def test_timestamps_are_generated(self):
+        seeding.seed(SIZES, end=END)
+
+        placed = Order.objects.values_list('placed_at', flat=True)
+        assert max(placed) <= END
+        assert (max(placed) - min(placed)).days > 30
+        # and auto_now_add is back once seeding is done
+        assert Order._meta.get_field('placed_at').auto_now_add
+
+    def test_adds_to_existing_data(self):
+        existing = baker.make(Product)
+
+        plan = seeding.seed(SIZES, end=END)
+
+        assert plan['ids']['products'].start == existing.id + 1
+        assert Product.objects.count() == 51
+
+    def test_same_seed_same_data(self):
+        first = seeded_rows(random_seed=1)
+
+        assert seeded_rows(random_seed=1) == first
+        assert seeded_rows(random_seed=2) != first
+
+
+@pytest.mark.django_db(transaction=True)
+def test_workers_seed_the_same_data_as_the_seeding_process(file_database):
+    rows = []
+    for processes in [0, 2]:
+        with file_database():
+            seeding.seed(SIZES, end=END, chunk_size=30, random_seed=1, processes=processes)
+            rows.append(generated_rows())
+
+    assert rows[0]['orders']
+    assert rows[0] == rows[1]
+
+
+@pytest.mark.django_db
+def test_signals_are_suppressed_inside_the_block():
+    with seeding.signals_suppressed():
+        user = baker.make(get_user_model())
+    assert not Customer.objects.filter(user=user).exists()
+
+    # reconnected afterwards
+    assert Customer.objects.filter(user=baker.make(get_user_model())).exists()
+
+
+@pytest.mark.django_db
+def test_seed_store_command():
+    output = StringIO()
+
+    call_command('seed_store', '--size', '1000', '--end-date', '2025-01-01', stdout=output)
+
+    assert 'rows in' in output.getvalue()
+    assert Product.objects.count() == 40
@@ -0,0 +1,95 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+import pytest
+from model_bakery import baker
+from store.models import Product
+from tags.models import Tag, TaggedItem
+
+
+@pytest.fixture
+def tag():
+    def do_tag(product, label):
+        tag, _ = Tag.objects.get_or_create(label=label)
+        return TaggedItem.objects.create(
+            tag=tag,
+            content_type=ContentType.objects.get_for_model(Product),
+            object_id=product.id,
+        )
+    return do_tag
+
+
+@pytest.mark.django_db
+class TestTaggedItemManager:
+
+    def test_get_tags_for_many_uses_one_query(self, tag, django_assert_num_queries):
+        shirt, hat, plain = baker.make(Product, _quantity=3)
+        tag(shirt, 'summer')
+        tag(shirt, 'cotton')
+        tag(hat, 'summer')
+        ContentType.objects.get_for_model(Product)  # cached from here on
+
+        with django_assert_num_queries(1):
+            tags = TaggedItem.objects.get_tags_for_many(Product, [shirt.id, hat.id, plain.id])
+
+        assert [t.label for t in tags[shirt.id]] == ['cotton', 'summer']
+        assert [t.label for t in tags[hat.id]] == ['summer']
+        assert plain.id not in tags
+
+    def test_attach_tags_sets_an_empty_list_on_untagged_objects(self, tag):
+        shirt, plain = baker.make(Product, _quantity=2)
+        tag(shirt, 'summer')
+
+        products = TaggedItem.objects.attach_tags(Product.objects.order_by('id'))
+
+        assert [[t.label for t in p.tags] for p in products] == [['summer'], []]
+
+
+@pytest.mark.django_db
+class TestProductTags:
+
+    def test_list_includes_tags_without_a_query_per_product(self, api_client, tag):
+        def count_queries():
+            cache.clear()  # so the view really runs
+            with CaptureQueriesContext(connection) as queries:
+                response = api_client.get('/store/product/')
+            assert response.status_code == status.HTTP_200_OK
+            return len(queries), response
+
+        for product in baker.make(Product, _quantity=2):
+            tag(product, 'summer')
+        few, _ = count_queries()
+        for product in baker.make(Product, _quantity=8):
+            tag(product, 'summer')
+        many, response = count_queries()
+
+        assert few == many
+        assert all(product['tags'] == ['summer'] for product in response.data['results'])
+
+    def test_retrieve_includes_tags(self, api_client, tag):
+        product = baker.make(Product)
+        tag(product, 'summer')
+
+        response = api_client.get(f'/store/product/{product.id}/')
+
+        assert response.data['tags'] == ['summer']
+
+    def test_filter_by_tag(self, api_client, tag):
+        shirt, hat = baker.make(Product, _quantity=2)
+        tag(shirt, 'summer')
+        tag(hat, 'winter')
+
+        response = api_client.get('/store/product/', {'tag': 'summer'})
+
+        assert [product['id'] for product in response.data['results']] == [shirt.id]
+
+    def test_tagging_changes_the_cached_product(self, api_client, tag):
+        product = baker.make(Product)
+        api_client.get(f'/store/product/{product.id}/')
+
+        tag(product, 'summer')
+        response = api_client.get(f'/store/product/{product.id}/')
+
+        assert response.data['tags'] == ['summer']
@@ -0,0 +1,186 @@
+from datetime import timedelta
+from io import StringIO
+import signal
+from django.conf import settings
+from django.core.management import call_command
+from django.db import OperationalError, transaction
+from django.utils import timezone
+import pytest
+from model_bakery import baker
+from core import tasks
+from core.models import Task
+from store.models import Cart, CartItem, Order, Product
+from store.serializers import CreateOrderSerializer
+
+calls = []
+
+
+@tasks.task
+def record(value):
+    calls.append(value)
+
+
+@tasks.task(max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    calls.clear()
+
+
+@pytest.mark.django_db
+class TestEnqueue:
+
+    def test_task_is_rolled_back_with_the_transaction(self):
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                record.delay(value=1)
+                raise RuntimeError
+
+        assert not Task.objects.exists()
+
+    def test_delay_queues_task(self):
+        record.delay(value=1)
+
+        task = Task.objects.get()
+        assert task.name == record.task_name
+        assert task.payload == {'value': 1}
+        assert task.status == Task.STATUS_QUEUED
+
+    def test_checkout_queues_order_created_receiver(self, api_client):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product=baker.make(Product, inventory=5), quantity=1)
+        api_client.force_authenticate(user=user)
+
+        response = api_client.post('/store/orders/', {'cart_id': str(cart.id)}, format='json')
+
+        task = Task.objects.get(name='core.signals.handelers.on_order_created')
+        assert task.payload['order'] == {'__model__': 'store.order', 'pk': response.data['id']}
+        assert tasks.run_pending() == 1
+        task.refresh_from_db()
+        assert task.status == Task.STATUS_DONE
+
+    def test_checkout_is_rolled_back_when_its_task_cant_be_queued(self, monkeypatch):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        cart = baker.make(Cart)
+        product = baker.make(Product, inventory=5)
+        baker.make(CartItem, cart=cart, product=product, quantity=1)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('queue unavailable')
+        monkeypatch.setattr(tasks, 'enqueue', fail)
+
+        serializer = CreateOrderSerializer(data={'cart_id': cart.id}, context={'user_id': user.id})
+        serializer.is_valid(raise_exception=True)
+        with pytest.raises(RuntimeError):
+            serializer.save()
+
+        assert not Order.objects.exists()
+        assert Cart.objects.filter(pk=cart.id).exists()
+        product.refresh_from_db()
+        assert product.inventory == 5
+
+
+@pytest.mark.django_db
+class TestWorker:
+
+    def test_runs_due_tasks_once(self):
+        record.delay(value='a')
+        tasks.enqueue(record.task_name, {'value': 'later'}, run_at=timezone.now() + timedelta(hours=1))
+
+        assert tasks.run_pending() == 1
+        assert tasks.run_pending() == 0
+        assert calls == ['a']
+
+    def test_task_claimed_by_one_worker_is_not_claimed_again(self):
+        baker.make(Task, name=record.task_name, payload={'value': 1})
+
+        assert len(tasks.claim('first')) == 1
+        assert tasks.claim('second') == []
+
+    def test_expired_lease_is_claimed_again(self):
+        baker.make(
+            Task, name=record.task_name, payload={'value': 1}, status=Task.STATUS_RUNNING,
+            locked_by='crashed', locked_until=timezone.now() - timedelta(seconds=1),
+        )
+
+        claimed = tasks.claim('second')
+
+        assert [task.locked_by for task in claimed] == ['second']
+
+    def test_expired_lease_of_the_last_attempt_fails_the_task(self):
+        task = baker.make(
+            Task, name=record.task_name, payload={'value': 1}, status=Task.STATUS_RUNNING, attempts=2, max_attempts=2,
+            locked_by='crashed', locked_until=timezone.now() - timedelta(seconds=1),
+        )
+
+        assert tasks.claim('second') == []
+        task.refresh_from_db()
+        assert task.status == Task.STATUS_FAILED
+        assert task.last_error
+
+    def test_failed_task_is_retried_with_backoff_then_given_up(self):
+        task = baker.make(Task, name=explode.task_name, payload={}, max_attempts=2)
+
+        tasks.run_pending()
+        task.refresh_from_db()
+
+        assert task.status == Task.STATUS_QUEUED
+        assert task.attempts == 1
+        assert task.run_at > timezone.now()
+        assert 'boom' in task.last_error
+
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+        tasks.run_pending()
+        task.refresh_from_db()
+
+        assert task.status == Task.STATUS_FAILED
+        assert task.attempts == 2
+
+    def test_backoff_doubles_up_to_the_limit(self, settings):
+        settings.TASK_QUEUE = {'RETRY_BASE_DELAY': 10, 'RETRY_MAX_DELAY': 60}
+
+        assert timedelta(seconds=5) <= tasks.retry_delay(1) <= timedelta(seconds=10)
+        assert timedelta(seconds=20) <= tasks.retry_delay(3) <= timedelta(seconds=40)
+        assert tasks.retry_delay(10) <= timedelta(seconds=60)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_tasks_command_drains_the_queue():
+    for value in range(3):
+        baker.make(Task, name=record.task_name, payload={'value': value})
+
+    # one worker: the in-memory test database takes one writer at a time
+    call_command('run_tasks', '--once', '--workers', '1', stdout=StringIO())
+
+    assert sorted(calls) == [0, 1, 2]
+    assert not Task.objects.exclude(status=Task.STATUS_DONE).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_tasks_command_survives_outcomes_it_cant_record(monkeypatch):
+    for value in range(2):
+        baker.make(Task, name=record.task_name, payload={'value': value})
+
+    def locked(task_id, worker_id):
+        raise OperationalError('database table is locked: core_task')
+
+    monkeypatch.setattr(tasks, 'run_by_id', locked)
+    out = StringIO()
+    call_command('run_tasks', '--once', '--workers', '1', stdout=out)
+
+    assert '0 tasks done, 2 failed.' in out.getvalue()
+    # left running, their leases run out and they are claimed again
+    assert Task.objects.filter(status=Task.STATUS_RUNNING).count() == 2
+
+
+@pytest.mark.django_db
+def test_run_tasks_command_restores_the_signal_handlers():
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+
+    call_command('run_tasks', '--once', '--workers', '1', stdout=StringIO())
+
+    assert {signum: signal.getsignal(signum) for signum in handlers} == handlers
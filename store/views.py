@@ -1,37 +1,51 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.parsers import MultiPartParser
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser
 from rest_framework.response import Response
 
-from core import serializers
+from core import auth, serializers
+from store import exports, importers
+from tags.models import TaggedItem
 from store.permissions import IsAdminOrReadOnly, FullDjangoModelPermissions, ViewCustomerHistoryPermission
 from .models import Cart, CartItem, Collection, Customer, Order, Product, OrderItem, ProductImage, Review
 from .filters import ProductFilter, ReviewFilter
-from .pagination import DefaultPagination
-from .serializers import AddCartItemSerializer, CartSerializer, CartItemSerializer, CollectionSerializer, CreateOrderSerializer, CustomerSerializer, OrderItemSerializer, OrderSerializer, ProductImageSerializer, ProductSerializer, UpdateCartItemSerializer, ReviewSerializer, UpdateOrderSerializer
+from .pagination import DefaultPagination, KeysetOrPageNumberPagination
+from .cache import CachedResponseMixin, COLLECTIONS, PRODUCTS, get_versions
+from .conditional import ConditionalGetMixin, ConditionalResponseMixin
+from .search import ProductSearchFilter
+from .serializers import AddCartItemSerializer, BulkCartItemSerializer, CartSerializer, CartItemSerializer, CollectionSerializer, CreateOrderSerializer, CustomerSerializer, OrderExportSerializer, OrderItemSerializer, OrderSerializer, ProductImageSerializer, ProductSerializer, UpdateCartItemSerializer, ReviewSerializer, UpdateOrderSerializer
 
 
 
 def home(request):
     return HttpResponse("Welcome to Store Homepage")
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CachedResponseMixin, ModelViewSet):
     queryset = Product.objects.prefetch_related('images').all()
     serializer_class = ProductSerializer
+    cache_namespaces = [PRODUCTS]
     
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     filterset_class = ProductFilter
     search_fields = ['title', 'description',]
-    ordering_fields = ['title', 'unit_price', 'inventory', 'last_update']
+    ordering_fields = ['title', 'unit_price', 'inventory', 'last_update', 'rating_avg', 'rating_count']
     
-    pagination_class = DefaultPagination
+    pagination_class = KeysetOrPageNumberPagination
     permission_classes = [IsAdminOrReadOnly]
     
+    # most queries per request, whatever the page size (core.instrumentation)
+    query_budgets = {'list': 6, 'retrieve': 4}
+    
     # Filters logic without django-filter
     # def get_queryset(self):
     #     queryset = Product.objects.all()
@@ -45,6 +59,46 @@ class ProductViewSet(ModelViewSet):
         return {
             'request': self.request
         }
+    
+    # tags of a whole page in one query
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return None if page is None else TaggedItem.objects.attach_tags(page)
+    
+    def get_object(self):
+        product = super().get_object()
+        TaggedItem.objects.attach_tags([product])
+        return product
+    
+    # every product write bumps the cache version, so the list is validated without a query
+    def get_list_version(self, request):
+        return get_versions(self.cache_namespaces)[0], None
+    
+    def get_detail_version(self, request):
+        try:
+            last_update = Product.objects \
+                .filter(pk = self.kwargs['pk']) \
+                    .values_list('last_update', flat = True) \
+                        .first()
+        except (ValueError, TypeError, DjangoValidationError):
+            return None  # not a product id, let retrieve answer 404
+        if last_update is None:
+            return None
+        return f"{self.kwargs['pk']}:{last_update}", last_update
+        
+    @action(detail=False, methods=['POST'], url_path='import', permission_classes=[IsAdminUser], parser_classes=[MultiPartParser])
+    def import_products(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['A CSV or NDJSON file is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        file_format = request.data.get('file_format') or importers.guess_format(upload.name)
+        if file_format not in importers.FORMATS:
+            return Response({'file_format': [f'Must be one of {importers.FORMATS}.']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        importer = importers.ProductImporter()
+        result = importer.run(importers.read_rows(upload.open('rb'), file_format))
+        return Response(result.as_dict())
         
     def destroy(self, request, *args, **kwargs):
     
@@ -93,9 +147,10 @@ def product_detail(request, pk):
         return Response(status=status.HTTP_204_NO_CONTENT)
 '''
 
-class CollectionViewSet(ModelViewSet):
+class CollectionViewSet(ConditionalGetMixin, CachedResponseMixin, ModelViewSet):
     queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
+    cache_namespaces = [COLLECTIONS]
     
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ['title', 'description', 'featured_product__title']
@@ -107,8 +162,16 @@ class CollectionViewSet(ModelViewSet):
     
     def get_serializer_context(self):
         return {
-            'request' : self.request
+            'request' : self.request,
+            'with_counts' : self.request.query_params.get('with_counts') in ['1', 'true'],
         }    
+    
+    # collections carry no timestamp, the cache version changes on every write instead
+    def get_list_version(self, request):
+        return get_versions(self.cache_namespaces)[0], None
+    
+    def get_detail_version(self, request):
+        return get_versions(self.cache_namespaces)[0], None
         
     def destroy(self, request, *args, **kwargs):
         if Product.objects.filter(collection_id = kwargs['pk']).count() > 0:
@@ -149,7 +212,7 @@ class ReviewViewSet(ModelViewSet):
     search_fields = ['title', 'description']
     ordering_fields = ['rating', ]
     
-    pagination_class = DefaultPagination
+    pagination_class = KeysetOrPageNumberPagination
     permission_classes = [IsAuthenticatedOrReadOnly]
     
     
@@ -162,9 +225,28 @@ class ReviewViewSet(ModelViewSet):
         return Review.objects.filter(product_id = self.kwargs['product_pk'])
     
     
-class CartViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
+class CartViewSet(ConditionalResponseMixin, CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
     queryset = Cart.objects.prefetch_related('cart_items__product').all()
     serializer_class = CartSerializer
+    query_budgets = {'create': 3, 'retrieve': 4, 'destroy': 5}
+    
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(self.get_detail_version, super().retrieve, request, *args, **kwargs)
+    
+    def get_detail_version(self, request):
+        # the items and the prices they are shown with, without serializing anything
+        try:
+            rows = list(
+                Cart.objects \
+                    .filter(pk = self.kwargs['pk']) \
+                        .values_list('cart_items__id', 'cart_items__quantity', 'cart_items__product__last_update') \
+                            .order_by('cart_items__id')
+            )
+        except DjangoValidationError:
+            return None  # not a UUID, let retrieve answer 404
+        if not rows:
+            return None
+        return repr(rows), None
     
     
 class CartItemViewSet(ModelViewSet):
@@ -186,6 +268,30 @@ class CartItemViewSet(ModelViewSet):
     
     def get_queryset(self):
         return CartItem.objects.filter(cart_id = self.kwargs['cart_pk'])
+    
+    def create(self, request, *args, **kwargs):
+        # a list of {product_id, quantity} lines updates the whole cart at once (?mode=merge|replace)
+        if isinstance(request.data, list):
+            return self.bulk_update_items(request)
+        return super().create(request, *args, **kwargs)
+    
+    def bulk_update_items(self, request):
+        try:
+            cart = Cart.objects.filter(pk = self.kwargs['cart_pk']).first()
+        except DjangoValidationError:
+            cart = None  # not a UUID
+        if cart is None:
+            raise NotFound('No cart found with given cart id')
+        
+        serializer = BulkCartItemSerializer(
+            data = {'mode': request.query_params.get('mode', BulkCartItemSerializer.MODE_MERGE), 'items': request.data},
+            context = self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception = True)
+        serializer.save()
+        
+        cart = Cart.objects.prefetch_related('cart_items__product').get(pk = cart.pk)
+        return Response(CartSerializer(cart).data)
         
             
 class CustomerViewSet(ModelViewSet):
@@ -200,11 +306,11 @@ class CustomerViewSet(ModelViewSet):
     
     @action(detail=False, methods=['GET', 'PUT'], permission_classes = [IsAuthenticated])
     def me(self, request):
-        user_id = request.user.id
-        if not user_id:
+        customer_id = auth.get_customer_id(request)
+        if not customer_id:
             return Response({'error': 'User ID is required (Add Access Token)'}, status=status.HTTP_400_BAD_REQUEST)
     
-        customer = Customer.objects.get(user_id=user_id)
+        customer = Customer.objects.get(pk=customer_id)
         
         if request.method == 'GET':
             serializer = CustomerSerializer(customer)
@@ -218,25 +324,46 @@ class CustomerViewSet(ModelViewSet):
         
         
 class OrderViewSet(ModelViewSet):
-    http_method_names = ['get', 'patch', 'delete', 'head', 'options']
+    http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
     serializer_class = OrderSerializer
+    pagination_class = DefaultPagination
+    # checkout: the savepoints, the cart lock, inventory, the order and its items, the customer's orders_count
+    query_budgets = {'list': 4, 'retrieve': 3, 'create': 15}
     
     def get_permissions(self):
-        if self.request.method in ['PATCH', 'DELETE']:
+        if self.request.method in ['PATCH', 'DELETE'] or self.action == 'export':
             return [IsAdminUser()]
         return [IsAuthenticated()]
     
+    @action(detail=False)
+    def export(self, request):
+        params = OrderExportSerializer(data = request.query_params)
+        params.is_valid(raise_exception = True)
+        options = dict(params.validated_data)
+        file_format = options.pop('export_format')
+        
+        # streamed straight from the database cursor, nothing is held in memory
+        orders = exports.filter_orders(Order.objects.all(), **options)
+        response = StreamingHttpResponse(
+            exports.iter_export(file_format, orders),
+            content_type = exports.CONTENT_TYPES[file_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders.{file_format}"'
+        return response
+    
     def create(self, request, *args, **kwargs):
         serializer = CreateOrderSerializer(
             data = request.data, 
             context = {
                 'user_id': self.request.user.id,
+                'customer_id': auth.get_customer_id(self.request),
             }
         )
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
         
         # new serializer used to deserialise created order so that it can be retured to client
+        order = self.get_queryset().get(pk = order.pk)
         serializer = OrderSerializer(order)
         return Response(serializer.data)
 
@@ -249,12 +376,16 @@ class OrderViewSet(ModelViewSet):
         return OrderSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        if user.is_staff:
-            return Order.objects.all()
+        # order -> items -> product in a constant number of queries
+        queryset = Order.objects \
+            .prefetch_related(Prefetch('items', queryset = OrderItem.objects.select_related('product'))) \
+                .order_by('-placed_at', '-id')
+        
+        if auth.is_staff(self.request):
+            return queryset
         
-        customer_id = Customer.objects.only('id').get(user_id = user.id)
-        return Order.objects.filter(customer_id = customer_id)
+        # from the token claims, no query
+        return queryset.filter(customer_id = auth.get_customer_id(self.request))
     
         
 class OrderItemViewSet(ModelViewSet):
@@ -267,7 +398,7 @@ class OrderItemViewSet(ModelViewSet):
         }
     
     def get_queryset(self):
-        return OrderItem.objects.filter(order_id = self.kwargs['order_pk'])
+        return OrderItem.objects.select_related('product').filter(order_id = self.kwargs['order_pk'])
 
 
 class ProductImageViewSet(ModelViewSet):
@@ -54,9 +54,18 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # profiles of single requests for staff, on demand (core.profiling)
+    'core.profiling.RequestProfilerMiddleware',
+    
+    # query counts and timings of every request (core.instrumentation)
+    'core.instrumentation.RequestMetricsMiddleware',
+    
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     
+    # reads of writing requests go to the primary database (core.db)
+    'core.db.PrimaryPinMiddleware',
+    
     'corsheaders.middleware.CorsMiddleware',
     
     'django.middleware.common.CommonMiddleware',
@@ -100,6 +109,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # keep connections open between requests instead of reconnecting (and re-running the PRAGMAs) every time
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 5,
+        },
+    }
+}
+
+# read only copies of the primary (e.g. kept up to date by Litestream/LiteFS), as a comma separated list of
+# database files: DATABASE_REPLICAS=/data/replica1.sqlite3,/data/replica2.sqlite3
+# catalog reads are spread over them by core.db.PrimaryReplicaRouter, tests use the primary instead
+for number, name in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'NAME': name, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.db.PrimaryReplicaRouter']
+
+# run on every new SQLite connection (core.db)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # readers don't wait for writers
+    'synchronous': 'NORMAL',  # durable enough with WAL, much faster commits
+    'busy_timeout': 5000,  # ms to wait for a lock instead of failing right away
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# version counters of cached catalog responses live here, so every process
+# serving the API has to share it (e.g. FileBasedCache or Redis) in production
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -157,10 +201,14 @@ AUTH_USER_MODEL = 'core.User'
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # builds request.user from the token claims, the user row is only loaded when a view needs it
+        'core.auth.StatelessJWTAuthentication',
     ),
 }
 
+# seconds a user loaded by core.auth.StatelessJWTAuthentication is reused within a process
+JWT_USER_CACHE_TIMEOUT = 30
+
 SIMPLE_JWT = {
     
     'AUTH_HEADER_TYPES': ('JWT',),
@@ -168,6 +216,10 @@ SIMPLE_JWT = {
     # https://django-rest-framework-simplejwt.readthedocs.io/en/latest/settings.html
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+
+    # access tokens carry customer_id and is_staff claims (core.auth)
+    "TOKEN_OBTAIN_SERIALIZER": "core.serializers.TokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "core.serializers.TokenRefreshSerializer",
 }
     
 DJOSER = { 
@@ -177,4 +229,47 @@ DJOSER = {
     'user' : 'core.serializers.UserSerializer',
     'current_user': 'core.serializers.UserSerializer',
     }
-}
\ No newline at end of file
+}
+
+# cached product/collection responses (store.cache)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 300
+
+# thumbnails/WebP variants of product images (store.renditions)
+PRODUCT_IMAGE_RENDITIONS = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+}
+# size of the process pool doing the image work, 0 renders inline (tests)
+PRODUCT_IMAGE_RENDITION_WORKERS = 2
+
+# background tasks (core.tasks), run them with: python manage.py run_tasks
+TASK_QUEUE = {
+    'BATCH_SIZE': 10,
+    'LEASE_SECONDS': 300,  # a task running longer than this is handed to another worker
+    'RETRY_BASE_DELAY': 5,  # seconds, doubled after every failed attempt
+    'RETRY_MAX_DELAY': 3600,
+    'MAX_ATTEMPTS': 5,
+}
+
+# carts without item changes for this long are deleted by: python manage.py sweep_carts
+CART_EXPIRY_DAYS = 30
+
+# per request budgets, requests over them are logged (core.instrumentation)
+# views can set their own query budgets per action with a query_budgets attribute
+REQUEST_BUDGETS = {
+    'QUERIES': 20,
+    'DB_MS': 200,
+    'TOTAL_MS': 500,
+}
+# send the numbers back as Server-Timing and X-Query-Count response headers
+REQUEST_TIMING_HEADERS = os.environ.get('REQUEST_TIMING_HEADERS', '') == '1'
+
+# sampling profiles of single requests (core.profiling), tokens come from: python manage.py profile_token <username>
+REQUEST_PROFILING = {
+    'DIRECTORY': BASE_DIR / 'profiles',
+    'PATH_PREFIXES': ['/store/'],
+    'INTERVAL_MS': 5,  # between stack samples
+    'MAX_PER_MINUTE': 6,  # profiled requests, the others are served as usual
+    'TOKEN_MAX_AGE': 3600,
+}
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from django.db import models
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
@@ -14,9 +15,47 @@ class TaggedItemManager(models.Manager):
                 object_id=obj_id
             )
 
+    def get_tags_for_many(self, obj_type, obj_ids):
+        '''
+        Tags of many objects in one query, as `{object_id: [Tag, ...]}`.
+        Objects without tags are left out.
+        '''
+        content_type = ContentType.objects.get_for_model(obj_type)
+        tagged_items = TaggedItem.objects \
+            .select_related('tag') \
+            .filter(content_type=content_type, object_id__in=list(obj_ids)) \
+            .order_by('tag__label')
+
+        tags = defaultdict(list)
+        for item in tagged_items:
+            tags[item.object_id].append(item.tag)
+        return tags
+
+    def attach_tags(self, objects, to_attr='tags'):
+        '''
+        Sets `to_attr` on every object to its list of tags, like a
+        prefetch_related for tags. `objects` can be a queryset or any list of
+        instances of one model. Returns the objects as a list.
+        '''
+        objects = list(objects)
+        if objects:
+            tags = self.get_tags_for_many(type(objects[0]), [obj.pk for obj in objects])
+            for obj in objects:
+                setattr(obj, to_attr, tags.get(obj.pk, []))
+        return objects
+
+    def object_ids_tagged(self, obj_type, label):
+        # meant as a subquery: queryset.filter(id__in=TaggedItem.objects.object_ids_tagged(...))
+        return TaggedItem.objects \
+            .filter(
+                content_type=ContentType.objects.get_for_model(obj_type),
+                tag__label=label,
+            ) \
+            .values('object_id')
+
 
 class Tag(models.Model):
-    label = models.CharField(max_length=255)
+    label = models.CharField(max_length=255, db_index=True)
 
     def __str__(self) -> str:
         return self.label
@@ -28,3 +67,10 @@ class TaggedItem(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+
+    class Meta:
+        indexes = [
+            # tags of given objects, and objects with a given tag
+            models.Index(fields=['content_type', 'object_id']),
+            models.Index(fields=['tag', 'content_type']),
+        ]